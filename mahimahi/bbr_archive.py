@@ -0,0 +1,384 @@
+#!/usr/bin/python
+"""Compressed archives of the raw artifacts of bbr experiment trials.
+
+Every trial overwrites the Mahimahi link logs of the previous one, so the raw
+data of a sweep is normally lost once its result rows are written. When
+bbr_experiment.py is given --archive_dir (or bbr_sweep.py --archive_root), the
+uplink and downlink logs, the receive time series of the server and the
+configuration and result of each trial are kept in one compressed archive file
+per trial.
+
+An archive is a single lzma (or gzip, when lzma is unavailable) compressed
+stream made of:
+    a magic line, "BBRTRIAL <version>"
+    a JSON header line with the trial metadata and the columns of each table
+    chunks of up to CHUNK_ROWS rows of one table, each a JSON line giving the
+    table, the number of rows and the size of every column, followed by the
+    raw bytes of each column.
+Columns are stored as fixed width integer arrays, 64 bits wide for times and
+byte counts, which exceed 2^31 in long trials. Timestamps and counters are
+delta encoded within a chunk, which makes them compress to almost nothing.
+Archives are read back chunk by chunk, so they can be streamed without
+loading a whole trial into memory.
+"""
+
+import argparse
+from array import array
+from bbr_logging import debug_print, debug_print_error, debug_print_verbose, stdout_print
+import gzip
+import itertools
+import json
+import os
+import sys
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+
+ARCHIVE_VERSION = 2
+ARCHIVE_MAGIC = "BBRTRIAL"
+
+# Suffix of archive files, depending on the compression available.
+ARCHIVE_SUFFIXES = [".trial.xz", ".trial.gz"]
+
+# lzma compression level. Higher levels are ten times slower for a few
+# percent smaller archives of uplink logs.
+LZMA_PRESET = 3
+
+# Maximum number of rows in a chunk of a table.
+CHUNK_ROWS = 65536
+
+# Columns of the archived tables as (name, array typecode, delta encoded).
+# "q" stands for 64 bit integers, whatever typecode holds them locally. Both
+# link logs have the same columns.
+UPLINK_LOG_TABLE = "uplink_log"
+DOWNLINK_LOG_TABLE = "downlink_log"
+UPLINK_LOG_COLUMNS = [
+    ("ms", "q", True),
+    ("event", "b", False),
+    ("bytes", "q", False),
+    ("delay_ms", "q", False),
+    ("packets", "q", False),
+]
+SERVER_TABLE = "server"
+SERVER_COLUMNS = [
+    ("elapsed_ms", "q", True),
+    ("received_bytes", "q", True),
+]
+
+# Codes of the event types of the Mahimahi link logs (see bbr_timeseries.py).
+UPLINK_EVENTS = ['#', '+', '-', 'd']
+UPLINK_EVENT_CODES = dict((event, code) for code, event in enumerate(UPLINK_EVENTS))
+
+
+def archive_suffix():
+    """Return the suffix of newly written archives."""
+    return ARCHIVE_SUFFIXES[0] if lzma is not None else ARCHIVE_SUFFIXES[1]
+
+
+def is_archive(filename):
+    """Return whether filename names a trial archive."""
+    return any(filename.endswith(suffix) for suffix in ARCHIVE_SUFFIXES)
+
+
+def _open_compressed(filename, mode):
+    if filename.endswith(".xz"):
+        if lzma is None:
+            debug_print_error("lzma is not available to read " + filename)
+            sys.exit(-1)
+        if "w" in mode:
+            return lzma.open(filename, mode, preset=LZMA_PRESET)
+        return lzma.open(filename, mode)
+    return gzip.open(filename, mode)
+
+
+def _int64_typecode():
+    # Arrays of Python 2 have no "q" typecode, but "l" is 64 bits wide on 64 bit Linux.
+    for typecode in ["q", "l"]:
+        try:
+            if array(typecode).itemsize == 8:
+                return typecode
+        except ValueError:
+            pass
+    debug_print_error("No 64 bit integer arrays are available to archive trials.")
+    sys.exit(-1)
+
+
+def _new_array(typecode):
+    return array(_int64_typecode() if typecode == "q" else typecode)
+
+
+def _array_to_bytes(values):
+    return values.tobytes() if hasattr(values, "tobytes") else values.tostring()
+
+
+def _array_from_bytes(typecode, data):
+    values = _new_array(typecode)
+    if hasattr(values, "frombytes"):
+        values.frombytes(data)
+    else:
+        values.fromstring(data)
+    return values
+
+
+def _delta_encode(values):
+    encoded = array(values.typecode, values)
+    for i in range(len(encoded) - 1, 0, -1):
+        encoded[i] -= encoded[i - 1]
+    return encoded
+
+
+def _delta_decode(values):
+    for i in range(1, len(values)):
+        values[i] += values[i - 1]
+    return values
+
+
+class ArchiveWriter(object):
+    """Write the tables of a trial archive, chunk by chunk."""
+
+    def __init__(self, filename, metadata, tables):
+        """Create the archive file.
+
+        metadata: JSON serializable dictionary describing the trial.
+        tables: dictionary of table name -> list of (column, typecode, delta encoded).
+        """
+        self.output = _open_compressed(filename, "wb")
+        self.tables = tables
+        self.pending = dict((name, [_new_array(typecode) for _, typecode, _ in columns])
+                            for name, columns in tables.items())
+        header = {
+            "metadata": metadata,
+            "byteorder": sys.byteorder,
+            "tables": dict((name, [list(column) for column in columns]) for name, columns in tables.items()),
+        }
+        self.output.write(("%s %d\n" % (ARCHIVE_MAGIC, ARCHIVE_VERSION)).encode("utf-8"))
+        self.output.write((json.dumps(header) + "\n").encode("utf-8"))
+
+    def extend(self, table, rows):
+        """Append rows, sequences with one integer per column, to the given table."""
+        rows = list(rows)
+        for start in range(0, len(rows), CHUNK_ROWS):
+            columns = self.pending[table]
+            for values, column in zip(columns, zip(*rows[start:start + CHUNK_ROWS])):
+                values.extend(column)
+            if len(columns[0]) >= CHUNK_ROWS:
+                self._flush(table)
+
+    def _flush(self, table):
+        columns = self.pending[table]
+        if not len(columns[0]):
+            return
+        data = []
+        for (_, _, delta), values in zip(self.tables[table], columns):
+            data.append(_array_to_bytes(_delta_encode(values) if delta else values))
+        chunk = {"table": table, "rows": len(columns[0]), "sizes": [len(column) for column in data]}
+        self.output.write((json.dumps(chunk) + "\n").encode("utf-8"))
+        for column in data:
+            self.output.write(column)
+        self.pending[table] = [array(values.typecode) for values in columns]
+
+    def close(self):
+        """Write any pending rows and close the archive."""
+        for table in sorted(self.pending):
+            self._flush(table)
+        self.output.close()
+
+
+class TrialArchive(object):
+    """Read access to a trial archive."""
+
+    def __init__(self, filename):
+        """Open the archive and read its header."""
+        self.filename = filename
+        with _open_compressed(filename, "rb") as archive:
+            self._read_header(archive)
+
+    def _read_header(self, archive):
+        magic = archive.readline().decode("utf-8").split()
+        if len(magic) != 2 or magic[0] != ARCHIVE_MAGIC or int(magic[1]) > ARCHIVE_VERSION:
+            raise ValueError("Not a supported trial archive: " + self.filename)
+        header = json.loads(archive.readline().decode("utf-8"))
+        self.metadata = header["metadata"]
+        self.byteorder = header["byteorder"]
+        self.tables = dict((name, [tuple(column) for column in columns])
+                           for name, columns in header["tables"].items())
+
+    def iter_chunks(self, table=None):
+        """Yield (table, list of column arrays) for each chunk, optionally only of the given table."""
+        with _open_compressed(self.filename, "rb") as archive:
+            self._read_header(archive)
+            while True:
+                line = archive.readline()
+                if not line:
+                    break
+                chunk = json.loads(line.decode("utf-8"))
+                columns = []
+                for (_, typecode, delta), size in zip(self.tables[chunk["table"]], chunk["sizes"]):
+                    data = archive.read(size)
+                    if table is not None and chunk["table"] != table:
+                        continue
+                    values = _array_from_bytes(typecode, data)
+                    if self.byteorder != sys.byteorder:
+                        values.byteswap()
+                    columns.append(_delta_decode(values) if delta else values)
+                if table is None or chunk["table"] == table:
+                    yield chunk["table"], columns
+
+    def iter_rows(self, table):
+        """Yield the rows of a table as tuples, streaming them from the archive."""
+        for _, columns in self.iter_chunks(table):
+            for row in zip(*columns):
+                yield row
+
+    def column_names(self, table):
+        """Return the names of the columns of a table."""
+        return [column[0] for column in self.tables[table]]
+
+
+def iter_archives(sweep_dir):
+    """Yield a TrialArchive for every archive in a sweep directory, in file name order."""
+    for filename in sorted(os.listdir(sweep_dir)):
+        if is_archive(filename):
+            yield TrialArchive(os.path.join(sweep_dir, filename))
+
+
+def _read_link_log_header(log):
+    """Read the leading '#' header lines of a link log, returning them and the first event line."""
+    header = []
+    for line in log:
+        if not line.startswith("#"):
+            return header, line
+        header.append(line.rstrip("\n"))
+    return header, None
+
+
+def _link_log_row(line):
+    fields = line.split()
+    if len(fields) < 3 or fields[1] not in UPLINK_EVENT_CODES:
+        return None
+    event = fields[1]
+    if event == '-':
+        return (int(fields[0]), UPLINK_EVENT_CODES[event], int(fields[2]), int(fields[3]), 0)
+    if event == 'd':
+        return (int(fields[0]), UPLINK_EVENT_CODES[event], int(fields[3]), 0, int(fields[2]))
+    return (int(fields[0]), UPLINK_EVENT_CODES[event], int(fields[2]), 0, 0)
+
+
+def _archive_link_log(writer, table, first_line, log):
+    """Archive the event lines of a link log, from first_line on, into a table."""
+    rows = []
+    for line in itertools.chain([first_line], log):
+        row = _link_log_row(line)
+        if row is not None:
+            rows.append(row)
+        if len(rows) == CHUNK_ROWS:
+            writer.extend(table, rows)
+            rows = []
+    writer.extend(table, rows)
+
+
+def archive_trial(filename, metadata, uplink_log_file=None, server_timeseries=None, downlink_log_file=None):
+    """Archive the raw artifacts of a trial.
+
+    metadata: JSON serializable dictionary, e.g. the configuration and result of the trial.
+    uplink_log_file: Optional Mahimahi uplink log to archive. Its header lines are kept in the metadata.
+    server_timeseries: Optional list of (elapsed ms, received bytes) samples of the server.
+    downlink_log_file: Optional Mahimahi downlink log to archive, like the uplink log.
+    """
+    logs = []
+    try:
+        for table, log_file in [(UPLINK_LOG_TABLE, uplink_log_file), (DOWNLINK_LOG_TABLE, downlink_log_file)]:
+            if log_file:
+                logs.append((table, open(log_file, "r")))
+        metadata = dict(metadata)
+        first_lines = {}
+        for table, log in logs:
+            metadata[table + "_header"], first_lines[table] = _read_link_log_header(log)
+        writer = ArchiveWriter(filename, metadata, {UPLINK_LOG_TABLE: UPLINK_LOG_COLUMNS,
+                                                    DOWNLINK_LOG_TABLE: UPLINK_LOG_COLUMNS,
+                                                    SERVER_TABLE: SERVER_COLUMNS})
+        try:
+            writer.extend(SERVER_TABLE, server_timeseries or [])
+            for table, log in logs:
+                if first_lines[table] is not None:
+                    _archive_link_log(writer, table, first_lines[table], log)
+        finally:
+            writer.close()
+    finally:
+        for _, log in logs:
+            log.close()
+
+
+def write_link_log(trial_archive, output_file, table=UPLINK_LOG_TABLE):
+    """Restore a Mahimahi link log of a trial archive, e.g. for mm-throughput-graph.
+
+    table: UPLINK_LOG_TABLE or DOWNLINK_LOG_TABLE. Archives written before
+    downlink logs were archived have no DOWNLINK_LOG_TABLE.
+    """
+    if table not in trial_archive.tables:
+        raise ValueError("%s has no %s" % (trial_archive.filename, table))
+    with open(output_file, "w") as output:
+        for line in trial_archive.metadata.get(table + "_header", []):
+            output.write(line + "\n")
+        for ms, event, num_bytes, delay_ms, packets in trial_archive.iter_rows(table):
+            event = UPLINK_EVENTS[event]
+            if event == '-':
+                output.write("%d - %d %d\n" % (ms, num_bytes, delay_ms))
+            elif event == 'd':
+                output.write("%d d %d %d\n" % (ms, packets, num_bytes))
+            else:
+                output.write("%d %s %d\n" % (ms, event, num_bytes))
+
+
+def _describe_archive(trial_archive):
+    config = trial_archive.metadata.get("config", {})
+    result = trial_archive.metadata.get("result", {})
+    return "%s: cc=%s loss=%s rtt=%s bw=%s goodput_Mbps=%s" % (
+        os.path.basename(trial_archive.filename), config.get("congestion_control"), result.get("loss_rate"),
+        config.get("rtt"), config.get("bottleneck_bandwidth"), result.get("goodput_Mbps"))
+
+
+def _parse_args():
+    """Parse archive commands from the commandline."""
+    parser = argparse.ArgumentParser(description="List or extract archived bbr experiment trials.")
+    parser.add_argument('--list', dest='list', type=str,
+                        help="List the trials archived in this sweep directory.",
+                        default=None)
+    parser.add_argument('--extract', dest='extract', type=str,
+                        help="Restore the Mahimahi uplink log of this trial archive.",
+                        default=None)
+    parser.add_argument('--downlink', dest='downlink', action='store_true',
+                        help="Restore the downlink log instead of the uplink log.",
+                        default=False)
+    parser.add_argument('--output', dest='output', type=str,
+                        help="File to restore the link log to.",
+                        default="/tmp/mahimahi_log")
+    args = parser.parse_args()
+    debug_print_verbose("Parse: " + str(vars(args)))
+    return args
+
+
+def main():
+    """List or extract archived trials."""
+    args = _parse_args()
+    if args.list:
+        for trial_archive in iter_archives(args.list):
+            stdout_print(_describe_archive(trial_archive) + "\n")
+    elif args.extract:
+        table = DOWNLINK_LOG_TABLE if args.downlink else UPLINK_LOG_TABLE
+        try:
+            write_link_log(TrialArchive(args.extract), args.output, table)
+        except ValueError as e:
+            debug_print_error(str(e))
+            sys.exit(-1)
+        debug_print("Restored %s to %s" % (table, args.output))
+    else:
+        debug_print_error("Nothing to do. Specify --list or --extract.")
+        sys.exit(-1)
+
+
+if __name__ == '__main__':
+    main()
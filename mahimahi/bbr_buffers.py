@@ -0,0 +1,91 @@
+#!/usr/bin/python
+"""Socket buffer sizing of the client and server from the bandwidth delay product.
+
+The client send buffer and the server receive buffer bound the congestion
+window. When they are smaller than the window the congestion control would
+reach, a trial measures the socket buffer instead of the congestion control.
+Both are sized to a multiple of the bandwidth delay product (BDP) of the
+trial, and checked against the kernel limits before the trial starts.
+
+Linux caps SO_SNDBUF and SO_RCVBUF at net.core.wmem_max and rmem_max, and
+doubles the requested size to account for bookkeeping overhead; the sizes
+recorded with each result are the ones getsockopt reports on the sockets of
+the client and server themselves, once connected. The client runs inside the
+Mahimahi shells and writes its size to a report file, the server sends its
+size to the driver with its time series. The
+net.ipv4.tcp_wmem and tcp_rmem maxima cap the buffers of sockets that leave
+their size to autotuning. initialize_congestion_control.sh raises all of them
+to 6553600 bytes, which high BDP trials may still exceed.
+"""
+
+from bbr_logging import debug_print_verbose
+import socket
+
+# Buffer size of sockets whose size is not given, the limit set by initialize_congestion_control.sh.
+DEFAULT_SOCKET_BUFFER_BYTES = 6553600
+
+# Smallest buffer size used, so that low BDP trials can still send a few full sized packets at once.
+MIN_SOCKET_BUFFER_BYTES = 16384
+
+# Kernel limits on socket buffer sizes. tcp_rmem and tcp_wmem hold "min default max".
+BUFFER_LIMIT_FILES = {
+    "rmem_max": "/proc/sys/net/core/rmem_max",
+    "wmem_max": "/proc/sys/net/core/wmem_max",
+    "tcp_rmem": "/proc/sys/net/ipv4/tcp_rmem",
+    "tcp_wmem": "/proc/sys/net/ipv4/tcp_wmem",
+}
+
+
+def socket_buffer_bytes(bdp, bdp_multiple):
+    """Return the socket buffer size for a BDP in bytes and a multiple of it."""
+    return max(int(bdp * bdp_multiple), MIN_SOCKET_BUFFER_BYTES)
+
+
+def read_buffer_limits():
+    """Return the kernel socket buffer limits, the largest size of every limit in BUFFER_LIMIT_FILES.
+
+    Limits that cannot be read, e.g. outside of Linux, are missing.
+    """
+    limits = {}
+    for name, path in BUFFER_LIMIT_FILES.items():
+        try:
+            with open(path, 'r') as limit_file:
+                limits[name] = int(limit_file.read().split()[-1])
+        except (IOError, OSError, ValueError, IndexError):
+            debug_print_verbose("Could not read " + path)
+    return limits
+
+
+def check_buffer_limits(buffer_bytes, limits):
+    """Return a list of warnings about the kernel limits that are below buffer_bytes."""
+    warnings = []
+    for name, use in [("wmem_max", "client SO_SNDBUF"), ("rmem_max", "server SO_RCVBUF"),
+                      ("tcp_wmem", "autotuned send buffers (e.g. of rpc responses)"),
+                      ("tcp_rmem", "autotuned receive buffers (e.g. of rpc responses)")]:
+        if name in limits and limits[name] < buffer_bytes:
+            sysctl = ("net.core." if name.endswith("_max") else "net.ipv4.") + name
+            warnings.append("%s (max %d) caps the %s below the %d bytes requested, raise it with sysctl." %
+                            (sysctl, limits[name], use, buffer_bytes))
+    return warnings
+
+
+def granted_buffer_bytes(s, option):
+    """Return the SO_SNDBUF or SO_RCVBUF size the kernel granted the socket s."""
+    return s.getsockopt(socket.SOL_SOCKET, option)
+
+
+def report_granted_buffer(report_file, s, option):
+    """Write the buffer size granted to socket s to report_file, if set, for the driver to read back."""
+    if not report_file:
+        return
+    with open(report_file, 'w') as report:
+        report.write("%d\n" % granted_buffer_bytes(s, option))
+
+
+def read_granted_buffer(report_file):
+    """Return the buffer size written to report_file by report_granted_buffer, or None if none was."""
+    try:
+        with open(report_file, 'r') as report:
+            return int(report.read())
+    except (IOError, OSError, ValueError):
+        return None
@@ -0,0 +1,275 @@
+#!/usr/bin/python
+"""Detect goodput and delay regressions between two sets of experiment results.
+
+The baseline and candidate result CSVs (e.g. the committed data/figure8.csv
+and the one of a new kernel) are aligned on their configuration columns. For
+every configuration point, repeated trials are averaged and the candidate is
+compared to the baseline. A point regresses when it is worse than the baseline
+by more than its tolerance, the largest of:
+    --threshold (relative to the baseline),
+    --min_delta (absolute, in the unit of the metric),
+    --sigmas standard errors of the difference, estimated from the variance of
+    repeated trials of the point, or from the relative variance pooled over
+    all repeated points when the point itself was not repeated.
+A curve (all loss rates of one configuration) regresses when the sum of the
+changes of its points is worse than the sum of their tolerances. Its change is
+reported relative to the sum of its baseline values, so that points with
+little goodput, e.g. at high loss rates, do not dominate it.
+
+The comparison is printed as a report, an overlay figure of baseline versus
+candidate is saved, and the script exits with a non zero status if any point
+or curve regressed, so that it can gate kernel rollouts.
+"""
+
+import argparse
+from bbr_logging import debug_print, debug_print_error, debug_print_verbose, stdout_print
+from bbr_results import MISSING_COLUMN_DEFAULTS, read_results, trial_succeeded
+import math
+import os
+import sys
+
+
+EXIT_SUCCESS = 0
+
+# Result columns identifying a configuration point. A curve is made of the
+# points that only differ in the last column.
+CONFIG_COLUMNS = ["congestion_control", "rtt_ms", "specified_bw_Mbps", "queue", "queue_size",
+                  "downlink_loss_rate", "reverse_traffic", "workload", "loss_rate"]
+
+# Compared metrics, and whether higher values are better. The latency
+# percentiles are the flow completion times of the flows workload and the
+# request latencies of the rpc workload.
+METRIC_HIGHER_IS_BETTER = {
+    "goodput_Mbps": True,
+    "queue_delay_p95_ms": False,
+    "signal_delay_p95_ms": False,
+    "latency_p50_ms": False,
+    "latency_p95_ms": False,
+    "latency_p99_ms": False,
+}
+
+
+class Flags(object):
+    """Dictionary object to store parsed flags."""
+
+    BASELINE = "baseline"
+    CANDIDATE = "candidate"
+    METRICS = "metrics"
+    THRESHOLD = "threshold"
+    MIN_DELTA = "min_delta"
+    SIGMAS = "sigmas"
+    PLOT = "plot"
+    parsed_args = None
+
+
+def _parse_args():
+    """Parse comparison parameters from the commandline."""
+    parser = argparse.ArgumentParser(description="Compare candidate experiment results against a baseline.")
+    parser.add_argument('--baseline', dest=Flags.BASELINE, type=str, required=True,
+                        help="Result CSV of the baseline, e.g. data/figure8.csv.")
+    parser.add_argument('--candidate', dest=Flags.CANDIDATE, type=str, required=True,
+                        help="Result CSV to compare against the baseline.")
+    parser.add_argument('--metrics', dest=Flags.METRICS, nargs='+', choices=sorted(METRIC_HIGHER_IS_BETTER),
+                        help="Metrics to compare. Metrics missing from either file are skipped.",
+                        default=["goodput_Mbps", "queue_delay_p95_ms"])
+    parser.add_argument('--threshold', dest=Flags.THRESHOLD, type=float,
+                        help="Relative change (in percent) beyond which a point or curve regresses.",
+                        default=10.0)
+    parser.add_argument('--min_delta', dest=Flags.MIN_DELTA, type=float,
+                        help="Absolute change (in Mbps or ms) below which a point never regresses.",
+                        default=0.5)
+    parser.add_argument('--sigmas', dest=Flags.SIGMAS, type=float,
+                        help="Standard errors of the difference tolerated, estimated from repeated trials.",
+                        default=3.0)
+    parser.add_argument('--plot', dest=Flags.PLOT, type=str,
+                        help="File to save the overlay figure to. No figure is made if empty.",
+                        default="figures/comparison.png")
+
+    Flags.parsed_args = vars(parser.parse_args())
+    debug_print_verbose("Parse: " + str(Flags.parsed_args))
+
+
+def config_key(row, columns=CONFIG_COLUMNS):
+    """Return the configuration key of a result row."""
+    return tuple(round(row[column], 6) if isinstance(row[column], float) else row[column]
+                 for column in columns)
+
+
+def describe_key(key, columns=CONFIG_COLUMNS):
+    """Return a short human readable description of a configuration key."""
+    parts = []
+    for column, value in zip(columns, key):
+        # Columns at their default, e.g. no reverse traffic, are left out.
+        if value == '' or value == MISSING_COLUMN_DEFAULTS.get(column):
+            continue
+        if column == "congestion_control":
+            parts.append(value)
+        elif column == "loss_rate":
+            parts.append("loss=%g%%" % (value * 100))
+        else:
+            parts.append("%s=%s" % (column, '%g' % value if isinstance(value, float) else value))
+    return ' '.join(parts)
+
+
+def group_metric(rows, metric):
+    """Return a dictionary of configuration key -> list of the metric values of its trials."""
+    groups = {}
+    for row in rows:
+        if not trial_succeeded(row) or row.get(metric, '') == '':
+            continue
+        groups.setdefault(config_key(row), []).append(row[metric])
+    return groups
+
+
+def summarize(values):
+    """Return (mean, sample standard deviation or None, count) of a list of values."""
+    count = len(values)
+    mean = sum(values) / float(count)
+    if count < 2:
+        return mean, None, count
+    variance = sum((value - mean) ** 2 for value in values) / (count - 1)
+    return mean, math.sqrt(variance), count
+
+
+def pooled_relative_std(groups):
+    """Return the relative standard deviation pooled over all repeated points, or None."""
+    relative_variances = []
+    for values in groups:
+        mean, std, _ = summarize(values)
+        if std is not None and mean > 0:
+            relative_variances.append((std / mean) ** 2)
+    if not relative_variances:
+        return None
+    return math.sqrt(sum(relative_variances) / len(relative_variances))
+
+
+def compare_metric(baseline_rows, candidate_rows, metric, threshold, min_delta, sigmas):
+    """Compare a metric of the candidate against the baseline.
+
+    Returns (points, unmatched): points is a list of dictionaries, one per
+    configuration present in both result sets, sorted by key; unmatched is the
+    sorted list of keys present in only one of them.
+    """
+    baseline = group_metric(baseline_rows, metric)
+    candidate = group_metric(candidate_rows, metric)
+    pooled_std = pooled_relative_std(list(baseline.values()) + list(candidate.values()))
+    sign = 1 if METRIC_HIGHER_IS_BETTER[metric] else -1
+
+    points = []
+    for key in sorted(set(baseline) & set(candidate)):
+        baseline_mean, baseline_std, baseline_count = summarize(baseline[key])
+        candidate_mean, candidate_std, candidate_count = summarize(candidate[key])
+        variance = 0.0
+        for mean, std, count in [(baseline_mean, baseline_std, baseline_count),
+                                 (candidate_mean, candidate_std, candidate_count)]:
+            if std is None and pooled_std is not None:
+                std = pooled_std * abs(mean)
+            if std is not None:
+                variance += std ** 2 / count
+        tolerance = max(threshold / 100.0 * abs(baseline_mean), min_delta, sigmas * math.sqrt(variance))
+        delta = candidate_mean - baseline_mean
+        relative_delta = delta / baseline_mean if baseline_mean else 0.0
+        points.append({
+            "key": key,
+            "baseline": baseline_mean,
+            "candidate": candidate_mean,
+            "delta": delta,
+            "relative_delta": relative_delta,
+            "tolerance": tolerance,
+            "regressed": sign * delta < -tolerance,
+            "baseline_values": baseline[key],
+            "candidate_values": candidate[key],
+        })
+    unmatched = sorted(set(baseline) ^ set(candidate))
+    return points, unmatched
+
+
+def compare_curves(points, metric):
+    """Summarize compared points per curve.
+
+    Returns a list of dictionaries, one per curve sorted by key, with the
+    summed change and tolerance of its points, the change relative to the
+    summed baseline, and whether the curve regressed.
+    """
+    curves = {}
+    for point in points:
+        curves.setdefault(point["key"][:-1], []).append(point)
+    sign = 1 if METRIC_HIGHER_IS_BETTER[metric] else -1
+    summaries = []
+    for key in sorted(curves):
+        delta = sum(point["delta"] for point in curves[key])
+        baseline = sum(point["baseline"] for point in curves[key])
+        tolerance = sum(point["tolerance"] for point in curves[key])
+        summaries.append({
+            "key": key,
+            "points": len(curves[key]),
+            "regressed_points": len([point for point in curves[key] if point["regressed"]]),
+            "delta": delta,
+            "relative_delta": delta / baseline if baseline else 0.0,
+            "tolerance": tolerance,
+            "regressed": sign * delta < -tolerance,
+        })
+    return summaries
+
+
+def format_report(metric, points, curves, unmatched):
+    """Return the lines of the comparison report of a metric."""
+    lines = ["%s: %d of %d points and %d of %d curves regressed" % (
+        metric, len([p for p in points if p["regressed"]]), len(points),
+        len([c for c in curves if c["regressed"]]), len(curves))]
+    for point in points:
+        lines.append("  %-10s %s: %.3f -> %.3f (%+.3f, %+.1f%%, tolerance %.3f)" % (
+            "REGRESSED" if point["regressed"] else "ok", describe_key(point["key"]), point["baseline"],
+            point["candidate"], point["delta"], point["relative_delta"] * 100, point["tolerance"]))
+    for curve in curves:
+        lines.append("  %-10s curve %s: total change %+.3f (%+.1f%%, tolerance %.3f) over %d points, %d regressed" % (
+            "REGRESSED" if curve["regressed"] else "ok", describe_key(curve["key"], CONFIG_COLUMNS[:-1]),
+            curve["delta"], curve["relative_delta"] * 100, curve["tolerance"], curve["points"],
+            curve["regressed_points"]))
+    for key in unmatched:
+        lines.append("  %-10s %s: only in one of the result files" % ("unmatched", describe_key(key)))
+    return lines
+
+
+def main():
+    """Compare the candidate results against the baseline."""
+    _parse_args()
+
+    baseline_rows = read_results(Flags.parsed_args[Flags.BASELINE])
+    candidate_rows = read_results(Flags.parsed_args[Flags.CANDIDATE])
+    threshold = Flags.parsed_args[Flags.THRESHOLD]
+
+    comparisons = []
+    regressed = False
+    for metric in Flags.parsed_args[Flags.METRICS]:
+        points, unmatched = compare_metric(baseline_rows, candidate_rows, metric, threshold,
+                                           Flags.parsed_args[Flags.MIN_DELTA], Flags.parsed_args[Flags.SIGMAS])
+        if not points:
+            debug_print_verbose("Skipping %s, it is not in both result files." % metric)
+            continue
+        curves = compare_curves(points, metric)
+        stdout_print("\n".join(format_report(metric, points, curves, unmatched)) + "\n")
+        comparisons.append((metric, points))
+        regressed = regressed or any(p["regressed"] for p in points) or any(c["regressed"] for c in curves)
+
+    if not comparisons:
+        debug_print_error("No metric to compare between the result files.")
+        sys.exit(-1)
+
+    plot_file = Flags.parsed_args[Flags.PLOT]
+    if plot_file:
+        # Deferred so that the comparison itself does not depend on matplotlib.
+        from bbr_plot import make_comparison_figure
+        plot_dir = os.path.dirname(plot_file)
+        if plot_dir and not os.path.exists(plot_dir):
+            os.makedirs(plot_dir)
+        make_comparison_figure(comparisons, plot_file)
+
+    if regressed:
+        debug_print_error("Candidate regressed against the baseline.")
+        sys.exit(-1)
+    debug_print("No regression against the baseline.")
+
+
+if __name__ == '__main__':
+    main()
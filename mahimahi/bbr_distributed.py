@@ -0,0 +1,346 @@
+#!/usr/bin/python
+"""Distributed execution of a sweep over a fleet of worker hosts.
+
+bbr_sweep.py --coordinator_port=<port> runs a coordinator that hands out the
+trials of the sweep over TCP instead of running them itself. Every worker host
+runs this script, ./bbr_distributed.py --coordinator=<host>:<port>, which
+repeatedly takes a trial from the coordinator, runs it with its local driver
+and streams the result rows back. The coordinator writes result rows to the
+sweep output file in trial order, so the file is the same as the one of a
+serial sweep.
+
+Workers send a heartbeat while a trial runs. When a worker disconnects, or
+is not heard from for --worker_timeout seconds, its trial is requeued for
+another worker. Workers run trials under the watchdog of bbr_watchdog.py, with
+the --trial_timeout of the sweep or a deadline derived from the --time of the
+trial. A trial whose driver fails or is killed is handed out again up to the
+--trial_attempts of the sweep, no sooner than --retry_backoff seconds after the
+first failure and twice as long after every further one, before it is recorded
+as failed with a row holding its configuration and status in the sweep output
+file.
+
+Messages are JSON objects, one per line:
+    worker -> coordinator: {"type": "request"}, {"type": "heartbeat"},
+                           {"type": "result", "id": ..., "succeeded": ..., "status": ...,
+                            "header": ..., "rows": [...]}
+    coordinator -> worker: {"type": "trial", "id": ..., "trial": [[flag, value], ...],
+                            "driver_args": [...], "archive_dir": ..., "trial_timeout": ...},
+                           {"type": "wait", "secs": ...}, {"type": "done"}
+Several workers can run on a single host as a stand-in for a fleet. Every
+driver generates its link traces in a directory of its own, but the workers
+must be given distinct driver ports, two apart for reverse traffic, and
+uplink and downlink logs, e.g.
+./bbr_distributed.py --coordinator=localhost:7000 --port=5052 --uplink_log=/tmp/mahimahi_log_1 \
+    --downlink_log=/tmp/mahimahi_downlink_log_1
+"""
+
+import argparse
+from bbr_logging import debug_print, debug_print_error, debug_print_verbose
+from bbr_results import format_header_row, format_result_row, STATUS_FAILED, STATUS_OK, STATUS_TIMEOUT
+from bbr_sweep import describe_trial, failure_result, run_trial, trial_args, trial_command, trial_deadline_secs
+from bbr_watchdog import driver_ports, wait_for_port_release
+from collections import deque
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import SocketServer as socketserver
+except ImportError:
+    import socketserver
+
+
+# Seconds between heartbeats of a worker running a trial.
+HEARTBEAT_INTERVAL_SECS = 5
+
+# Seconds a worker waits before asking again when all remaining trials are running elsewhere.
+WAIT_SECS = 5
+
+
+class Flags(object):
+    """Dictionary object to store parsed flags."""
+
+    COORDINATOR = "coordinator"
+    DRIVER = "driver"
+    CONNECT_TIMEOUT = "connect_timeout"
+    parsed_args = None
+    driver_args = None
+
+
+def send_message(sock, message):
+    """Send a message, a JSON serializable dictionary, on a socket."""
+    sock.sendall((json.dumps(message) + "\n").encode("utf-8"))
+
+
+def receive_message(rfile):
+    """Read the next message from a socket file. Returns None once the connection is closed."""
+    line = rfile.readline()
+    if not line:
+        return None
+    return json.loads(line.decode("utf-8"))
+
+
+class TrialQueue(object):
+    """Thread-safe queue of the trials of a distributed sweep, and their results."""
+
+    def __init__(self, trials, progress, output_file, driver_args, archive_dir=None, trial_timeout=0,
+                 trial_attempts=1, retry_backoff=0):
+        """Initialize the queue with all trials pending.
+
+        progress: SweepProgress of the sweep.
+        output_file: File result rows are appended to, in trial order. Optional.
+        trial_timeout: Seconds after which workers kill a trial. If zero, derived from the --time of the driver.
+        trial_attempts: Number of times a failing trial is run before it is recorded as failed.
+        retry_backoff: Seconds before a failed trial is handed out again, doubled on every further retry.
+        """
+        self.condition = threading.Condition()
+        self.trials = trials
+        self.progress = progress
+        self.output_file = output_file
+        self.driver_args = list(driver_args)
+        self.archive_dir = archive_dir
+        self.trial_timeout = trial_timeout
+        self.trial_attempts = trial_attempts
+        self.retry_backoff = retry_backoff
+        self.pending = deque(range(len(trials)))
+        self.attempts = [0] * len(trials)
+        # Time before which each pending trial is not handed out, while backing off from a failure.
+        self.retry_times = [0.0] * len(trials)
+        # Failed trials as (index, status), in the order they ran out of attempts.
+        self.failures = []
+        # Index of each running trial -> progress token.
+        self.running = {}
+        # Outcome of each finished trial as (succeeded, header, rows).
+        self.outcomes = [None] * len(trials)
+        self.next_to_write = 0
+
+    def take(self, worker):
+        """Return the message handing the next pending trial to worker, and the index of the trial."""
+        with self.condition:
+            now = time.time()
+            ready = [index for index in self.pending if self.retry_times[index] <= now]
+            if not ready:
+                if all(self.outcomes):
+                    return {"type": "done"}, None
+                return {"type": "wait", "secs": WAIT_SECS}, None
+            index = ready[0]
+            self.pending.remove(index)
+            self.attempts[index] += 1
+            self.running[index] = self.progress.trial_started(dict(self.trials[index]))
+            debug_print("Sending trial %d/%d to %s: %s" % (index + 1, len(self.trials), worker,
+                                                           describe_trial(self.trials[index])))
+            return {"type": "trial", "id": index, "trial": self.trials[index],
+                    "driver_args": self.driver_args, "archive_dir": self.archive_dir,
+                    "trial_timeout": self.trial_timeout}, index
+
+    def requeue(self, index, worker):
+        """Put back a trial of a lost worker at the front of the queue."""
+        with self.condition:
+            if index not in self.running:
+                return
+            debug_print_error("Lost worker %s, requeueing trial: %s" % (worker, describe_trial(self.trials[index])))
+            self.progress.trial_abandoned(self.running.pop(index))
+            self.attempts[index] -= 1
+            self.pending.appendleft(index)
+
+    def finish(self, index, succeeded, header, rows, worker, status=STATUS_FAILED):
+        """Record the result of a trial, retrying it if it failed and attempts remain.
+
+        status: Status of a failed trial, recorded once it ran out of attempts.
+        """
+        with self.condition:
+            if index not in self.running:
+                return
+            token = self.running.pop(index)
+            if not succeeded and self.attempts[index] < self.trial_attempts:
+                backoff_secs = self.retry_backoff * 2 ** (self.attempts[index] - 1)
+                debug_print_error("Trial attempt %d/%d ended with status %s on %s, retrying in %d seconds: %s" %
+                                  (self.attempts[index], self.trial_attempts, status, worker, backoff_secs,
+                                   describe_trial(self.trials[index])))
+                self.progress.trial_abandoned(token)
+                self.retry_times[index] = time.time() + backoff_secs
+                self.pending.append(index)
+                return
+            if not succeeded:
+                debug_print_error("Trial did not succeed in %d attempts, recording it as %s: %s" %
+                                  (self.trial_attempts, status, describe_trial(self.trials[index])))
+                self.failures.append((index, status))
+                header = format_header_row()
+                rows = [format_result_row(failure_result(self.trials[index], self.driver_args, status))]
+            self.progress.trial_finished(token, succeeded)
+            self.outcomes[index] = (succeeded, header, rows)
+            self._write_finished()
+            self.condition.notify_all()
+
+    def _write_finished(self):
+        # Append the rows of finished trials, in trial order.
+        while self.next_to_write < len(self.trials) and self.outcomes[self.next_to_write]:
+            _, header, rows = self.outcomes[self.next_to_write]
+            self.next_to_write += 1
+            if not self.output_file or not rows:
+                continue
+            write_header = not os.path.exists(self.output_file)
+            with open(self.output_file, 'a') as output:
+                if write_header and header:
+                    output.write(header + "\n")
+                for row in rows:
+                    output.write(row + "\n")
+
+    def failed_trials(self):
+        """Return the trials that ran out of attempts as (trial, status), in trial order."""
+        with self.condition:
+            return [(self.trials[index], status) for index, status in sorted(self.failures)]
+
+    def wait_until_finished(self):
+        """Block until every trial has finished."""
+        with self.condition:
+            while not all(self.outcomes):
+                self.condition.wait(1)
+
+
+def _make_handler(trial_queue, worker_timeout):
+    class WorkerHandler(socketserver.StreamRequestHandler):
+        """Serve the trials of the queue to a single worker connection."""
+
+        timeout = worker_timeout
+
+        def handle(self):
+            worker = "%s:%d" % self.client_address
+            debug_print("Worker connected: " + worker)
+            index = None
+            try:
+                while True:
+                    message = receive_message(self.rfile)
+                    if message is None:
+                        break
+                    if message["type"] == "request":
+                        reply, index = trial_queue.take(worker)
+                        send_message(self.request, reply)
+                    elif message["type"] == "result":
+                        trial_queue.finish(message["id"], message["succeeded"], message.get("header"),
+                                           message.get("rows", []), worker, message.get("status", STATUS_FAILED))
+                        index = None
+            except (socket.error, socket.timeout, ValueError) as e:
+                debug_print_error("Connection to worker %s failed: %s" % (worker, str(e)))
+            if index is not None:
+                trial_queue.requeue(index, worker)
+            debug_print("Worker disconnected: " + worker)
+
+    return WorkerHandler
+
+
+class _CoordinatorServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def run_coordinator(trial_queue, port, address='0.0.0.0', worker_timeout=60):
+    """Serve the trials of trial_queue to workers until all of them finished."""
+    server = _CoordinatorServer((address, port), _make_handler(trial_queue, worker_timeout))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    debug_print("Coordinating %d trials on %s:%d" % (len(trial_queue.trials), address, server.server_address[1]))
+    trial_queue.wait_until_finished()
+    # Keep serving for a little longer, so that workers waiting for a trial are told the sweep is done.
+    time.sleep(WAIT_SECS + 1)
+    server.shutdown()
+    server.server_close()
+
+
+def _parse_args():
+    """Parse worker parameters from the commandline."""
+    parser = argparse.ArgumentParser(
+        description="Run trials of a distributed sweep. Unrecognized arguments are passed to the driver.")
+    parser.add_argument('--coordinator', dest=Flags.COORDINATOR, type=str, required=True,
+                        help="Address of the sweep coordinator, as host:port.")
+    parser.add_argument('--driver', dest=Flags.DRIVER, type=str,
+                        help="Driver script that runs a single trial.",
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "bbr_experiment.py"))
+    parser.add_argument('--connect_timeout', dest=Flags.CONNECT_TIMEOUT, type=int,
+                        help="Seconds to keep trying to connect to the coordinator.",
+                        default=60)
+
+    parsed_args, driver_args = parser.parse_known_args()
+    Flags.parsed_args = vars(parsed_args)
+    Flags.driver_args = driver_args
+    debug_print_verbose("Parse: " + str(Flags.parsed_args) + " Driver args: " + str(driver_args))
+
+
+def _connect(host, port, connect_timeout):
+    deadline = time.time() + connect_timeout
+    while True:
+        try:
+            return socket.create_connection((host, port))
+        except socket.error as e:
+            if time.time() > deadline:
+                debug_print_error("Could not connect to coordinator %s:%d: %s" % (host, port, str(e)))
+                sys.exit(-1)
+            debug_print_verbose("Waiting for coordinator %s:%d" % (host, port))
+            time.sleep(2)
+
+
+def _run_trial(sock, driver, message):
+    """Run the trial of a coordinator message, sending heartbeats, and return its result message."""
+    handle, output_file = tempfile.mkstemp(prefix="bbr_worker_", suffix=".csv")
+    os.close(handle)
+    os.remove(output_file)
+    driver_args = message["driver_args"] + Flags.driver_args
+    command = trial_command(driver, message["trial"], output_file, driver_args,
+                            archive_dir=message.get("archive_dir"))
+    debug_print("Running trial: " + describe_trial(message["trial"]))
+    timeout_secs = trial_deadline_secs(driver_args, message.get("trial_timeout", 0))
+    heartbeats = {"last": time.time()}
+
+    def send_heartbeat():
+        if time.time() - heartbeats["last"] >= HEARTBEAT_INTERVAL_SECS:
+            send_message(sock, {"type": "heartbeat"})
+            heartbeats["last"] = time.time()
+
+    status = run_trial(command, timeout_secs, send_heartbeat)
+    if status == STATUS_TIMEOUT:
+        wait_for_port_release(driver_ports(trial_args(message["trial"], driver_args)))
+
+    header = None
+    rows = []
+    if os.path.exists(output_file):
+        with open(output_file, 'r') as output:
+            lines = [line.rstrip("\n") for line in output if line.strip()]
+        os.remove(output_file)
+        if lines:
+            header, rows = lines[0], lines[1:]
+    return {"type": "result", "id": message["id"], "succeeded": status == STATUS_OK, "status": status,
+            "header": header, "rows": rows}
+
+
+def main():
+    """Run trials from the coordinator until the sweep is done."""
+    _parse_args()
+    host, port = Flags.parsed_args[Flags.COORDINATOR].rsplit(':', 1)
+    driver = Flags.parsed_args[Flags.DRIVER]
+
+    sock = _connect(host, int(port), Flags.parsed_args[Flags.CONNECT_TIMEOUT])
+    rfile = sock.makefile('rb')
+    debug_print("Connected to coordinator " + Flags.parsed_args[Flags.COORDINATOR])
+    while True:
+        send_message(sock, {"type": "request"})
+        message = receive_message(rfile)
+        if message is None:
+            debug_print_error("Coordinator closed the connection.")
+            sys.exit(-1)
+        if message["type"] == "done":
+            break
+        if message["type"] == "wait":
+            time.sleep(message["secs"])
+            continue
+        send_message(sock, _run_trial(sock, driver, message))
+    sock.close()
+    debug_print("Sweep complete, worker exiting.")
+
+
+if __name__ == '__main__':
+    main()
@@ -7,23 +7,55 @@ This code accepts experimental parameters as commandline arguments:
     - Loss Rates to try as [min, max, interval]
     - Link Bandwidth
     - Length of the trace
+    - Bottleneck queue discipline and size
+    - Downlink loss, and reverse traffic over the downlink
 where the default values are the values used in the BBR paper. Then, we
 run the experiments using hte specified parameters, log the results, and
 create the corresponding figures.
 """
 
 import argparse
-from bbr_logging import debug_print, debug_print_verbose, debug_print_error, stdout_print
-from multiprocessing import Process, Queue, Event
+from bbr_archive import archive_suffix, archive_trial
+from bbr_buffers import check_buffer_limits, read_buffer_limits, read_granted_buffer, socket_buffer_bytes
+from bbr_logging import debug_print, debug_print_verbose, debug_print_error, debug_print_warn, stdout_print
+from bbr_resources import parse_cpu_list, ProcessTreeMonitor, set_cpu_affinity
+from bbr_results import append_result, format_result_row, STATUS_OK
+from bbr_warm_pool import DOWNLINK_LOG, prepare_shell_directory, record_shell_exit, record_shell_pid, start_trial, \
+    SHELL_TIMEOUT_SECS, trim_link_log, UPLINK_LOG, wait_for_client_window, wait_for_shell_pid
+from bbr_workload import FLOW_SIZE_DISTRIBUTIONS, summarize_measurements, WORKLOADS
+from multiprocessing import cpu_count, Process, Queue, Event
 import os
-from server import Server
+import re
+from server import ReverseSender, Server
+import shutil
+import signal
 import subprocess
 import sys
+import tempfile
 import time
 
 
 EXIT_SUCCESS = 0
 
+# Queue disciplines supported by mm-link.
+QUEUE_TYPES = ['infinite', 'droptail', 'drophead', 'codel', 'pie']
+
+# Default AQM parameters (in ms) used when no --queue_args are given. CoDel
+# values follow RFC 8289 and PIE values follow RFC 8033.
+DEFAULT_AQM_ARGS = {
+    'codel': 'target=5,interval=100',
+    'pie': 'qdelay_ref=15,max_burst=150',
+}
+
+# Traffic sent from the server side to the client, over the downlink that carries the ACKs of the client.
+REVERSE_TRAFFIC_TYPES = ['none', 'bulk']
+
+# Queue size used for dropping queues when no --queue_size is specified.
+DEFAULT_QUEUE_SIZE = "1bdp"
+
+# Size of a full sized packet in the emulated link, in bytes.
+MTU_BYTES = 1500
+
 
 class Flags(object):
     """Dictionary object to store parsed flags."""
@@ -39,6 +71,28 @@ class Flags(object):
     TDOWN = "trace_downlink"
     HEADLESS = "headless"
     OUTPUT_FILE = "output_file"
+    QUEUE = "queue"
+    QUEUE_SIZE = "queue_size"
+    QUEUE_ARGS = "queue_args"
+    LIVE_STATS_FILE = "live_stats_file"
+    UPLINK_LOG = "uplink_log"
+    ARCHIVE_DIR = "archive_dir"
+    SERVER_CPUS = "server_cpus"
+    CLIENT_CPUS = "client_cpus"
+    EMULATOR_CPUS = "emulator_cpus"
+    WORKLOAD = "workload"
+    FLOW_SIZE = "flow_size"
+    FLOW_SIZE_DIST = "flow_size_dist"
+    REQUEST_RATE = "request_rate"
+    REQUEST_SIZE = "request_size"
+    RESPONSE_SIZE = "response_size"
+    SPAWN_SHELL = "spawn_shell"
+    WARM_SHELL = "warm_shell"
+    SOCKET_BUFFER_BDP = "socket_buffer_bdp"
+    DOWNLINK_LOSS = "downlink_loss"
+    REVERSE_TRAFFIC = "reverse_traffic"
+    REVERSE_CC = "reverse_cc"
+    DOWNLINK_LOG = "downlink_log"
     parsed_args = None
 
 
@@ -50,13 +104,111 @@ def _check_cc(input):
             "%s is not a supported algorithm" % input)
 
 
-def _clean_up_trace(throughput):
-    for filename in [str(throughput) + str(x) for x in ["Mbps.up", "Mbps.down"]]:
+def _check_cpu_list(input):
+    try:
+        cpus = parse_cpu_list(input)
+    except ValueError:
+        raise argparse.ArgumentTypeError("%s is not a CPU list such as 0-2,4" % input)
+    available = os.sched_getaffinity(0) if hasattr(os, 'sched_getaffinity') else range(cpu_count())
+    unavailable = [cpu for cpu in cpus if cpu not in available]
+    if unavailable:
+        raise argparse.ArgumentTypeError("CPUs %s are not available" % unavailable)
+    return cpus
+
+
+def _emulator_process_role(comm, is_root):
+    """Return the role a process of the Mahimahi shell tree is accounted under."""
+    if is_root:
+        # The driver process that launched the shell, it only waits for it.
+        return None
+    if comm.startswith('python'):
+        return 'client'
+    return 'emulator'
+
+
+def _pooled_shell_process_role(comm, is_root):
+    """Return the role a process of a pooled Mahimahi shell is accounted under."""
+    if comm.startswith('python'):
+        return 'client'
+    return 'emulator'
+
+
+def check_queue_size(input):
+    if _split_queue_size(input) is None:
+        raise argparse.ArgumentTypeError(
+            "%s is not a valid queue size. Use <n>[packets|bytes|bdp]" % input)
+    return input.lower()
+
+
+def _split_queue_size(queue_size):
+    """Split a queue size like "100", "64000bytes" or "0.5bdp" into (amount, unit).
+
+    Sizes without a unit are in packets. Returns None if the size is invalid.
+    """
+    match = re.match(r'^\s*([0-9]*\.?[0-9]+)\s*(packets|bytes|bdp)?\s*$',
+                     queue_size.lower())
+    if not match:
+        return None
+    return (float(match.group(1)), match.group(2) or 'packets')
+
+
+def bdp_bytes(rtt, throughput):
+    """Return the bandwidth delay product in bytes for an RTT (ms) and bandwidth (Mbps)."""
+    return throughput * 1e6 / 8 * rtt / 1000.0
+
+
+def resolve_queue_limit(queue_size, rtt, throughput):
+    """Resolve a queue size into a mm-link queue limit like "packets=100"."""
+    amount, unit = _split_queue_size(queue_size)
+    if unit == 'bdp':
+        unit = 'bytes'
+        amount = amount * bdp_bytes(rtt, throughput)
+    # A queue must be able to hold at least one full sized packet.
+    if unit == 'bytes':
+        return "bytes=%d" % max(int(round(amount)), MTU_BYTES)
+    return "packets=%d" % max(int(round(amount)), 1)
+
+
+def _get_queue_config(parsed_args, rtt, throughput):
+    """Return (queue, queue_size, queue_limit, queue_args) for the parsed flags.
+
+    queue_limit is the resolved packet or byte limit and queue_args is the
+    full argument string passed to mm-link. Both are empty for infinite queues.
+    """
+    queue = parsed_args[Flags.QUEUE]
+    if queue == 'infinite':
+        return (queue, '', '', '')
+
+    queue_size = parsed_args[Flags.QUEUE_SIZE] or DEFAULT_QUEUE_SIZE
+    queue_limit = resolve_queue_limit(queue_size, rtt, throughput)
+    queue_args = queue_limit
+    extra_args = parsed_args[Flags.QUEUE_ARGS] or DEFAULT_AQM_ARGS.get(queue)
+    if extra_args:
+        queue_args += "," + extra_args
+    return (queue, queue_size, queue_limit, queue_args)
+
+
+def _mahimahi_queue_args(rtt, throughput):
+    """Return the mm-link arguments that configure the bottleneck queue in both directions."""
+    queue, _, _, queue_args = _get_queue_config(Flags.parsed_args, rtt, throughput)
+    if queue == 'infinite':
+        return []
+    return ["--uplink-queue=" + queue, "--uplink-queue-args=" + queue_args,
+            "--downlink-queue=" + queue, "--downlink-queue-args=" + queue_args]
+
+
+def _trace_files(throughput, directory=''):
+    """Return the uplink and downlink trace files generated for a throughput."""
+    return [os.path.join(directory, str(throughput) + str(x)) for x in ["Mbps.up", "Mbps.down"]]
+
+
+def _clean_up_trace(throughput, directory=''):
+    for filename in _trace_files(throughput, directory):
         os.remove(filename)
 
 
-def _generate_trace(seconds, throughput):
-    """Generate a <throughput>Mbps trace that lasts for the specified seconds."""
+def _generate_trace(seconds, throughput, directory=''):
+    """Generate a <throughput>Mbps trace that lasts for the specified seconds, in directory."""
     debug_print("Creating " + str(seconds) +
                 " sec trace @: " + str(throughput) + "Mbps")
     bits_per_packet = 12000
@@ -65,7 +217,7 @@ def _generate_trace(seconds, throughput):
     low_err = throughput - (low_avg * 12)
     high_err = throughput - (high_avg * 12)
 
-    for filename in [str(throughput) + str(x) for x in ["Mbps.up", "Mbps.down"]]:
+    for filename in _trace_files(throughput, directory):
         with open(filename, 'w') as outfile:
             accumulated_err = 0
             num_packets = 0
@@ -82,8 +234,39 @@ def _generate_trace(seconds, throughput):
                     outfile.write(str(ms_counter + 1) + '\n')
 
 
+def _remove_files_on_sigterm(filenames):
+    """Remove the given files and directories when the driver is terminated, e.g. by the watchdog of bbr_sweep.py."""
+    driver_pid = os.getpid()
+
+    def handle_sigterm(signum, frame):
+        # Processes forked by the driver inherit the handler, they terminate as they would have without it.
+        if os.getpid() != driver_pid:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            os.kill(os.getpid(), signal.SIGTERM)
+            return
+        debug_print_error("Driver terminated, removing " + ' '.join(filenames))
+        for filename in filenames:
+            if os.path.isdir(filename):
+                shutil.rmtree(filename)
+            elif os.path.exists(filename):
+                os.remove(filename)
+        sys.exit(-1)
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+
 def _parse_args():
     """Parse experimental parameters from the commandline."""
+    Flags.parsed_args = parse_trial_args(sys.argv[1:])
+    debug_print_verbose("Parse: " + str(Flags.parsed_args))
+
+
+def parse_trial_args(args, ignore_unknown=False):
+    """Return the dictionary of flags of a trial run with the commandline arguments args.
+
+    Loss rates are converted from percentages to fractions.
+    ignore_unknown: If set, arguments unknown to the driver are ignored instead of rejected.
+    """
     parser = argparse.ArgumentParser(
         description="Process experimental params.")
     parser.add_argument('--time', dest=Flags.TIME, type=int,
@@ -119,20 +302,127 @@ def _parse_args():
     parser.add_argument('--headless', dest=Flags.HEADLESS, action='store_true',
                         help="Specify whether the Mahimahi Throughput / Queueing delay graphs come up. On Clouds VMs, you'd want to set this to true.",
                         default=False)
+    parser.add_argument('--queue', dest=Flags.QUEUE, choices=QUEUE_TYPES,
+                        help="Bottleneck queue discipline used by mm-link.",
+                        default="infinite")
+    parser.add_argument('--queue_size', dest=Flags.QUEUE_SIZE, type=check_queue_size,
+                        help="Bottleneck queue size as <n>[packets|bytes|bdp], e.g. 100, 64000bytes or 0.5bdp. "
+                        "BDP multiples are computed from --rtt and --bw. Defaults to %s for non infinite queues." % DEFAULT_QUEUE_SIZE,
+                        default=None)
+    parser.add_argument('--queue_args', dest=Flags.QUEUE_ARGS, type=str,
+                        help="Extra AQM arguments for codel or pie queues, e.g. target=5,interval=100.",
+                        default=None)
+    parser.add_argument('--live_stats_file', dest=Flags.LIVE_STATS_FILE, type=str,
+                        help="If non empty, the server periodically writes its live throughput to this file.",
+                        default="")
+    parser.add_argument('--uplink_log', dest=Flags.UPLINK_LOG, type=str,
+                        help="File Mahimahi writes the uplink log of the trial to, e.g. for bbr_plot.py --uplink_logs.",
+                        default="/tmp/mahimahi_log")
+    parser.add_argument('--archive_dir', dest=Flags.ARCHIVE_DIR, type=str,
+                        help="If non empty, archive the uplink log, server time series and config of the trial here.",
+                        default="")
+    parser.add_argument('--server_cpus', dest=Flags.SERVER_CPUS, type=_check_cpu_list,
+                        help="CPUs to pin the server process to, e.g. 0 or 0-1. Not pinned if unset.",
+                        default=[])
+    parser.add_argument('--client_cpus', dest=Flags.CLIENT_CPUS, type=_check_cpu_list,
+                        help="CPUs to pin the client process to. Not pinned if unset.",
+                        default=[])
+    parser.add_argument('--emulator_cpus', dest=Flags.EMULATOR_CPUS, type=_check_cpu_list,
+                        help="CPUs to pin the Mahimahi emulator processes to. Not pinned if unset.",
+                        default=[])
+    parser.add_argument('--workload', dest=Flags.WORKLOAD, choices=WORKLOADS,
+                        help="Traffic of the client: a bulk transfer, fixed-size flows, or requests and responses.",
+                        default='bulk')
+    parser.add_argument('--flow_size', dest=Flags.FLOW_SIZE, type=int,
+                        help="Mean size of the flows of the flows workload, in bytes.",
+                        default=100000)
+    parser.add_argument('--flow_size_dist', dest=Flags.FLOW_SIZE_DIST, choices=FLOW_SIZE_DISTRIBUTIONS,
+                        help="Distribution of the flow sizes of the flows workload.",
+                        default='fixed')
+    parser.add_argument('--request_rate', dest=Flags.REQUEST_RATE, type=float,
+                        help="Requests per second of the rpc workload.",
+                        default=100.0)
+    parser.add_argument('--request_size', dest=Flags.REQUEST_SIZE, type=int,
+                        help="Size of the requests of the rpc workload, in bytes.",
+                        default=100)
+    parser.add_argument('--response_size', dest=Flags.RESPONSE_SIZE, type=int,
+                        help="Size of the responses of the rpc workload, in bytes.",
+                        default=10000)
+    parser.add_argument('--socket_buffer_bdp', dest=Flags.SOCKET_BUFFER_BDP, type=float,
+                        help="Size of the client send and server receive buffers, as a multiple of the BDP "
+                        "computed from --rtt and --bw.",
+                        default=5.0)
+    parser.add_argument('--downlink_loss', dest=Flags.DOWNLINK_LOSS, type=float,
+                        help="Loss rate of the downlink, which carries the ACKs of the client and the reverse "
+                        "traffic (%%).",
+                        default=0.0)
+    parser.add_argument('--reverse_traffic', dest=Flags.REVERSE_TRAFFIC, choices=REVERSE_TRAFFIC_TYPES,
+                        help="Traffic sent to the client over the downlink while the trial runs, on --port + 1.",
+                        default='none')
+    parser.add_argument('--reverse_cc', dest=Flags.REVERSE_CC, type=_check_cc,
+                        help="Congestion control algorithm of the reverse traffic. Defaults to --cc.",
+                        default=None)
+    parser.add_argument('--downlink_log', dest=Flags.DOWNLINK_LOG, type=str,
+                        help="File Mahimahi writes the downlink log of the trial to.",
+                        default="/tmp/mahimahi_downlink_log")
+    parser.add_argument('--spawn_shell', dest=Flags.SPAWN_SHELL, type=str,
+                        help="Internal to bbr_sweep.py --warm_pool. Spawn the Mahimahi shell of the trial in this "
+                        "directory with an idle client agent, and wait for it to exit, instead of running the trial.",
+                        default="")
+    parser.add_argument('--warm_shell', dest=Flags.WARM_SHELL, type=str,
+                        help="Internal to bbr_sweep.py --warm_pool. Run the trial in the shell spawned in this "
+                        "directory by --spawn_shell.",
+                        default="")
 
-    Flags.parsed_args = vars(parser.parse_args())
+    if ignore_unknown:
+        parsed_args = vars(parser.parse_known_args(args)[0])
+    else:
+        parsed_args = vars(parser.parse_args(args))
     # Preprocess the loss into a percentage
-    Flags.parsed_args[Flags.LOSS] = Flags.parsed_args[Flags.LOSS] / 100.0
-    debug_print_verbose("Parse: " + str(Flags.parsed_args))
-
-
-def _parse_mahimahi_log():
+    parsed_args[Flags.LOSS] = parsed_args[Flags.LOSS] / 100.0
+    parsed_args[Flags.DOWNLINK_LOSS] = parsed_args[Flags.DOWNLINK_LOSS] / 100.0
+    return parsed_args
+
+
+def trial_configuration(parsed_args):
+    """Return the columns of the result row of a trial that record its configuration, from its parsed flags."""
+    rtt = parsed_args[Flags.RTT]
+    bw = parsed_args[Flags.BW]
+    queue, queue_size, queue_limit, _ = _get_queue_config(parsed_args, rtt, bw)
+    configuration = {
+        "congestion_control": parsed_args[Flags.CC],
+        "loss_rate": parsed_args[Flags.LOSS],
+        "rtt_ms": rtt,
+        "specified_bw_Mbps": bw,
+        "queue": queue,
+        "queue_size": queue_size,
+        "queue_limit": queue_limit,
+        "workload": parsed_args[Flags.WORKLOAD],
+        "downlink_loss_rate": parsed_args[Flags.DOWNLINK_LOSS],
+        "reverse_traffic": parsed_args[Flags.REVERSE_TRAFFIC],
+    }
+    if parsed_args[Flags.REVERSE_TRAFFIC] != 'none':
+        configuration["reverse_cc"] = parsed_args[Flags.REVERSE_CC] or parsed_args[Flags.CC]
+    return configuration
+
+
+def _parse_mahimahi_log(log_file):
     # Piped to /dev/null because stdout is just the SVG generated.
     # We just want the throutput information, which is stderr.
-    debug_print_verbose("Parsing Mahimahi logs...")
-    command = ("mm-throughput-graph 10 /tmp/mahimahi_log > /dev/null")
+    debug_print_verbose("Parsing Mahimahi log %s..." % log_file)
+    command = ("mm-throughput-graph 10 %s > /dev/null" % log_file)
     output = subprocess.check_output(
         command, shell=True, stderr=subprocess.STDOUT)
+    return parse_throughput_graph_summary(output)
+
+
+def parse_throughput_graph_summary(output):
+    """Return (capacity, goodput, queueing delay, signal delay) from the summary printed by mm-throughput-graph.
+
+    The summary is the same for uplink and downlink logs.
+    """
+    if not isinstance(output, str):
+        output = output.decode('utf-8')
     output = output.split('\n')
     debug_print_verbose(output)
     capacity = float(output[0].split(' ')[2])
@@ -142,6 +432,18 @@ def _parse_mahimahi_log():
     return (capacity, goodput, q_delay, s_delay)
 
 
+def _archive_trial(archive_dir, result, server_timeseries):
+    """Archive the raw artifacts of the trial that produced result into archive_dir."""
+    if not os.path.exists(archive_dir):
+        os.makedirs(archive_dir)
+    name = "%s-%d-%s-loss%g%s" % (time.strftime("%Y%m%d-%H%M%S"), os.getpid(),
+                                  result["congestion_control"], result["loss_rate"] * 100, archive_suffix())
+    filename = os.path.join(archive_dir, name)
+    debug_print_verbose("Archiving trial to: %s" % filename)
+    archive_trial(filename, {"config": Flags.parsed_args, "result": result},
+                  Flags.parsed_args[Flags.UPLINK_LOG], server_timeseries, Flags.parsed_args[Flags.DOWNLINK_LOG])
+
+
 def _is_server_listening(port):
     """Determine whether a server at the given port is listening."""
     command = ["netstat", "-tln", "|", "grep", ":" + str(port)]
@@ -162,32 +464,67 @@ def _wait_for_server_start(port):
     debug_print_verbose("Server started listening at port %d" % port)
 
 
-def _run_experiment(loss, port, cong_ctrl, rtt, throughput, trace_up=None, trace_down=None):
-    """Run a single throughput experiment with the given loss rate."""
+def _client_args(port, buffer_bytes, measurement_file=None, sndbuf_file=None):
+    """Return the keyword arguments of client.run_client for the parsed flags."""
+    return {
+        "port": port,
+        "buffer_bytes": buffer_bytes,
+        "cpus": Flags.parsed_args[Flags.CLIENT_CPUS],
+        "workload": Flags.parsed_args[Flags.WORKLOAD],
+        "workload_args": {
+            "flow_size": Flags.parsed_args[Flags.FLOW_SIZE],
+            "flow_size_dist": Flags.parsed_args[Flags.FLOW_SIZE_DIST],
+            "request_rate": Flags.parsed_args[Flags.REQUEST_RATE],
+            "request_size": Flags.parsed_args[Flags.REQUEST_SIZE],
+            "response_size": Flags.parsed_args[Flags.RESPONSE_SIZE],
+        },
+        "measurement_file": measurement_file,
+        "sndbuf_file": sndbuf_file,
+        "reverse_port": port + 1 if Flags.parsed_args[Flags.REVERSE_TRAFFIC] == 'bulk' else None,
+    }
+
+
+def _emulator_command(loss, rtt, throughput, link_traces, uplink_log, downlink_log, once=True):
+    """Return the command of the Mahimahi shells of a trial, without the command run inside them."""
+    link_options = ["--uplink-log=" + uplink_log, "--downlink-log=" + downlink_log]
+    if not Flags.parsed_args[Flags.HEADLESS]:
+        link_options.append("--meter-uplink")
+    if once:
+        link_options.append("--once")
+    loss_shells = ["mm-loss", "uplink", str(loss)]
+    downlink_loss = Flags.parsed_args[Flags.DOWNLINK_LOSS]
+    if downlink_loss > 0:
+        loss_shells += ["mm-loss", "downlink", str(downlink_loss)]
+
+    return (["stdbuf", "-o0", "mm-delay", str(rtt / 2)] + loss_shells +
+            ["mm-link"] + link_traces + _mahimahi_queue_args(rtt, throughput) + link_options)
+
+
+def _run_experiment(loss, port, cong_ctrl, rtt, throughput, buffer_bytes, trace_up=None, trace_down=None,
+                    measurement_file=None, sndbuf_file=None, trace_dir=''):
+    """Run a single throughput experiment with the given loss rate.
+
+    buffer_bytes: Send buffer size of the client.
+    trace_dir: Directory of the traces generated for the throughput, unless trace_up and trace_down are given.
+    measurement_file: File the client appends flow completion times or request
+    latencies to, for the flows and rpc workloads.
+    sndbuf_file: File the client writes the send buffer size it was granted to.
+    """
     debug_print("Running experiment [loss = " +
-                str(loss) + ", cong_ctrl = " + str(cong_ctrl) + ", rtt = " + str(rtt) + ", bw = " + str(throughput) + "]")
+                str(loss) + ", cong_ctrl = " + str(cong_ctrl) + ", rtt = " + str(rtt) + ", bw = " + str(throughput) +
+                ", queue = " + str(Flags.parsed_args[Flags.QUEUE]) + "]")
 
-    client_args = "(\'" + str(cong_ctrl) + "\')"
+    # The emulator processes, and the client unless pinned itself, inherit this affinity.
+    set_cpu_affinity(0, Flags.parsed_args[Flags.EMULATOR_CPUS])
+    client_args = "(%r, **%r)" % (str(cong_ctrl), _client_args(port, buffer_bytes, measurement_file, sndbuf_file))
 
-    headless = Flags.parsed_args[Flags.HEADLESS]
-
-    # We are using an infinite buffer size.
-    if not headless:
-        if trace_up and trace_down:
-            command = ["stdbuf", "-o0", "mm-delay", str(rtt / 2), "mm-loss", "uplink", str(loss),
-                       "mm-link", str(trace_up), str(trace_down), "--uplink-log=/tmp/mahimahi_log", "--meter-uplink", "--once"]
-        else:
-            command = ["stdbuf", "-o0", "mm-delay", str(rtt / 2), "mm-loss", "uplink", str(loss),
-                       "mm-link", str(throughput) + "Mbps.up", str(throughput) +
-                       "Mbps.down", "--uplink-log=/tmp/mahimahi_log", "--meter-uplink", "--once"]
+    if trace_up and trace_down:
+        link_traces = [str(trace_up), str(trace_down)]
     else:
-        if trace_up and trace_down:
-            command = ["stdbuf", "-o0", "mm-delay", str(rtt / 2), "mm-loss", "uplink", str(loss),
-                       "mm-link", str(trace_up), str(trace_down), "--uplink-log=/tmp/mahimahi_log", "--once"]
-        else:
-            command = ["stdbuf", "-o0", "mm-delay", str(rtt / 2), "mm-loss", "uplink", str(loss),
-                       "mm-link", str(throughput) + "Mbps.up", str(throughput) +
-                       "Mbps.down", "--uplink-log=/tmp/mahimahi_log", "--once"]
+        link_traces = _trace_files(throughput, trace_dir)
+
+    command = _emulator_command(loss, rtt, throughput, link_traces, Flags.parsed_args[Flags.UPLINK_LOG],
+                                Flags.parsed_args[Flags.DOWNLINK_LOG])
 
     subcommand = ["--", "python", "-c",
                   "from client import run_client; run_client" + client_args]
@@ -200,10 +537,75 @@ def _run_experiment(loss, port, cong_ctrl, rtt, throughput, trace_up=None, trace
         sys.exit(-1)
 
 
+def _spawn_warm_shell(directory):
+    """Spawn the Mahimahi shell of the trial with an idle client agent in directory, and wait for it to exit.
+
+    The shell is used by a later run of the trial with --warm_shell (see bbr_warm_pool.py).
+    """
+    loss = Flags.parsed_args[Flags.LOSS]
+    rtt = Flags.parsed_args[Flags.RTT]
+    bw = Flags.parsed_args[Flags.BW]
+
+    prepare_shell_directory(directory)
+    _generate_trace(Flags.parsed_args[Flags.TIME], bw, directory)
+    link_traces = _trace_files(bw, directory)
+
+    set_cpu_affinity(0, Flags.parsed_args[Flags.EMULATOR_CPUS])
+    # The trace loops, the shell waits for the agent to exit instead.
+    command = _emulator_command(loss, rtt, bw, link_traces, os.path.join(directory, UPLINK_LOG),
+                                os.path.join(directory, DOWNLINK_LOG), once=False)
+    subcommand = ["--", "python", "-c",
+                  "from bbr_warm_pool import run_agent; run_agent(%r)" % directory]
+    debug_print_verbose(str(command) + " " + str(subcommand))
+    try:
+        shell = subprocess.Popen(command + subcommand, stderr=subprocess.STDOUT)
+    except OSError as e:
+        debug_print_error("Subprocess call error: " + str(e))
+        record_shell_exit(directory, -1)
+        sys.exit(-1)
+    record_shell_pid(directory, shell.pid)
+    returncode = shell.wait()
+    record_shell_exit(directory, returncode)
+
+    _clean_up_trace(bw, directory)
+    if returncode != EXIT_SUCCESS:
+        debug_print_error("Pooled shell exited with status %d" % returncode)
+        sys.exit(-1)
+
+
+def _run_warm_experiment(directory, port, cong_ctrl, buffer_bytes, measurement_file=None, sndbuf_file=None):
+    """Run a single experiment in the shell spawned in directory by --spawn_shell.
+
+    The uplink and downlink logs of the shell are cut down to the time the
+    client ran, and written to --uplink_log and --downlink_log as if the trial
+    had run in a shell of its own.
+    """
+    debug_print("Running experiment in pooled shell [cong_ctrl = %s, shell = %s]" % (cong_ctrl, directory))
+    duration_secs = Flags.parsed_args[Flags.TIME]
+    client_args = _client_args(port, buffer_bytes, measurement_file, sndbuf_file)
+    if not start_trial(directory, str(cong_ctrl), duration_secs, client_args):
+        debug_print_error("Pooled shell in %s is not running." % directory)
+        sys.exit(-1)
+    window = wait_for_client_window(directory, duration_secs + SHELL_TIMEOUT_SECS)
+    if window is None:
+        debug_print_error("Pooled shell in %s exited before the trial completed." % directory)
+        sys.exit(-1)
+    trim_link_log(os.path.join(directory, UPLINK_LOG), Flags.parsed_args[Flags.UPLINK_LOG], *window)
+    trim_link_log(os.path.join(directory, DOWNLINK_LOG), Flags.parsed_args[Flags.DOWNLINK_LOG], *window)
+
+
 def main():
     """Run the experiments."""
     # Grab the experimental parameterss
     _parse_args()
+    pooled = Flags.parsed_args[Flags.SPAWN_SHELL] or Flags.parsed_args[Flags.WARM_SHELL]
+    if pooled and (Flags.parsed_args[Flags.TUP] is not None or Flags.parsed_args[Flags.TDOWN] is not None):
+        # Pooled shells loop their trace, so the trial would start at an arbitrary point of it.
+        debug_print_error("Trials with --traceup or --tracedown cannot run in pooled shells.")
+        sys.exit(-1)
+    if Flags.parsed_args[Flags.SPAWN_SHELL]:
+        _spawn_warm_shell(Flags.parsed_args[Flags.SPAWN_SHELL])
+        return
 
     port = Flags.parsed_args[Flags.PORT]
     size = Flags.parsed_args[Flags.SIZE]
@@ -211,32 +613,105 @@ def main():
     rtt = Flags.parsed_args[Flags.RTT]
     bw = Flags.parsed_args[Flags.BW]
     cc = Flags.parsed_args[Flags.CC]
+    reverse_traffic = Flags.parsed_args[Flags.REVERSE_TRAFFIC]
+    reverse_cc = Flags.parsed_args[Flags.REVERSE_CC] or cc
     output_file = Flags.parsed_args[Flags.OUTPUT_FILE]
     uplink_trace = Flags.parsed_args[Flags.TUP]
     downlink_trace = Flags.parsed_args[Flags.TDOWN]
-    # Generate the trace files based on the parameter
-    if uplink_trace is None and downlink_trace is None:
-        _generate_trace(Flags.parsed_args[Flags.TIME], bw)
+    warm_shell = Flags.parsed_args[Flags.WARM_SHELL]
+    # Generate the trace files based on the parameter, pooled shells generate their own. Every driver
+    # has its own trace directory, so that concurrent trials, e.g. of local workers of a distributed
+    # sweep, do not remove the traces of another trial at the same bandwidth.
+    trace_dir = None
+    if uplink_trace is None and downlink_trace is None and not warm_shell:
+        trace_dir = tempfile.mkdtemp(prefix="bbr_traces_")
+        _generate_trace(Flags.parsed_args[Flags.TIME], bw, trace_dir)
+
+    buffer_bytes = socket_buffer_bytes(bdp_bytes(rtt, bw), Flags.parsed_args[Flags.SOCKET_BUFFER_BDP])
+    for warning in check_buffer_limits(buffer_bytes, read_buffer_limits()):
+        debug_print_warn(warning)
+    debug_print_verbose("Socket buffer size: %d bytes" % buffer_bytes)
 
     # Start the client and server
     server_q = Queue()
     e = Event()
-    server_proc = Server(server_q, e, cc, port, size)
+    workload = Flags.parsed_args[Flags.WORKLOAD]
+    server_proc = Server(server_q, e, cc, port, size, Flags.parsed_args[Flags.LIVE_STATS_FILE], workload,
+                         buffer_bytes)
+    reverse_proc = None
+    if reverse_traffic == 'bulk':
+        reverse_proc = ReverseSender(e, reverse_cc, port + 1, size, buffer_bytes)
+        # Terminated with the driver when a trial fails, like the server it is not told to stop then.
+        reverse_proc.daemon = True
+
+    measurement_file = None
+    if workload != 'bulk':
+        handle, measurement_file = tempfile.mkstemp(prefix="bbr_%s_" % workload, suffix=".txt")
+        os.close(handle)
+    handle, sndbuf_file = tempfile.mkstemp(prefix="bbr_sndbuf_", suffix=".txt")
+    os.close(handle)
+
+    # A terminated trial leaves neither its traces nor a partial log or measurement file behind.
+    leftover_files = [Flags.parsed_args[Flags.UPLINK_LOG], Flags.parsed_args[Flags.DOWNLINK_LOG], sndbuf_file]
+    if trace_dir:
+        leftover_files.append(trace_dir)
+    if measurement_file:
+        leftover_files.append(measurement_file)
+    _remove_files_on_sigterm(leftover_files)
 
     # Start client and wait for it to finish.
-    if uplink_trace is None and downlink_trace is None:
+    if warm_shell:
+        client_proc = Process(target=_run_warm_experiment,
+                              args=(warm_shell, port, cc, buffer_bytes),
+                              kwargs={"measurement_file": measurement_file, "sndbuf_file": sndbuf_file})
+    elif uplink_trace is None and downlink_trace is None:
         client_proc = Process(target=_run_experiment,
-                              args=(loss, port, cc, rtt, bw))
+                              args=(loss, port, cc, rtt, bw, buffer_bytes),
+                              kwargs={"measurement_file": measurement_file, "sndbuf_file": sndbuf_file,
+                                      "trace_dir": trace_dir})
     else:
         client_proc = Process(target=_run_experiment,
-                              args=(loss, port, cc, rtt, bw, uplink_trace, downlink_trace))
+                              args=(loss, port, cc, rtt, bw, buffer_bytes, uplink_trace, downlink_trace),
+                              kwargs={"measurement_file": measurement_file, "sndbuf_file": sndbuf_file})
 
     server_proc.start()
+    set_cpu_affinity(server_proc.pid, Flags.parsed_args[Flags.SERVER_CPUS])
+    monitor = ProcessTreeMonitor()
+    monitor.watch(server_proc.pid, lambda comm, is_root: 'server')
+    if reverse_proc:
+        reverse_proc.start()
+        set_cpu_affinity(reverse_proc.pid, Flags.parsed_args[Flags.SERVER_CPUS])
+        monitor.watch(reverse_proc.pid, lambda comm, is_root: 'reverse_sender')
     # Wait a little to give server time to start up.
     time.sleep(2)
     _wait_for_server_start(port)
+    if reverse_proc:
+        _wait_for_server_start(port + 1)
+    if warm_shell:
+        pooled_shell_pid = wait_for_shell_pid(warm_shell, SHELL_TIMEOUT_SECS)
+        if pooled_shell_pid is None:
+            debug_print_error("Pooled shell in %s was not spawned. Terminating." % warm_shell)
+            server_proc.terminate()
+            sys.exit(-1)
+        # The shell has been running since an earlier trial, only its usage from now on is the trial's.
+        monitor.watch(pooled_shell_pid, _pooled_shell_process_role, baseline=True)
     client_proc.start()
+    client_start_time = time.time()
+    if not warm_shell:
+        monitor.watch(client_proc.pid, _emulator_process_role)
+    monitor.start()
     client_proc.join()
+    monitor.stop()
+    usage = monitor.usage_by_role()
+    trial_secs = time.time() - client_start_time
+    for role in ["server", "client", "reverse_sender"]:
+        if usage[role + "_cpu_secs"] > 0.9 * trial_secs:
+            debug_print_warn("The %s used %.1f CPU seconds in %.1f seconds, the trial was likely CPU-bound." %
+                             (role.replace('_', ' '), usage[role + "_cpu_secs"], trial_secs))
+    if warm_shell and client_proc.exitcode != EXIT_SUCCESS:
+        debug_print_error("Trial in pooled shell failed. Terminating.")
+        server_proc.terminate()
+        sys.exit(-1)
     # Handle errors starting up the server.
     if not server_proc.is_alive():
         if server_proc.exitcode != EXIT_SUCCESS:
@@ -250,39 +725,65 @@ def main():
     debug_print_verbose("Is Server Alive? %s" % (server_proc.is_alive()))
     # Wait for server to shutdown, upto some timeout.
     server_proc.join(10)
+    if reverse_proc:
+        reverse_proc.join(10)
     # Check for errors from the server
     debug_print_verbose("Run complete.")
+    server_timeseries = []
+    server_rcvbuf_bytes = None
     while(not server_q.empty()):
         result, exception = server_q.get()
         if exception:
             raise exception
+        if isinstance(result, dict):
+            server_timeseries = result["timeseries"]
+            server_rcvbuf_bytes = result["rcvbuf_bytes"]
+            continue
         debug_print_verbose(result)
 
     server_q.close()
 
     e.clear()
-    (capacity, goodput, q_delay, s_delay) = _parse_mahimahi_log()
+    (capacity, goodput, q_delay, s_delay) = _parse_mahimahi_log(Flags.parsed_args[Flags.UPLINK_LOG])
+    (downlink_capacity, downlink_goodput, downlink_q_delay, downlink_s_delay) = \
+        _parse_mahimahi_log(Flags.parsed_args[Flags.DOWNLINK_LOG])
     debug_print("Experiment complete!")
 
+    result = trial_configuration(Flags.parsed_args)
+    result.update({
+        "goodput_Mbps": goodput,
+        "bandwidth_Mbps": capacity,
+        "queue_delay_p95_ms": q_delay,
+        "signal_delay_p95_ms": s_delay,
+    })
+    result.update(usage)
+    result["socket_buffer_bytes"] = buffer_bytes
+    result["client_sndbuf_bytes"] = read_granted_buffer(sndbuf_file)
+    result["server_rcvbuf_bytes"] = server_rcvbuf_bytes
+    os.remove(sndbuf_file)
+    result["status"] = STATUS_OK
+    result["downlink_bandwidth_Mbps"] = downlink_capacity
+    result["downlink_goodput_Mbps"] = downlink_goodput
+    result["downlink_queue_delay_p95_ms"] = downlink_q_delay
+    result["downlink_signal_delay_p95_ms"] = downlink_s_delay
+    if measurement_file:
+        result.update(summarize_measurements(measurement_file))
+        os.remove(measurement_file)
+
     # Print the output
-    results = ', '.join([str(x)
-                         for x in [cc, loss, goodput, rtt, capacity, bw]])
-    stdout_print(results + "\n")
+    stdout_print(format_result_row(result) + "\n")
 
     # Also write to output file if it's set.
     if output_file:
         debug_print_verbose("Appending Result output to: %s" % output_file)
-        if os.path.exists(output_file):
-            with open(output_file, 'a') as output:
-                output.write(results + "\n")
-        else:
-            with open(output_file, 'a') as output:
-                header_line = "congestion_control, loss_rate, goodput_Mbps, rtt_ms, bandwidth_Mbps, specified_bw_Mbps"
-                output.write(header_line + "\n")
-                output.write(results + "\n")
-
-    if uplink_trace is None and downlink_trace is None:
-        _clean_up_trace(bw)
+        append_result(output_file, result)
+
+    archive_dir = Flags.parsed_args[Flags.ARCHIVE_DIR]
+    if archive_dir:
+        _archive_trial(archive_dir, result, server_timeseries)
+
+    if trace_dir:
+        shutil.rmtree(trace_dir)
 
     debug_print("Terminating driver.")
 
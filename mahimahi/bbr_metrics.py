@@ -0,0 +1,170 @@
+#!/usr/bin/python
+"""Live progress of a sweep, served as Prometheus text metrics over HTTP.
+
+The sweep runner records trial starts and completions in a SweepProgress
+object. The server process of the running trial periodically writes its live
+receive statistics to a small JSON file (see server.py), which is read every
+time the metrics are scraped. The metrics are served on
+http://127.0.0.1:<port>/metrics in the Prometheus text exposition format.
+"""
+from bbr_logging import debug_print, debug_print_verbose
+import json
+import os
+import threading
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+def read_live_stats(live_stats_file):
+    """Return the live stats dictionary written by the server, or None if unavailable."""
+    if not live_stats_file or not os.path.exists(live_stats_file):
+        return None
+    try:
+        with open(live_stats_file, 'r') as stats:
+            return json.load(stats)
+    except (IOError, OSError, ValueError):
+        # The file is replaced atomically, but may be removed between trials.
+        return None
+
+
+def write_live_stats(live_stats_file, stats):
+    """Atomically replace live_stats_file with the given stats dictionary."""
+    tmp_file = live_stats_file + ".tmp"
+    with open(tmp_file, 'w') as output:
+        json.dump(stats, output)
+    os.rename(tmp_file, live_stats_file)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ['%s="%s"' % (key, str(labels[key]).replace('\\', '\\\\').replace('"', '\\"'))
+             for key in sorted(labels)]
+    return '{' + ','.join(pairs) + '}'
+
+
+class SweepProgress(object):
+    """Thread-safe record of the progress of a sweep."""
+
+    def __init__(self, total_trials, live_stats_file=None):
+        """Initialize progress for a sweep of total_trials trials."""
+        self.lock = threading.Lock()
+        self.total_trials = total_trials
+        self.live_stats_file = live_stats_file
+        self.completed_trials = 0
+        self.failed_trials = 0
+        self.total_trial_secs = 0.0
+        self.start_time = time.time()
+        # Trials currently running, as token -> (trial, start time).
+        self.running_trials = {}
+        self.next_token = 0
+
+    def trial_started(self, trial):
+        """Record the start of a trial, given as a dictionary of its parameters.
+
+        Returns a token identifying the trial in trial_finished.
+        """
+        with self.lock:
+            token = self.next_token
+            self.next_token += 1
+            self.running_trials[token] = (dict(trial), time.time())
+            return token
+
+    def trial_finished(self, token, succeeded):
+        """Record the end of the trial identified by token."""
+        with self.lock:
+            _, start_time = self.running_trials.pop(token)
+            self.total_trial_secs += time.time() - start_time
+            self.completed_trials += 1
+            if not succeeded:
+                self.failed_trials += 1
+
+    def trial_abandoned(self, token):
+        """Forget a running trial that will be run again, e.g. because its worker was lost."""
+        with self.lock:
+            self.running_trials.pop(token, None)
+
+    def format_metrics(self):
+        """Return the current progress in the Prometheus text exposition format."""
+        with self.lock:
+            now = time.time()
+            remaining = self.total_trials - self.completed_trials
+            avg_trial_secs = 0.0
+            if self.completed_trials:
+                avg_trial_secs = self.total_trial_secs / self.completed_trials
+            running_trials = [(trial, now - start_time) for trial, start_time in self.running_trials.values()]
+            # Trials run concurrently on distributed workers.
+            parallelism = max(len(running_trials), 1)
+            eta = max(remaining * avg_trial_secs - sum(elapsed for _, elapsed in running_trials), 0.0) / parallelism
+
+            metrics = [
+                ("bbr_sweep_trials_total", "gauge", "Number of trials in the sweep.", self.total_trials),
+                ("bbr_sweep_trials_completed_total", "counter", "Number of finished trials.",
+                 self.completed_trials),
+                ("bbr_sweep_trials_failed_total", "counter", "Number of failed trials.", self.failed_trials),
+                ("bbr_sweep_trials_remaining", "gauge", "Number of trials not finished yet.", remaining),
+                ("bbr_sweep_trials_running", "gauge", "Number of trials currently running.", len(running_trials)),
+                ("bbr_sweep_trial_duration_seconds_avg", "gauge", "Average duration of finished trials.",
+                 avg_trial_secs),
+                ("bbr_sweep_eta_seconds", "gauge", "Estimated time until the sweep finishes.", eta),
+                ("bbr_sweep_elapsed_seconds", "gauge", "Time since the sweep started.", now - self.start_time),
+            ]
+
+        lines = []
+        for name, metric_type, help_text, value in metrics:
+            lines.append("# HELP %s %s" % (name, help_text))
+            lines.append("# TYPE %s %s" % (name, metric_type))
+            lines.append("%s %s" % (name, value))
+
+        if running_trials:
+            lines.append("# HELP bbr_sweep_current_trial_elapsed_seconds Time since the current trial started.")
+            lines.append("# TYPE bbr_sweep_current_trial_elapsed_seconds gauge")
+            for trial, elapsed in running_trials:
+                lines.append("bbr_sweep_current_trial_elapsed_seconds%s %s" % (_format_labels(trial), elapsed))
+        # Live server stats are only available for trials run locally, one at a time.
+        stats = read_live_stats(self.live_stats_file) if len(running_trials) == 1 else None
+        if stats:
+            labels = _format_labels(running_trials[0][0])
+            lines.append("# HELP bbr_sweep_current_trial_throughput_mbps Server receive throughput over the last interval.")
+            lines.append("# TYPE bbr_sweep_current_trial_throughput_mbps gauge")
+            lines.append("bbr_sweep_current_trial_throughput_mbps%s %s" % (labels, stats["throughput_Mbps"]))
+            lines.append("# HELP bbr_sweep_current_trial_received_bytes Bytes received by the server in the current trial.")
+            # A gauge, since it starts over with every trial.
+            lines.append("# TYPE bbr_sweep_current_trial_received_bytes gauge")
+            lines.append("bbr_sweep_current_trial_received_bytes%s %s" % (labels, stats["received_bytes"]))
+        return "\n".join(lines) + "\n"
+
+
+def _make_handler(progress):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        """Serve the sweep progress on /metrics."""
+
+        def do_GET(self):
+            if self.path.split('?')[0] not in ['/', '/metrics']:
+                self.send_error(404)
+                return
+            body = progress.format_metrics().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            debug_print_verbose("Metrics request: " + (format % args))
+
+    return MetricsHandler
+
+
+def start_metrics_server(progress, port, address='127.0.0.1'):
+    """Serve progress metrics on address:port from a daemon thread. Returns the HTTP server."""
+    httpd = HTTPServer((address, port), _make_handler(progress))
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    debug_print("Serving sweep metrics on http://%s:%d/metrics" % (address, httpd.server_port))
+    return httpd
@@ -1,24 +1,48 @@
 #!/usr/bin/python
 """Module for creating all of the plots after the data has been gathered."""
+from bbr_compare import config_key, CONFIG_COLUMNS, describe_key
 from bbr_logging import debug_print, debug_print_verbose, debug_print_error, debug_print_warn
-import csv
+from bbr_results import read_results, trial_succeeded
+from bbr_timeseries import bin_uplink_log, largest_triangle_three_buckets, parse_uplink_log
+import argparse
 import matplotlib
 # Force matplotlib to not use any Xwindows backend.
 matplotlib.use('Agg')
 from matplotlib import pyplot as plt
+import numpy as np
 import os
 
 # Flag to control whether interactive plots should be shown.
 SHOW_INTERACTIVE_PLOTS = False
 
+# Number of bootstrap resamples and confidence level of the error bands.
+BOOTSTRAP_RESAMPLES = 1000
+CONFIDENCE_LEVEL = 0.95
+
+# Largest number of values resampled at once, to bound the memory of the bootstrap.
+BOOTSTRAP_CHUNK_VALUES = 1 << 22
+
+# Fields of parse_results_csv averaged over the repeated trials of a configuration,
+# and the result columns they are read from.
+METRIC_FIELDS = [
+    ("goodput", "goodput_Mbps"),
+    ("normalized_goodput", None),
+    ("capacity", "bandwidth_Mbps"),
+    ("queue_delay", "queue_delay_p95_ms"),
+    ("signal_delay", "signal_delay_p95_ms"),
+    ("latency_p50", "latency_p50_ms"),
+    ("latency_p95", "latency_p95_ms"),
+    ("latency_p99", "latency_p99_ms"),
+]
+
 
 def deduplicate_xmark_ticks(xmark_ticks):
     """Remove redundant ticks for the given xmark_ticks."""
     # Use a set to deduplicate.
     xmark_ticks = sorted([x for x in set(xmark_ticks)])
-    xmark_ticks.remove(25.0)
-    xmark_ticks.remove(15.0)
-    xmark_ticks.remove(40.0)
+    for redundant_tick in [25.0, 15.0, 40.0]:
+        if redundant_tick in xmark_ticks:
+            xmark_ticks.remove(redundant_tick)
     return xmark_ticks
 
 
@@ -88,63 +112,144 @@ def save_figure(plt, name):
         plt.show()
 
 
-def parse_results_csv(input_csv_file, include_predicate_fn=None):
+def bootstrap_confidence_intervals(groups, resamples=BOOTSTRAP_RESAMPLES, confidence=CONFIDENCE_LEVEL, seed=0):
+    """Return the means of many groups of values and bootstrap confidence intervals of the means.
+
+    Groups of the same size are resampled at once with NumPy, so that
+    thousands of groups take well under a second. groups is a list of lists of
+    values. Returns arrays (means, lows, highs), one entry per group. Groups
+    without values are NaN, and the interval of a group of a single value is
+    that value.
+    """
+    means = np.full(len(groups), np.nan)
+    lows = np.full(len(groups), np.nan)
+    highs = np.full(len(groups), np.nan)
+    by_size = {}
+    for index, group in enumerate(groups):
+        if len(group):
+            by_size.setdefault(len(group), []).append(index)
+
+    rng = np.random.RandomState(seed)
+    tail = (1 - confidence) / 2 * 100
+    for size, indices in by_size.items():
+        indices = np.array(indices)
+        values = np.array([groups[index] for index in indices], dtype=float)
+        means[indices] = values.mean(axis=1)
+        if size == 1:
+            lows[indices] = highs[indices] = values[:, 0]
+            continue
+        # Every resample of a group draws size values of the group with replacement.
+        chunk_size = max(1, BOOTSTRAP_CHUNK_VALUES // (resamples * size))
+        for start in range(0, len(indices), chunk_size):
+            chunk = values[start:start + chunk_size]
+            draws = rng.randint(0, size, (len(chunk), resamples, size))
+            resampled_means = chunk[np.arange(len(chunk))[:, None, None], draws].mean(axis=2)
+            chunk_indices = indices[start:start + chunk_size]
+            lows[chunk_indices], highs[chunk_indices] = np.percentile(resampled_means, [tail, 100 - tail], axis=1)
+    return means, lows, highs
+
+
+def parse_results_csv(input_csv_file, include_predicate_fn=None, group_by=None):
     """Read input csv file from bbr experiment and converts it into a python dictionary convenient for plotting figures.
 
     input_csv_file: Input CSV file to read.
-    The logfile is a CSV of the format [congestion_control, loss_rate, goodput, rtt, capacity, specified_bw]
+    The logfile is a CSV of the format [congestion_control, loss_rate, goodput, rtt, capacity, specified_bw, ...]
+    with a header row naming the columns (see bbr_results.RESULT_COLUMNS).
 
     include_predicate_fn: Optional. When present, it's a function called to determine
     whether current record should be included. Function is given a tuple of
     (congestion_control, loss, goodput, rtt, bandwidth) and should return a boolean. True
     for inclusion; False for exclusion.
 
+    group_by: Optional. List of extra result columns (e.g. ["queue", "queue_size"]) to
+    group by in addition to the congestion control algorithm. When set, the
+    dictionary keys are tuples of (congestion_control, value1, value2, ...).
+
+    Repeated trials of a configuration are averaged into a single point. Every
+    field of METRIC_FIELDS has its bootstrap confidence interval in <field>_low
+    and <field>_high, and "trials" holds the number of trials of each point.
+
     Returns a result which an in-memory dictionary of format:
     CongestionControlAlgorithm -> {"loss": [...], "goodput": [...], "rtt" : [...], "bandwidth": [...] }
     """
-    # Parse CSV File into in-memory result dictionary. Format is like:
-    # CongestionControl -> {"loss": [], "goodput": [], ... }
-    results = {}
-    with open(input_csv_file, 'rb') as csvfile:
-        reader = csv.reader(csvfile)
-        # Skip header row
-        reader.next()
-
-        for (cc, loss, goodput, rtt, capacity, specified_bw) in reader:
-            loss_percent = float(loss) * 100
-            goodput = float(goodput)
-            rtt = float(rtt)
-            capacity = float(capacity)
-            specified_bw = float(specified_bw)
-            normalized_goodput = goodput / capacity
-            if not cc:
-                debug_print_warn(
-                    "Skipping a log entry that's missing a Congestion Control Algorithm")
+    # Parse CSV File into in-memory dictionary of the trials of every point. Format is like:
+    # CongestionControl -> {configuration -> {"loss": ..., "goodput": [], ... }}
+    points = {}
+    for row in read_results(input_csv_file):
+        cc = row['congestion_control']
+        loss = row['loss_rate']
+        goodput = row['goodput_Mbps']
+        rtt = row['rtt_ms']
+        capacity = row['bandwidth_Mbps']
+        specified_bw = row['specified_bw_Mbps']
+        if not cc:
+            debug_print_warn(
+                "Skipping a log entry that's missing a Congestion Control Algorithm")
+            continue
+        if not trial_succeeded(row):
+            debug_print_warn("Skipping a %s trial of %s at loss %s" % (row['status'], cc, loss))
+            continue
+
+        # Skip rows that are filt
+        if include_predicate_fn:
+            if not include_predicate_fn(cc, loss, goodput, rtt, capacity, specified_bw):
                 continue
 
-            # Skip rows that are filt
-            if include_predicate_fn:
-                if not include_predicate_fn(cc, loss, goodput, rtt, capacity, specified_bw):
-                    continue
-
-            if cc in results:
-                # Re-use existing dictionary
-                value_dict = results[cc]
-            else:
-                # Create a new one.
-                value_dict = {"loss": [], "goodput": [],
-                              "normalized_goodput": [], "rtt": [], "capacity": [], "specified_bw": []}
-
-            value_dict['loss'].append(loss_percent)
-            value_dict['goodput'].append(goodput)
-            value_dict['rtt'].append(rtt)
-            value_dict['capacity'].append(capacity)
-            value_dict['specified_bw'].append(specified_bw)
-            value_dict['normalized_goodput'].append(normalized_goodput)
-            results[cc] = value_dict
+        key = cc
+        if group_by:
+            key = tuple([cc] + [row[column] for column in group_by])
+
+        # Points are kept in the order of their first trial.
+        key_points = points.setdefault(key, {"order": [], "trials": {}})
+        point = config_key(row)
+        if point not in key_points["trials"]:
+            key_points["order"].append(point)
+            key_points["trials"][point] = dict(
+                [("loss", loss * 100), ("rtt", rtt), ("specified_bw", specified_bw)] +
+                [(field, []) for field, _ in METRIC_FIELDS])
+        trials = key_points["trials"][point]
+        for field, column in METRIC_FIELDS:
+            value = goodput / capacity if field == "normalized_goodput" else row[column]
+            if value != '':
+                trials[field].append(value)
+
+    # Bootstrap all points and fields at once.
+    groups = [trials[field] for key_points in points.values() for point in key_points["order"]
+              for trials in [key_points["trials"][point]] for field, _ in METRIC_FIELDS]
+    means, lows, highs = bootstrap_confidence_intervals(groups)
+
+    results = {}
+    index = 0
+    for key, key_points in points.items():
+        value_dict = {"loss": [], "rtt": [], "specified_bw": [], "trials": []}
+        for field, _ in METRIC_FIELDS:
+            for suffix in ["", "_low", "_high"]:
+                value_dict[field + suffix] = []
+        for point in key_points["order"]:
+            trials = key_points["trials"][point]
+            for field in ["loss", "rtt", "specified_bw"]:
+                value_dict[field].append(trials[field])
+            value_dict["trials"].append(len(trials["goodput"]))
+            for field, _ in METRIC_FIELDS:
+                value_dict[field].append(means[index])
+                value_dict[field + "_low"].append(lows[index])
+                value_dict[field + "_high"].append(highs[index])
+                index += 1
+        results[key] = value_dict
     return results
 
 
+def plot_with_error_band(axes, value, field, color, **kwargs):
+    """Plot a field of parse_results_csv against the loss rate, with a band over its confidence interval."""
+    # Points are in the order of their first trial, e.g. interleaved by the other sweep dimensions.
+    order = sorted(range(len(value['loss'])), key=lambda index: value['loss'][index])
+    loss, mean, low, high = [[values[index] for index in order] for values in
+                             [value['loss'], value[field], value[field + '_low'], value[field + '_high']]]
+    lines = axes.plot(loss, mean, color=color, **kwargs)
+    axes.fill_between(loss, low, high, color=color, alpha=0.2, linewidth=0)
+    return lines
+
+
 def make_figure_8_plot(logfile):
     """Generate high quality plot of data to reproduce figure 8.
 
@@ -172,11 +277,11 @@ def make_figure_8_plot(logfile):
 
     matplotlib.rcParams.update({'figure.autolayout': True})
 
-    plt.plot(cubic['loss'], cubic['goodput'], color='blue', linestyle='solid', marker='o',
-             markersize=7, label='CUBIC')
+    plot_with_error_band(axes, cubic, 'goodput', color='blue', linestyle='solid', marker='o',
+                         markersize=7, label='CUBIC')
 
-    plt.plot(bbr['loss'], bbr['goodput'], color='red', linestyle='solid', marker='x',
-             markersize=7, label='BBR')
+    plot_with_error_band(axes, bbr, 'goodput', color='red', linestyle='solid', marker='x',
+                         markersize=7, label='BBR')
 
     # Plot ideal line of (1-lossRate * BW)
     ideal = {}
@@ -248,13 +353,13 @@ def make_experiment1_figure(logfile):
         cubic_color = cubic_bandwidth_colors[index]
         bbr_color = bbr_bandwidth_colors[index]
 
-        plt.plot(filtered_cubic['loss'], filtered_cubic['normalized_goodput'],
-                 color=cubic_color, linestyle='solid', marker='o',
-                 markersize=7, label='CUBIC (%s Mbps)' % bandwidth_filter)
+        plot_with_error_band(axes, filtered_cubic, 'normalized_goodput',
+                             color=cubic_color, linestyle='solid', marker='o',
+                             markersize=7, label='CUBIC (%s Mbps)' % bandwidth_filter)
 
-        plt.plot(filtered_bbr['loss'], filtered_bbr['normalized_goodput'], color=bbr_color,
-                 linestyle='solid', marker='x',
-                 markersize=7, label='BBR (%s Mbps)' % bandwidth_filter)
+        plot_with_error_band(axes, filtered_bbr, 'normalized_goodput', color=bbr_color,
+                             linestyle='solid', marker='x',
+                             markersize=7, label='BBR (%s Mbps)' % bandwidth_filter)
 
     plot_titles(plt,
                 xaxis="Loss Rate (%) - Log Scale",
@@ -304,23 +409,23 @@ def make_experiment2_figure(logfile):
     matplotlib.rcParams.update({'figure.autolayout': True})
 
     # Plot the results of the different congestion control algorithms
-    plt.plot(cubic['loss'], cubic['goodput'], color='blue', linestyle='solid', marker='o',
-             markersize=7, label='CUBIC')
+    plot_with_error_band(axes, cubic, 'goodput', color='blue', linestyle='solid', marker='o',
+                         markersize=7, label='CUBIC')
 
-    plt.plot(bbr['loss'], bbr['goodput'], color='red', linestyle='solid', marker='x',
-             markersize=7, label='BBR')
+    plot_with_error_band(axes, bbr, 'goodput', color='red', linestyle='solid', marker='x',
+                         markersize=7, label='BBR')
 
-    plt.plot(bic['loss'], bic['goodput'], color='#addd8e', linestyle='solid', marker='.',
-             markersize=7, label='BIC')
+    plot_with_error_band(axes, bic, 'goodput', color='#addd8e', linestyle='solid', marker='.',
+                         markersize=7, label='BIC')
 
-    plt.plot(vegas['loss'], vegas['goodput'], color='#78c679', linestyle='solid', marker='.',
-             markersize=7, label='VEGAS')
+    plot_with_error_band(axes, vegas, 'goodput', color='#78c679', linestyle='solid', marker='.',
+                         markersize=7, label='VEGAS')
 
-    plt.plot(westwood['loss'], westwood['goodput'], color='#31a354', linestyle='solid', marker='.',
-             markersize=7, label='WESTWOOD')
+    plot_with_error_band(axes, westwood, 'goodput', color='#31a354', linestyle='solid', marker='.',
+                         markersize=7, label='WESTWOOD')
 
-    plt.plot(reno['loss'], reno['goodput'], color='#006837', linestyle='solid', marker='.',
-             markersize=7, label='RENO')
+    plot_with_error_band(axes, reno, 'goodput', color='#006837', linestyle='solid', marker='.',
+                         markersize=7, label='RENO')
 
     plt.xscale('log')
 
@@ -382,13 +487,13 @@ def make_experiment3_figure(logfile):
         cubic_color = cubic_rtt_colors[index]
         bbr_color = bbr_rtt_colors[index]
 
-        plt.plot(filtered_cubic['loss'], filtered_cubic['goodput'],
-                 color=cubic_color, linestyle='solid', marker='o',
-                 markersize=7, label='CUBIC (%s ms RTT)' % rtt_filter)
+        plot_with_error_band(axes, filtered_cubic, 'goodput',
+                             color=cubic_color, linestyle='solid', marker='o',
+                             markersize=7, label='CUBIC (%s ms RTT)' % rtt_filter)
 
-        plt.plot(filtered_bbr['loss'], filtered_bbr['goodput'], color=bbr_color,
-                 linestyle='solid', marker='x',
-                 markersize=7, label='BBR (%s ms RTT)' % rtt_filter)
+        plot_with_error_band(axes, filtered_bbr, 'goodput', color=bbr_color,
+                             linestyle='solid', marker='x',
+                             markersize=7, label='BBR (%s ms RTT)' % rtt_filter)
 
     plot_titles(plt,
                 xaxis="Loss Rate (%) - Log Scale",
@@ -438,11 +543,11 @@ def make_experiment4_figure(logfile):
 
     matplotlib.rcParams.update({'figure.autolayout': True})
 
-    plt.plot(cubic['loss'], cubic['goodput'], color='blue', linestyle='solid', marker='o',
-             markersize=7, label='CUBIC')
+    plot_with_error_band(axes, cubic, 'goodput', color='blue', linestyle='solid', marker='o',
+                         markersize=7, label='CUBIC')
 
-    plt.plot(bbr['loss'], bbr['goodput'], color='red', linestyle='solid', marker='x',
-             markersize=7, label='BBR')
+    plot_with_error_band(axes, bbr, 'goodput', color='red', linestyle='solid', marker='x',
+                         markersize=7, label='BBR')
 
     plt.xscale('log')
 
@@ -455,18 +560,287 @@ def make_experiment4_figure(logfile):
     save_figure(plt, name="figures/experiment4.png")
 
 
+def queue_config_label(queue, queue_size):
+    """Return a human readable label for a bottleneck queue configuration."""
+    if not queue or queue == 'infinite':
+        return 'infinite'
+    return '%s %s' % (queue, queue_size)
+
+
+def make_experiment5_figure(logfile, group_by=("queue", "queue_size")):
+    """Generate high quality plot of data for Experiment 5.
+
+    Experiment 5 is looking at the effects of the bottleneck queue discipline
+    and size on CUBIC and BBR. Goodput and 95th percentile queueing delay are
+    plotted against the loss rate, with one curve per congestion control and
+    queue configuration.
+
+    group_by: result columns that identify a queue configuration.
+    The logfile is a CSV of the format [congestion_control, loss_rate, goodput, rtt, capacity, specified_bw, queue, ...]
+    """
+    # Create a figure with goodput on top and queueing delay below it.
+    fig_width = 8
+    fig_height = 9
+    fig, (goodput_axes, delay_axes) = plt.subplots(2, 1, sharex=True, figsize=(fig_width, fig_height))
+
+    results = parse_results_csv(logfile, group_by=list(group_by))
+    xmark_ticks = get_loss_percent_xmark_ticks(results)
+    debug_print_verbose("--- Generating figures for experiment 5")
+
+    matplotlib.rcParams.update({'figure.autolayout': True})
+
+    cubic_keys = sorted([key for key in results if key[0] == 'cubic'])
+    bbr_keys = sorted([key for key in results if key[0] == 'bbr'])
+
+    # Use increasingly darker shades of blue (CUBIC) and red (BBR) for each
+    # queue configuration, as in the other experiment figures.
+    for keys, color_map, marker, name in [(cubic_keys, plt.cm.Blues, 'o', 'CUBIC'),
+                                          (bbr_keys, plt.cm.Reds, 'x', 'BBR')]:
+        for index, key in enumerate(keys):
+            value = results[key]
+            color = color_map(0.4 + 0.6 * (index + 1) / float(len(keys)))
+            label = '%s (%s)' % (name, queue_config_label(*key[1:]))
+            plot_with_error_band(goodput_axes, value, 'goodput', color=color, linestyle='solid',
+                                 marker=marker, markersize=7, label=label)
+            plot_with_error_band(delay_axes, value, 'queue_delay', color=color, linestyle='solid',
+                                 marker=marker, markersize=7, label=label)
+
+    goodput_axes.set_xscale('log')
+    goodput_axes.set_ylabel("Goodput (Mbps)", size=20)
+    delay_axes.set_ylabel("95th %ile Queueing\nDelay (ms)", size=20)
+    delay_axes.set_xlabel("Loss Rate (%) - Log Scale", size=20)
+
+    apply_axes_formatting(goodput_axes, deduplicate_xmark_ticks(xmark_ticks))
+    apply_axes_formatting(delay_axes, deduplicate_xmark_ticks(xmark_ticks))
+    plt.sca(goodput_axes)
+    plot_legend(plt, goodput_axes, fontsize=10)
+
+    save_figure(plt, name="figures/experiment5.png")
+
+
+def make_experiment6_figure(logfile):
+    """Generate high quality plot of data for Experiment 6.
+
+    Experiment 6 looks at latency sensitive workloads instead of a bulk
+    transfer: the flow completion time of fixed-size flows, and the latency of
+    requests sent at a fixed rate. The median and 99th percentile of each are
+    plotted against the loss rate, for CUBIC and BBR.
+
+    The logfile is a CSV of the format [congestion_control, loss_rate, goodput, rtt, capacity, specified_bw, ...]
+    """
+    results = parse_results_csv(logfile, group_by=["workload"])
+    workloads = [workload for workload in ['flows', 'rpc'] if any(key[1] == workload for key in results)]
+    if not workloads:
+        debug_print_warn("No flows or rpc results in " + logfile)
+        return
+    xmark_ticks = get_loss_percent_xmark_ticks(results)
+    debug_print_verbose("--- Generating figures for experiment 6")
+
+    fig_width = 8
+    fig_height = 4.5 * len(workloads)
+    fig, all_axes = plt.subplots(len(workloads), 1, sharex=True, figsize=(fig_width, fig_height), squeeze=False)
+    matplotlib.rcParams.update({'figure.autolayout': True})
+
+    y_labels = {'flows': "Flow Completion\nTime (ms) - Log Scale", 'rpc': "Request Latency\n(ms) - Log Scale"}
+    for workload, axes in zip(workloads, all_axes[:, 0]):
+        for cc, color, marker, name in [('cubic', 'b', 'o', 'CUBIC'), ('bbr', 'r', 'x', 'BBR')]:
+            value = results.get((cc, workload))
+            if not value:
+                continue
+            for percentile, linestyle in [('50', 'solid'), ('99', 'dashed')]:
+                plot_with_error_band(axes, value, 'latency_p' + percentile, color=color, linestyle=linestyle,
+                                     marker=marker, markersize=7, label='%s (p%s)' % (name, percentile))
+        axes.set_xscale('log')
+        axes.set_yscale('log')
+        axes.set_ylabel(y_labels[workload], size=16)
+        apply_axes_formatting(axes, deduplicate_xmark_ticks(xmark_ticks))
+
+    all_axes[-1, 0].set_xlabel("Loss Rate (%) - Log Scale", size=20)
+    plt.sca(all_axes[0, 0])
+    plot_legend(plt, all_axes[0, 0], fontsize=10)
+
+    save_figure(plt, name="figures/experiment6.png")
+
+
+# Axis labels of the metrics that can be compared with bbr_compare.py.
+METRIC_AXIS_LABELS = {
+    "goodput_Mbps": "Goodput (Mbps)",
+    "queue_delay_p95_ms": "95th %ile Queueing\nDelay (ms)",
+    "signal_delay_p95_ms": "95th %ile Signal\nDelay (ms)",
+}
+
+
+def make_comparison_figure(comparisons, name="figures/comparison.png"):
+    """Plot baseline versus candidate results compared by bbr_compare.py.
+
+    Every compared metric is plotted against the loss rate in its own subplot.
+    Baseline curves are solid and candidate curves dashed, in the same color,
+    with bands over the bootstrap confidence intervals of their repeated
+    trials; regressed points are circled in black.
+
+    comparisons: list of (metric, points) as returned by bbr_compare.compare_metric.
+    """
+    fig_width = 8
+    fig_height = 4.5 * len(comparisons)
+    fig, all_axes = plt.subplots(len(comparisons), 1, sharex=True, figsize=(fig_width, fig_height),
+                                 squeeze=False)
+    debug_print_verbose("--- Generating comparison figure")
+
+    # Bootstrap the baseline and candidate trials of all points at once.
+    all_points = [point for _, points in comparisons for point in points]
+    _, lows, highs = bootstrap_confidence_intervals(
+        [point[side + "_values"] for point in all_points for side in ["baseline", "candidate"]])
+    intervals = {}
+    for index, point in enumerate(all_points):
+        intervals[id(point), "baseline"] = (lows[2 * index], highs[2 * index])
+        intervals[id(point), "candidate"] = (lows[2 * index + 1], highs[2 * index + 1])
+
+    xmark_ticks = []
+    for (metric, points), axes in zip(comparisons, all_axes[:, 0]):
+        curves = {}
+        for point in points:
+            curves.setdefault(point["key"][:-1], []).append(point)
+        cubic_keys = sorted([key for key in curves if key[0] == 'cubic'])
+        other_keys = sorted([key for key in curves if key[0] != 'cubic'])
+        for keys, color_map in [(cubic_keys, plt.cm.Blues), (other_keys, plt.cm.Reds)]:
+            for index, key in enumerate(keys):
+                curve = sorted(curves[key], key=lambda point: point["key"][-1])
+                loss = [point["key"][-1] * 100 for point in curve]
+                xmark_ticks += loss
+                color = color_map(0.4 + 0.6 * (index + 1) / float(len(keys)))
+                label = describe_key(key, CONFIG_COLUMNS[:-1])
+                axes.plot(loss, [point["baseline"] for point in curve], color=color, linestyle='solid',
+                          marker='o', markersize=5, label=label + ' (baseline)')
+                axes.plot(loss, [point["candidate"] for point in curve], color=color, linestyle='dashed',
+                          marker='x', markersize=7, label=label + ' (candidate)')
+                for side in ["baseline", "candidate"]:
+                    axes.fill_between(loss, [intervals[id(point), side][0] for point in curve],
+                                      [intervals[id(point), side][1] for point in curve], color=color,
+                                      alpha=0.15, linewidth=0)
+                regressed = [point for point in curve if point["regressed"]]
+                axes.plot([point["key"][-1] * 100 for point in regressed],
+                          [point["candidate"] for point in regressed], linestyle='none', marker='o',
+                          markersize=14, markerfacecolor='none', markeredgecolor='black')
+        axes.set_xscale('log')
+        axes.set_ylabel(METRIC_AXIS_LABELS.get(metric, metric), size=16)
+
+    for axes in all_axes[:, 0]:
+        apply_axes_formatting(axes, deduplicate_xmark_ticks(xmark_ticks))
+    all_axes[-1, 0].set_xlabel("Loss Rate (%) - Log Scale", size=16)
+    plt.sca(all_axes[0, 0])
+    plot_legend(plt, all_axes[0, 0], fontsize=8)
+
+    save_figure(plt, name=name)
+
+
+def _timeseries_color(label, index):
+    """Return the plot color of a time series, following the CUBIC blue / BBR red convention."""
+    if 'cubic' in label.lower():
+        return plt.cm.Blues(0.9 - 0.2 * (index % 3))
+    if 'bbr' in label.lower():
+        return plt.cm.Reds(0.9 - 0.2 * (index % 3))
+    return 'C%d' % (index % 10)
+
+
+def make_uplink_timeseries_figure(uplink_logs, labels=None, name="figures/uplink_timeseries.png",
+                                  bin_ms=100, max_points=1000):
+    """Plot throughput and queueing delay against time from Mahimahi uplink logs.
+
+    One trial is plotted together with the link capacity; several trials (e.g.
+    one per congestion control) are overlaid. Throughput is binned in bin_ms
+    intervals; queueing delay is plotted per packet. Both series are
+    downsampled to at most max_points points with LTTB so that logs of
+    millions of packets render quickly into small figures.
+
+    uplink_logs: list of uplink log files written by bbr_experiment.py --uplink_log.
+    labels: legend label of each log. Defaults to the file names.
+    """
+    if labels is None:
+        labels = [os.path.basename(uplink_log) for uplink_log in uplink_logs]
+
+    fig_width = 10
+    fig_height = 8
+    fig, (throughput_axes, delay_axes) = plt.subplots(2, 1, sharex=True, figsize=(fig_width, fig_height))
+    debug_print_verbose("--- Generating uplink time series figure")
+
+    for index, (uplink_log, label) in enumerate(zip(uplink_logs, labels)):
+        debug_print_verbose("Parsing uplink log " + uplink_log)
+        log = parse_uplink_log(uplink_log)
+        bins = bin_uplink_log(log, bin_ms)
+        color = _timeseries_color(label, index)
+
+        if len(uplink_logs) == 1:
+            time_secs, capacity = largest_triangle_three_buckets(bins["time_secs"], bins["capacity_Mbps"],
+                                                                 max_points)
+            throughput_axes.fill_between(time_secs, capacity, color='lightgray', linewidth=0,
+                                         label='Capacity')
+        time_secs, throughput = largest_triangle_three_buckets(bins["time_secs"], bins["throughput_Mbps"],
+                                                               max_points)
+        throughput_axes.plot(time_secs, throughput, color=color, linewidth=1, label=label)
+
+        time_secs, delay = largest_triangle_three_buckets(log.departure_ms / 1000.0, log.departure_delay_ms,
+                                                          max_points)
+        delay_axes.plot(time_secs, delay, color=color, linewidth=1, label=label)
+
+    throughput_axes.set_ylabel("Throughput (Mbps)\n%d ms bins" % bin_ms, size=16)
+    delay_axes.set_ylabel("Queueing Delay (ms)", size=16)
+    delay_axes.set_xlabel("Time (s)", size=16)
+    throughput_axes.set_ylim(bottom=0)
+    delay_axes.set_ylim(bottom=0)
+    plt.sca(throughput_axes)
+    plot_legend(plt, throughput_axes, fontsize=10)
+
+    save_figure(plt, name=name)
+
+
+def _parse_args():
+    """Parse plotting options from the commandline."""
+    parser = argparse.ArgumentParser(
+        description="Plot all experiment figures, or time series of the given uplink logs.")
+    parser.add_argument('--uplink_logs', dest='uplink_logs', nargs='+', type=str,
+                        help="Plot throughput and queueing delay over time from these Mahimahi uplink logs.",
+                        default=None)
+    parser.add_argument('--labels', dest='labels', nargs='+', type=str,
+                        help="Legend label of each uplink log, e.g. the congestion control.",
+                        default=None)
+    parser.add_argument('--bin_ms', dest='bin_ms', type=int,
+                        help="Throughput bin size in ms.",
+                        default=100)
+    parser.add_argument('--max_points', dest='max_points', type=int,
+                        help="Maximum number of points plotted per series.",
+                        default=1000)
+    parser.add_argument('--output', dest='output', type=str,
+                        help="File to save the uplink time series figure to.",
+                        default="figures/uplink_timeseries.png")
+    args = parser.parse_args()
+    if args.labels and args.uplink_logs and len(args.labels) != len(args.uplink_logs):
+        parser.error("--labels must name each of the --uplink_logs")
+    return args
+
+
 def main():
     """Plot all figures."""
+    args = _parse_args()
     debug_print_verbose('Generating Plots')
 
     if not os.path.exists('figures'):
         os.makedirs('figures')
 
+    if args.uplink_logs:
+        make_uplink_timeseries_figure(args.uplink_logs, args.labels, args.output,
+                                      args.bin_ms, args.max_points)
+        return
+
     make_figure_8_plot('data/figure8.csv')
     make_experiment1_figure('data/experiment1.csv')
     make_experiment2_figure('data/experiment2.csv')
     make_experiment3_figure('data/experiment3.csv')
     make_experiment4_figure('data/experiment4.csv')
+    # Experiments 5 and 6 are optional, only plot them when their data is available.
+    if os.path.exists('data/experiment5.csv'):
+        make_experiment5_figure('data/experiment5.csv')
+    if os.path.exists('data/experiment6.csv'):
+        make_experiment6_figure('data/experiment6.csv')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,210 @@
+#!/usr/bin/python
+"""CPU pinning and resource accounting of the processes of a trial.
+
+The server, the client and the Mahimahi emulator processes of a trial can be
+pinned to CPU sets so that scheduling noise of a busy host does not leak into
+the results. While a trial runs, a ProcessTreeMonitor samples the CPU time,
+context switches and peak resident set size of every process of the trial
+from /proc, so that CPU-bound trials can be told apart in the results.
+"""
+from bbr_logging import debug_print_verbose
+import os
+import subprocess
+import threading
+
+# Roles the processes of a trial are accounted under. The reverse sender of
+# --reverse_traffic runs next to the server, but is accounted apart from it so
+# that the server columns mean the same with and without reverse traffic.
+PROCESS_ROLES = ["server", "client", "emulator", "reverse_sender"]
+
+# Usage counters recorded per role, as result column suffixes.
+USAGE_COUNTERS = ["cpu_secs", "ctxt_switches", "nonvol_ctxt_switches", "peak_rss_kb"]
+
+CLOCK_TICKS_PER_SEC = os.sysconf(os.sysconf_names['SC_CLK_TCK']) if hasattr(os, 'sysconf') else 100
+
+
+def parse_cpu_list(cpu_list):
+    """Parse a CPU list such as "0-2,4" into a sorted list of CPU numbers."""
+    cpus = set()
+    for part in cpu_list.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+
+def set_cpu_affinity(pid, cpus):
+    """Pin the process pid (0 for the calling process) to the given list of CPUs.
+
+    Uses os.sched_setaffinity, or taskset on Python versions that lack it.
+    Children forked afterwards inherit the affinity.
+    """
+    if not cpus:
+        return
+    debug_print_verbose("Pinning process %d to CPUs %s" % (pid or os.getpid(), cpus))
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(pid, cpus)
+    else:
+        subprocess.check_call(["taskset", "-pc", ','.join(str(cpu) for cpu in cpus), str(pid or os.getpid())],
+                              stdout=open(os.devnull, 'w'))
+
+
+def read_process_usage(pid):
+    """Return the usage of a process read from /proc, or None if it has exited.
+
+    The usage is a dictionary with the process name (comm), parent pid (ppid)
+    and the USAGE_COUNTERS of the process.
+    """
+    try:
+        with open("/proc/%d/stat" % pid, 'r') as stat_file:
+            stat = stat_file.read()
+        with open("/proc/%d/status" % pid, 'r') as status_file:
+            status = status_file.read()
+    except (IOError, OSError):
+        return None
+    # The process name is in parentheses and may itself contain spaces.
+    comm = stat[stat.index('(') + 1:stat.rindex(')')]
+    fields = stat[stat.rindex(')') + 2:].split()
+    usage = {
+        "comm": comm,
+        "ppid": int(fields[1]),
+        "cpu_secs": (int(fields[11]) + int(fields[12])) / float(CLOCK_TICKS_PER_SEC),
+        "ctxt_switches": 0,
+        "nonvol_ctxt_switches": 0,
+        "peak_rss_kb": 0,
+    }
+    for line in status.splitlines():
+        name, _, value = line.partition(':')
+        if name == "voluntary_ctxt_switches":
+            usage["ctxt_switches"] += int(value)
+        elif name == "nonvoluntary_ctxt_switches":
+            usage["ctxt_switches"] += int(value)
+            usage["nonvol_ctxt_switches"] = int(value)
+        elif name == "VmHWM":
+            usage["peak_rss_kb"] = int(value.split()[0])
+    return usage
+
+
+def _parent_pids():
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/%s/stat" % entry, 'r') as stat_file:
+                stat = stat_file.read()
+        except (IOError, OSError):
+            continue
+        parents[int(entry)] = int(stat[stat.rindex(')') + 2:].split()[1])
+    return parents
+
+
+def descendant_pids(pid):
+    """Return the pids of all running descendants of the process pid."""
+    children = {}
+    for child, parent in _parent_pids().items():
+        children.setdefault(parent, []).append(child)
+    descendants = []
+    tree = list(children.get(pid, []))
+    while tree:
+        child = tree.pop()
+        descendants.append(child)
+        tree.extend(children.get(child, []))
+    return descendants
+
+
+class ProcessTreeMonitor(threading.Thread):
+    """Periodically sample the usage of process trees and account it per role.
+
+    The last sample of every process is kept, so a process that exits is
+    accounted with its usage at most one interval before it exited.
+    """
+
+    def __init__(self, interval_secs=1.0):
+        """Initialize a monitor sampling every interval_secs seconds."""
+        super(ProcessTreeMonitor, self).__init__()
+        self.daemon = True
+        self.interval_secs = interval_secs
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        # Root pid -> function (comm, is_root) returning the role of a process of the tree, or None.
+        self.roots = {}
+        # Pid -> (role, last usage sample).
+        self.samples = {}
+        # Pid -> usage sample taken when its tree was watched, not accounted.
+        self.baselines = {}
+
+    def watch(self, pid, role_fn, baseline=False):
+        """Account the process pid and all its descendants under the roles given by role_fn(comm, is_root).
+
+        baseline: If set, the CPU time and context switches the processes of
+        the tree already used are not accounted, e.g. for processes spawned
+        ahead of the trial. Their peak RSS still covers their whole life.
+        """
+        baselines = {}
+        if baseline:
+            for tree_pid in [pid] + descendant_pids(pid):
+                usage = read_process_usage(tree_pid)
+                if usage is not None:
+                    baselines[tree_pid] = usage
+        with self.lock:
+            self.roots[pid] = role_fn
+            self.baselines.update(baselines)
+
+    def sample(self):
+        """Sample the usage of all watched processes once."""
+        parents = _parent_pids()
+        children = {}
+        for pid, ppid in parents.items():
+            children.setdefault(ppid, []).append(pid)
+        with self.lock:
+            for root, role_fn in self.roots.items():
+                tree = [root]
+                while tree:
+                    pid = tree.pop()
+                    tree.extend(children.get(pid, []))
+                    usage = read_process_usage(pid)
+                    if usage is None:
+                        continue
+                    role = role_fn(usage["comm"], pid == root)
+                    if role is not None:
+                        self.samples[pid] = (role, usage)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.sample()
+            self.stop_event.wait(self.interval_secs)
+
+    def stop(self):
+        """Take a last sample and stop monitoring."""
+        self.stop_event.set()
+        self.join()
+        self.sample()
+
+    def usage_by_role(self):
+        """Return a dictionary of result column -> value, e.g. server_cpu_secs, for every role.
+
+        CPU time and context switches are summed over the processes of a
+        role; the peak RSS is the largest of them.
+        """
+        usage = {}
+        for role in PROCESS_ROLES:
+            for counter in USAGE_COUNTERS:
+                usage["%s_%s" % (role, counter)] = 0
+        with self.lock:
+            for pid, (role, sample) in self.samples.items():
+                baseline = self.baselines.get(pid)
+                for counter in USAGE_COUNTERS:
+                    column = "%s_%s" % (role, counter)
+                    if counter == "peak_rss_kb":
+                        usage[column] = max(usage[column], sample[counter])
+                    elif baseline:
+                        usage[column] += sample[counter] - baseline[counter]
+                    else:
+                        usage[column] += sample[counter]
+        return dict((column, round(value, 2)) for column, value in usage.items())
@@ -0,0 +1,182 @@
+#!/usr/bin/python
+"""Reading and writing of the CSV result rows produced by bbr experiments.
+
+Every trial appends a single row to the experiment CSV file. The first line of
+the file is a header naming the columns. Older result files only contain the
+first six columns; readers must tolerate missing columns and fill them in with
+empty or default values. Configuration columns that are missing, or left empty
+by older writers, read as the defaults of the driver (see
+MISSING_COLUMN_DEFAULTS), so that older rows line up with new ones of the same
+configuration, e.g. the committed data/figure8.csv. A trial that keeps
+failing in a sweep gets a row with only its configuration and its status, see
+trial_succeeded.
+"""
+import csv
+import os
+
+
+# Ordered list of columns in a result row. New columns are only ever appended
+# so that older result files remain readable.
+RESULT_COLUMNS = [
+    "congestion_control",
+    "loss_rate",
+    "goodput_Mbps",
+    "rtt_ms",
+    "bandwidth_Mbps",
+    "specified_bw_Mbps",
+    "queue",
+    "queue_size",
+    "queue_limit",
+    "queue_delay_p95_ms",
+    "signal_delay_p95_ms",
+    "server_cpu_secs",
+    "server_ctxt_switches",
+    "server_nonvol_ctxt_switches",
+    "server_peak_rss_kb",
+    "client_cpu_secs",
+    "client_ctxt_switches",
+    "client_nonvol_ctxt_switches",
+    "client_peak_rss_kb",
+    "emulator_cpu_secs",
+    "emulator_ctxt_switches",
+    "emulator_nonvol_ctxt_switches",
+    "emulator_peak_rss_kb",
+    "workload",
+    "completed_transfers",
+    "latency_p50_ms",
+    "latency_p95_ms",
+    "latency_p99_ms",
+    "socket_buffer_bytes",
+    "client_sndbuf_bytes",
+    "server_rcvbuf_bytes",
+    "status",
+    "downlink_loss_rate",
+    "reverse_traffic",
+    "reverse_cc",
+    "downlink_bandwidth_Mbps",
+    "downlink_goodput_Mbps",
+    "downlink_queue_delay_p95_ms",
+    "downlink_signal_delay_p95_ms",
+    "reverse_sender_cpu_secs",
+    "reverse_sender_ctxt_switches",
+    "reverse_sender_nonvol_ctxt_switches",
+    "reverse_sender_peak_rss_kb",
+]
+
+# Values of configuration columns missing from older result files, or left
+# empty in their rows: their trials ran a bulk transfer through an infinite
+# queue, without downlink loss or reverse traffic. Other missing columns are
+# empty.
+MISSING_COLUMN_DEFAULTS = {
+    "queue": "infinite",
+    "workload": "bulk",
+    "downlink_loss_rate": 0.0,
+    "reverse_traffic": "none",
+}
+
+# Values of the status column. Rows written before the column existed have an
+# empty status and are successful trials.
+STATUS_OK = "ok"
+STATUS_FAILED = "failed"
+STATUS_TIMEOUT = "timeout"
+
+# Columns that hold numbers. Other columns are kept as strings.
+NUMERIC_COLUMNS = set([
+    "loss_rate",
+    "goodput_Mbps",
+    "rtt_ms",
+    "bandwidth_Mbps",
+    "specified_bw_Mbps",
+    "queue_delay_p95_ms",
+    "signal_delay_p95_ms",
+    "server_cpu_secs",
+    "server_ctxt_switches",
+    "server_nonvol_ctxt_switches",
+    "server_peak_rss_kb",
+    "client_cpu_secs",
+    "client_ctxt_switches",
+    "client_nonvol_ctxt_switches",
+    "client_peak_rss_kb",
+    "emulator_cpu_secs",
+    "emulator_ctxt_switches",
+    "emulator_nonvol_ctxt_switches",
+    "emulator_peak_rss_kb",
+    "completed_transfers",
+    "latency_p50_ms",
+    "latency_p95_ms",
+    "latency_p99_ms",
+    "socket_buffer_bytes",
+    "client_sndbuf_bytes",
+    "server_rcvbuf_bytes",
+    "downlink_loss_rate",
+    "downlink_bandwidth_Mbps",
+    "downlink_goodput_Mbps",
+    "downlink_queue_delay_p95_ms",
+    "downlink_signal_delay_p95_ms",
+    "reverse_sender_cpu_secs",
+    "reverse_sender_ctxt_switches",
+    "reverse_sender_nonvol_ctxt_switches",
+    "reverse_sender_peak_rss_kb",
+])
+
+
+def format_result_row(result):
+    """Format a result dictionary as a single CSV line (without newline).
+
+    result: dictionary of column name -> value. Missing columns are left empty.
+    """
+    values = []
+    for column in RESULT_COLUMNS:
+        value = result.get(column)
+        values.append('' if value is None else str(value))
+    return ', '.join(values)
+
+
+def format_header_row():
+    """Return the CSV header line (without newline)."""
+    return ', '.join(RESULT_COLUMNS)
+
+
+def append_result(output_file, result):
+    """Append a result row to output_file, writing the header if the file is new."""
+    write_header = not os.path.exists(output_file)
+    with open(output_file, 'a') as output:
+        if write_header:
+            output.write(format_header_row() + "\n")
+        output.write(format_result_row(result) + "\n")
+
+
+def trial_succeeded(row):
+    """Return whether a result row holds the measurements of a trial, rather than marking its failure."""
+    return row.get("status", '') in ('', STATUS_OK)
+
+
+def _convert_value(column, value):
+    value = value.strip()
+    if column in NUMERIC_COLUMNS and value:
+        return float(value)
+    return value
+
+
+def read_results(input_csv_file):
+    """Read a result CSV file into a list of dictionaries, one per row.
+
+    Columns named in the header are used as the dictionary keys. Numeric
+    columns are converted to floats. Columns missing from the file, or empty
+    in a row, are set to their MISSING_COLUMN_DEFAULTS value, or an empty
+    string.
+    """
+    rows = []
+    with open(input_csv_file, 'r') as csvfile:
+        reader = csv.reader(csvfile, skipinitialspace=True)
+        header = [column.strip() for column in next(reader)]
+        for record in reader:
+            if not record:
+                continue
+            row = dict((column, MISSING_COLUMN_DEFAULTS.get(column, '')) for column in RESULT_COLUMNS)
+            for column, value in zip(header, record):
+                value = _convert_value(column, value)
+                if value != '' or column not in MISSING_COLUMN_DEFAULTS:
+                    row[column] = value
+            rows.append(row)
+    return rows
@@ -0,0 +1,983 @@
+#!/usr/bin/python
+"""Discrete-event simulator of a single BBR or CUBIC flow over a Mahimahi link.
+
+The simulator models the same setup as bbr_experiment.py: a bulk sender inside
+mm-link (bottleneck queue drained by a Mahimahi trace), followed by mm-loss on
+the uplink and mm-delay for half of the RTT in each direction. It accepts the
+same experimental parameters as the driver and appends results in the same
+row format, so simulated and emulated runs can be plotted and compared with
+the same tools.
+
+Time advances in ticks of 1/20th of the RTT (and at least one millisecond,
+the resolution of Mahimahi traces). Packets are counted individually through
+the bottleneck queue, the loss process and ACKs, but are batched per tick of
+sending time, which keeps a 60 second trial well under a second of run time.
+
+The BBR model follows the state machine in module/tcp_bbr.c (Startup, Drain,
+ProbeBW gain cycling, ProbeRTT and long-term bandwidth sampling). The CUBIC
+model follows net/ipv4/tcp_cubic.c without HyStart. Both use a simple model of
+the TCP core with fast recovery and retransmission timeouts.
+"""
+
+import argparse
+from bbr_experiment import MTU_BYTES, check_queue_size, resolve_queue_limit
+from bbr_logging import debug_print, debug_print_verbose, stdout_print
+from bbr_metrics import write_live_stats
+from bbr_results import append_result, format_result_row, STATUS_OK
+from collections import deque
+import math
+import random
+import time
+
+
+# TCP congestion avoidance states, with the same ordering as the kernel.
+TCP_CA_OPEN = 0
+TCP_CA_RECOVERY = 3
+TCP_CA_LOSS = 4
+
+TCP_INIT_CWND = 10
+
+# Minimum and maximum retransmission timeouts, in ms.
+TCP_RTO_MIN_MS = 200
+TCP_RTO_MAX_MS = 120000
+
+# Number of simulation ticks per RTT.
+TICKS_PER_RTT = 20
+
+# Queue disciplines supported by the simulator.
+SIM_QUEUE_TYPES = ['infinite', 'droptail']
+
+
+class Flags(object):
+    """Dictionary object to store parsed flags."""
+
+    TIME = "time"
+    LOSS = "loss"
+    CC = "congestion_control"
+    RTT = "rtt"
+    BW = "bottleneck_bandwidth"
+    TUP = "trace_uplink"
+    TDOWN = "trace_downlink"
+    QUEUE = "queue"
+    QUEUE_SIZE = "queue_size"
+    SEED = "seed"
+    LIVE_STATS_FILE = "live_stats_file"
+    OUTPUT_FILE = "output_file"
+    parsed_args = None
+
+
+class RateSample(object):
+    """Delivery rate sample for one ACK, as in the kernel's struct rate_sample."""
+
+    def __init__(self):
+        """Initialize an invalid rate sample."""
+        self.prior_delivered = 0
+        self.delivered = -1
+        self.interval = -1
+        self.rtt = -1
+        self.acked_sacked = 0
+        self.losses = 0
+        self.prior_in_flight = 0
+        self.is_app_limited = False
+
+
+class TcpState(object):
+    """Subset of the kernel's struct tcp_sock that the congestion controls use.
+
+    All windows are in packets, times in ms and rates in packets per ms.
+    """
+
+    def __init__(self, rtt):
+        """Initialize a connection that just completed its handshake."""
+        self.cwnd = TCP_INIT_CWND
+        self.pacing_rate = None
+        self.packets_out = 0
+        self.delivered = 0
+        self.lost = 0
+        self.delivered_ms = 0
+        self.app_limited = 0
+        self.ca_state = TCP_CA_OPEN
+        self.srtt = float(rtt)
+
+    def packets_in_flight(self):
+        """Return the number of packets sent but not yet delivered or marked lost."""
+        return self.packets_out - self.delivered - self.lost
+
+
+class BbrModel(object):
+    """Model of BBR congestion control, following module/tcp_bbr.c."""
+
+    STARTUP = "startup"
+    DRAIN = "drain"
+    PROBE_BW = "probe_bw"
+    PROBE_RTT = "probe_rtt"
+
+    CYCLE_LEN = 8
+    BW_RTTS = CYCLE_LEN + 2
+    MIN_RTT_WIN_MS = 10000
+    PROBE_RTT_MODE_MS = 200
+    # 1.2 Mbit/s in packets per ms.
+    MIN_TSO_RATE = 1200000 / 8.0 / MTU_BYTES / 1000
+    HIGH_GAIN = 2885 / 1000.0 + 1 / 256.0
+    DRAIN_GAIN = 1000 / 2885.0
+    CWND_GAIN = 2.0
+    PACING_GAIN = [5 / 4.0, 3 / 4.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0]
+    CYCLE_RAND = 7
+    CWND_MIN_TARGET = 4
+    FULL_BW_THRESH = 5 / 4.0
+    FULL_BW_CNT = 3
+    LT_INTVL_MIN_RTTS = 4
+    LT_LOSS_THRESH = 50 / 256.0
+    LT_BW_RATIO = 1 / 8.0
+    # 4000 bytes per second in packets per ms.
+    LT_BW_DIFF = 4000 / 8.0 / MTU_BYTES / 1000
+    LT_BW_MAX_RTTS = 48
+
+    def __init__(self, tp, rng):
+        """Initialize BBR state, as bbr_init() does."""
+        self.rng = rng
+        self.prior_cwnd = 0
+        self.tso_segs_goal = 0
+        self.rtt_cnt = 0
+        self.next_rtt_delivered = 0
+        self.prev_ca_state = TCP_CA_OPEN
+        self.packet_conservation = False
+        self.probe_rtt_done_stamp = 0
+        self.probe_rtt_round_done = False
+        self.min_rtt = None
+        self.min_rtt_stamp = 0
+        # Max bw filter, as a list of [round, max bw in that round] pairs.
+        self.bw_rounds = deque()
+        self.max_bw_value = 0
+        self.restore_cwnd = False
+        self.round_start = False
+        self.idle_restart = False
+        self.full_bw = 0
+        self.full_bw_cnt = 0
+        self.cycle_stamp = 0
+        self.cycle_idx = 0
+        self._reset_lt_bw_sampling(tp)
+        self._reset_startup_mode()
+
+        # Initialize pacing rate to: high_gain * init_cwnd / RTT.
+        tp.pacing_rate = 0
+        self._set_pacing_rate(tp, tp.cwnd / max(tp.srtt, 1.0), self.HIGH_GAIN)
+
+    def full_bw_reached(self):
+        """Return whether we estimate that STARTUP filled the pipe."""
+        return self.full_bw_cnt >= self.FULL_BW_CNT
+
+    def max_bw(self):
+        """Return the windowed max recent bandwidth sample."""
+        return self.max_bw_value
+
+    def bw(self):
+        """Return the estimated bandwidth of the path."""
+        return self.lt_bw if self.lt_use_bw else self.max_bw()
+
+    def _set_pacing_rate(self, tp, bw, gain):
+        rate = bw * gain
+        if self.mode != self.STARTUP or rate > tp.pacing_rate:
+            tp.pacing_rate = rate
+
+    def _set_tso_segs_goal(self, tp):
+        min_segs = 1 if tp.pacing_rate < self.MIN_TSO_RATE else 2
+        # tcp_tso_autosize() sizes skbs for ~1ms at the pacing rate, up to 64KB.
+        self.tso_segs_goal = min(max(int(tp.pacing_rate), min_segs), 44)
+
+    def _save_cwnd(self, tp):
+        if self.prev_ca_state < TCP_CA_RECOVERY and self.mode != self.PROBE_RTT:
+            self.prior_cwnd = tp.cwnd
+        else:
+            self.prior_cwnd = max(self.prior_cwnd, tp.cwnd)
+
+    def target_cwnd(self, bw, gain):
+        """Return the cwnd (in packets) needed to keep gain * BDP in flight."""
+        if self.min_rtt is None:
+            return TCP_INIT_CWND
+        cwnd = int(math.ceil(bw * self.min_rtt * gain))
+        cwnd += 3 * self.tso_segs_goal
+        # Reduce delayed ACKs by rounding up cwnd to the next even number.
+        return (cwnd + 1) & ~1
+
+    def _set_cwnd_to_recover_or_restore(self, tp, rs, acked):
+        """Return (use_packet_conservation, cwnd)."""
+        prev_state = self.prev_ca_state
+        state = tp.ca_state
+        cwnd = tp.cwnd
+
+        if rs.losses > 0:
+            cwnd = max(cwnd - rs.losses, 1)
+
+        if state == TCP_CA_RECOVERY and prev_state != TCP_CA_RECOVERY:
+            # Starting 1st round of Recovery, so do packet conservation.
+            self.packet_conservation = True
+            self.next_rtt_delivered = tp.delivered
+            cwnd = tp.packets_in_flight() + acked
+        elif prev_state >= TCP_CA_RECOVERY and state < TCP_CA_RECOVERY:
+            # Exiting loss recovery; restore cwnd saved before recovery.
+            self.restore_cwnd = True
+            self.packet_conservation = False
+        self.prev_ca_state = state
+
+        if self.restore_cwnd:
+            cwnd = max(cwnd, self.prior_cwnd)
+            self.restore_cwnd = False
+
+        if self.packet_conservation:
+            return (True, max(cwnd, tp.packets_in_flight() + acked))
+        return (False, cwnd)
+
+    def _set_cwnd(self, tp, rs, acked, bw, gain):
+        if not acked:
+            return
+
+        conservation, cwnd = self._set_cwnd_to_recover_or_restore(tp, rs, acked)
+        if not conservation:
+            target_cwnd = self.target_cwnd(bw, gain)
+            if self.full_bw_reached():
+                cwnd = min(cwnd + acked, target_cwnd)
+            elif cwnd < target_cwnd or tp.delivered < TCP_INIT_CWND:
+                cwnd = cwnd + acked
+            cwnd = max(cwnd, self.CWND_MIN_TARGET)
+
+        tp.cwnd = cwnd
+        if self.mode == self.PROBE_RTT:
+            tp.cwnd = min(tp.cwnd, self.CWND_MIN_TARGET)
+
+    def _is_next_cycle_phase(self, tp, rs):
+        is_full_length = (tp.delivered_ms - self.cycle_stamp) > self.min_rtt
+        if self.pacing_gain == 1.0:
+            return is_full_length
+
+        inflight = rs.prior_in_flight
+        bw = self.max_bw()
+        if self.pacing_gain > 1.0:
+            return is_full_length and (rs.losses > 0 or
+                                       inflight >= self.target_cwnd(bw, self.pacing_gain))
+        return is_full_length or inflight <= self.target_cwnd(bw, 1.0)
+
+    def _advance_cycle_phase(self, tp):
+        self.cycle_idx = (self.cycle_idx + 1) % self.CYCLE_LEN
+        self.cycle_stamp = tp.delivered_ms
+        self.pacing_gain = self.PACING_GAIN[self.cycle_idx]
+
+    def _update_cycle_phase(self, tp, rs):
+        if self.mode == self.PROBE_BW and not self.lt_use_bw and self._is_next_cycle_phase(tp, rs):
+            self._advance_cycle_phase(tp)
+
+    def _reset_startup_mode(self):
+        self.mode = self.STARTUP
+        self.pacing_gain = self.HIGH_GAIN
+        self.cwnd_gain = self.HIGH_GAIN
+
+    def _reset_probe_bw_mode(self, tp):
+        self.mode = self.PROBE_BW
+        self.pacing_gain = 1.0
+        self.cwnd_gain = self.CWND_GAIN
+        self.cycle_idx = self.CYCLE_LEN - 1 - self.rng.randint(0, self.CYCLE_RAND - 1)
+        self._advance_cycle_phase(tp)
+
+    def _reset_mode(self, tp):
+        if not self.full_bw_reached():
+            self._reset_startup_mode()
+        else:
+            self._reset_probe_bw_mode(tp)
+
+    def _reset_lt_bw_sampling_interval(self, tp):
+        self.lt_last_stamp = tp.delivered_ms
+        self.lt_last_delivered = tp.delivered
+        self.lt_last_lost = tp.lost
+        self.lt_rtt_cnt = 0
+
+    def _reset_lt_bw_sampling(self, tp):
+        self.lt_bw = 0
+        self.lt_use_bw = False
+        self.lt_is_sampling = False
+        self._reset_lt_bw_sampling_interval(tp)
+
+    def _lt_bw_interval_done(self, tp, bw):
+        if self.lt_bw:
+            diff = abs(bw - self.lt_bw)
+            if diff <= self.LT_BW_RATIO * self.lt_bw or diff <= self.LT_BW_DIFF:
+                # All criteria are met; estimate we're policed.
+                self.lt_bw = (bw + self.lt_bw) / 2.0
+                self.lt_use_bw = True
+                self.pacing_gain = 1.0
+                self.lt_rtt_cnt = 0
+                return
+        self.lt_bw = bw
+        self._reset_lt_bw_sampling_interval(tp)
+
+    def _lt_bw_sampling(self, tp, rs):
+        if self.lt_use_bw:
+            if self.mode == self.PROBE_BW and self.round_start:
+                self.lt_rtt_cnt += 1
+                if self.lt_rtt_cnt >= self.LT_BW_MAX_RTTS:
+                    self._reset_lt_bw_sampling(tp)
+                    self._reset_probe_bw_mode(tp)
+            return
+
+        if not self.lt_is_sampling:
+            if not rs.losses:
+                return
+            self._reset_lt_bw_sampling_interval(tp)
+            self.lt_is_sampling = True
+
+        if rs.is_app_limited:
+            self._reset_lt_bw_sampling(tp)
+            return
+
+        if self.round_start:
+            self.lt_rtt_cnt += 1
+        if self.lt_rtt_cnt < self.LT_INTVL_MIN_RTTS:
+            return
+        if self.lt_rtt_cnt > 4 * self.LT_INTVL_MIN_RTTS:
+            self._reset_lt_bw_sampling(tp)
+            return
+
+        if not rs.losses:
+            return
+
+        lost = tp.lost - self.lt_last_lost
+        delivered = tp.delivered - self.lt_last_delivered
+        if not delivered or lost < self.LT_LOSS_THRESH * delivered:
+            return
+
+        interval = tp.delivered_ms - self.lt_last_stamp
+        if interval < 1:
+            return
+        self._lt_bw_interval_done(tp, delivered / float(interval))
+
+    def _update_bw(self, tp, rs):
+        self.round_start = False
+        if rs.delivered < 0 or rs.interval <= 0:
+            return
+
+        # See if we've reached the next RTT.
+        if rs.prior_delivered >= self.next_rtt_delivered:
+            self.next_rtt_delivered = tp.delivered
+            self.rtt_cnt += 1
+            self.round_start = True
+            self.packet_conservation = False
+
+        self._lt_bw_sampling(tp, rs)
+
+        bw = rs.delivered / float(rs.interval)
+        if not rs.is_app_limited or bw >= self.max_bw():
+            if self.bw_rounds and self.bw_rounds[-1][0] == self.rtt_cnt:
+                self.bw_rounds[-1][1] = max(self.bw_rounds[-1][1], bw)
+            else:
+                self.bw_rounds.append([self.rtt_cnt, bw])
+            if self.bw_rounds[0][0] <= self.rtt_cnt - self.BW_RTTS:
+                while self.bw_rounds[0][0] <= self.rtt_cnt - self.BW_RTTS:
+                    self.bw_rounds.popleft()
+                self.max_bw_value = max(bw for _, bw in self.bw_rounds)
+            elif bw > self.max_bw_value:
+                self.max_bw_value = bw
+
+    def _check_full_bw_reached(self, rs):
+        if self.full_bw_reached() or not self.round_start or rs.is_app_limited:
+            return
+        if self.max_bw() >= self.full_bw * self.FULL_BW_THRESH:
+            self.full_bw = self.max_bw()
+            self.full_bw_cnt = 0
+            return
+        self.full_bw_cnt += 1
+
+    def _check_drain(self, tp):
+        if self.mode == self.STARTUP and self.full_bw_reached():
+            self.mode = self.DRAIN
+            self.pacing_gain = self.DRAIN_GAIN
+            self.cwnd_gain = self.HIGH_GAIN
+        if self.mode == self.DRAIN and tp.packets_in_flight() <= self.target_cwnd(self.max_bw(), 1.0):
+            self._reset_probe_bw_mode(tp)
+
+    def _update_min_rtt(self, tp, rs, now):
+        filter_expired = now > self.min_rtt_stamp + self.MIN_RTT_WIN_MS
+        if rs.rtt >= 0 and (self.min_rtt is None or rs.rtt <= self.min_rtt or filter_expired):
+            self.min_rtt = max(rs.rtt, 1)
+            self.min_rtt_stamp = now
+
+        if filter_expired and not self.idle_restart and self.mode != self.PROBE_RTT:
+            self.mode = self.PROBE_RTT
+            self.pacing_gain = 1.0
+            self.cwnd_gain = 1.0
+            self._save_cwnd(tp)
+            self.probe_rtt_done_stamp = 0
+
+        if self.mode == self.PROBE_RTT:
+            # Ignore low rate samples during this mode.
+            tp.app_limited = (tp.delivered + tp.packets_in_flight()) or 1
+            if not self.probe_rtt_done_stamp and tp.packets_in_flight() <= self.CWND_MIN_TARGET:
+                self.probe_rtt_done_stamp = now + self.PROBE_RTT_MODE_MS
+                self.probe_rtt_round_done = False
+                self.next_rtt_delivered = tp.delivered
+            elif self.probe_rtt_done_stamp:
+                if self.round_start:
+                    self.probe_rtt_round_done = True
+                if self.probe_rtt_round_done and now > self.probe_rtt_done_stamp:
+                    self.min_rtt_stamp = now
+                    self.restore_cwnd = True
+                    self._reset_mode(tp)
+        self.idle_restart = False
+
+    def on_ack(self, tp, rs, now):
+        """Update the model and set cwnd and pacing rate, as bbr_main() does."""
+        self._update_bw(tp, rs)
+        self._update_cycle_phase(tp, rs)
+        self._check_full_bw_reached(rs)
+        self._check_drain(tp)
+        self._update_min_rtt(tp, rs, now)
+
+        bw = self.bw()
+        self._set_pacing_rate(tp, bw, self.pacing_gain)
+        self._set_tso_segs_goal(tp)
+        self._set_cwnd(tp, rs, rs.acked_sacked, bw, self.cwnd_gain)
+
+    def ssthresh(self, tp):
+        """Entering loss recovery, so save cwnd for when we exit or undo recovery."""
+        self._save_cwnd(tp)
+
+    def set_state(self, tp, new_state):
+        """Handle a change of TCP congestion avoidance state."""
+        if new_state == TCP_CA_LOSS:
+            rs = RateSample()
+            rs.losses = 1
+            self.prev_ca_state = TCP_CA_LOSS
+            self.full_bw = 0
+            self.round_start = True
+            self._lt_bw_sampling(tp, rs)
+
+    def exit_recovery(self, tp):
+        """Leave loss recovery. BBR restores its cwnd in on_ack()."""
+        pass
+
+
+class CubicModel(object):
+    """Model of CUBIC congestion control, following net/ipv4/tcp_cubic.c without HyStart."""
+
+    BETA = 717 / 1024.0
+    C = 0.4
+
+    def __init__(self, tp, rng):
+        """Initialize CUBIC state."""
+        self.ssthresh_value = float('inf')
+        self.last_max_cwnd = 0
+        self.epoch_start = None
+        self.origin_point = 0
+        self.k = 0
+        self.delay_min = None
+        self.tcp_cwnd = 0
+        self.ack_cnt = 0
+
+    def _update(self, tp, acked, now):
+        cwnd = tp.cwnd
+        self.ack_cnt += acked
+        if self.epoch_start is None:
+            self.epoch_start = now
+            self.ack_cnt = acked
+            self.tcp_cwnd = cwnd
+            if self.last_max_cwnd <= cwnd:
+                self.k = 0
+                self.origin_point = cwnd
+            else:
+                self.k = ((self.last_max_cwnd - cwnd) / self.C) ** (1 / 3.0)
+                self.origin_point = self.last_max_cwnd
+
+        # Cubic function of the time since the start of the epoch, in seconds.
+        t = (now - self.epoch_start + (self.delay_min or 0)) / 1000.0
+        target = self.origin_point + self.C * (t - self.k) ** 3
+        if target > cwnd:
+            cnt = cwnd / (target - cwnd)
+        else:
+            cnt = 100 * cwnd
+        if self.last_max_cwnd == 0 and cnt > 20:
+            cnt = 20
+
+        # TCP friendliness: grow at least as fast as Reno would.
+        delta = cwnd * 8 * (1 + self.BETA) / 3 / (1 - self.BETA) / 8
+        while self.ack_cnt > delta:
+            self.ack_cnt -= delta
+            self.tcp_cwnd += 1
+        if self.tcp_cwnd > cwnd:
+            cnt = min(cnt, cwnd / (self.tcp_cwnd - cwnd))
+        return max(cnt, 2)
+
+    def on_ack(self, tp, rs, now):
+        """Grow cwnd in slow start or congestion avoidance."""
+        if rs.rtt > 0:
+            self.delay_min = rs.rtt if self.delay_min is None else min(self.delay_min, rs.rtt)
+        if tp.ca_state == TCP_CA_RECOVERY:
+            # Proportional rate reduction holds cwnd at ssthresh during recovery.
+            return
+
+        acked = rs.acked_sacked
+        if tp.cwnd < self.ssthresh_value:
+            slow_start = min(acked, max(self.ssthresh_value - tp.cwnd, 0))
+            tp.cwnd += slow_start
+            acked -= slow_start
+        if acked > 0:
+            tp.cwnd += acked / self._update(tp, acked, now)
+
+    def ssthresh(self, tp):
+        """Multiplicative decrease on loss, with fast convergence."""
+        self.epoch_start = None
+        if tp.cwnd < self.last_max_cwnd:
+            self.last_max_cwnd = tp.cwnd * (1 + self.BETA) / 2
+        else:
+            self.last_max_cwnd = tp.cwnd
+        self.ssthresh_value = max(tp.cwnd * self.BETA, 2)
+        if tp.ca_state == TCP_CA_OPEN:
+            tp.cwnd = self.ssthresh_value
+
+    def set_state(self, tp, new_state):
+        """Handle a change of TCP congestion avoidance state."""
+        if new_state == TCP_CA_LOSS:
+            self.epoch_start = None
+
+    def exit_recovery(self, tp):
+        """Leave loss recovery at ssthresh."""
+        tp.cwnd = self.ssthresh_value
+
+
+CONGESTION_CONTROL_MODELS = {
+    'bbr': BbrModel,
+    'cubic': CubicModel,
+}
+
+
+def load_trace(filename):
+    """Load a Mahimahi trace as a list of delivery opportunities per ms.
+
+    The trace repeats with a period of its last timestamp, as in mm-link.
+    """
+    with open(filename, 'r') as trace:
+        timestamps = [int(line) for line in trace if line.strip()]
+    period = max(timestamps[-1], 1)
+    opportunities = [0] * period
+    for timestamp in timestamps:
+        opportunities[(timestamp - 1) % period] += 1
+    return opportunities
+
+
+def constant_rate_trace(seconds, throughput):
+    """Return delivery opportunities per ms for a constant <throughput>Mbps link."""
+    packets_per_ms = throughput * 1e6 / 8 / MTU_BYTES / 1000
+    opportunities = []
+    accumulated = 0.0
+    for _ in range(int(seconds * 1000)):
+        accumulated += packets_per_ms
+        num_packets = int(accumulated)
+        accumulated -= num_packets
+        opportunities.append(num_packets)
+    return opportunities
+
+
+class Simulation(object):
+    """Single bulk flow over a trace driven bottleneck with random loss."""
+
+    def __init__(self, cong_ctrl, loss, rtt, opportunities, queue_limit_packets=None, seed=None):
+        """Set up a simulation.
+
+        cong_ctrl: 'bbr' or 'cubic'.
+        loss: uplink loss rate as a fraction.
+        rtt: round trip time in ms.
+        opportunities: delivery opportunities per ms of the bottleneck (see load_trace()).
+        queue_limit_packets: bottleneck queue limit in packets, or None for an infinite queue.
+        """
+        self.rng = random.Random(seed)
+        self.loss = loss
+        self.rtt = int(rtt)
+        self.tick = max(self.rtt // TICKS_PER_RTT, 1)
+        self.queue_limit = queue_limit_packets
+        self.mean_opportunities = max(sum(opportunities) / float(len(opportunities)), 1e-3)
+        # Cumulative delivery opportunities, to count the opportunities in a tick.
+        self.trace_period = len(opportunities)
+        self.trace_total = sum(opportunities)
+        self.cumulative_opportunities = [0]
+        for count in opportunities:
+            self.cumulative_opportunities.append(self.cumulative_opportunities[-1] + count)
+
+        self.tp = TcpState(self.rtt)
+        self.cc = CONGESTION_CONTROL_MODELS[cong_ctrl](self.tp, self.rng)
+        self.rttvar = self.rtt / 2.0
+        self.rto = max(TCP_RTO_MIN_MS, self.rtt + 4 * self.rttvar)
+        self.rto_backoff = 1
+        self.rto_epoch = -1
+        self.last_progress = 0
+        self.high_seq = 0
+        self.next_seq = 0
+        # Lost packets not yet noticed by the sender, as (seq, packets) pairs.
+        self.pending_lost = []
+        # Packets noticed as lost: seq -> packets not yet delivered by a retransmission.
+        self.holes = {}
+        # Lost packets waiting to be retransmitted, as [seq, packets] pairs.
+        self.retransmit_queue = deque()
+        self.deliverable = 0
+        self.pacing_credit = 0.0
+
+        # Bottleneck queue of [send_ms, packets, delivered, delivered_ms, app_limited, seq, retransmit]
+        # groups. seq is the sequence number of the first packet of new data, or of the hole
+        # being filled by a retransmission.
+        self.queue = deque()
+        self.queue_len = 0
+        # Scheduled ACK arrivals: ms -> list of (delivered, lost, send_ms, delivered_at_send,
+        # delivered_ms_at_send, app_limited, seq, retransmit).
+        self.acks = {}
+        self.until_loss = self._draw_loss_gap()
+
+        self.departures = 0
+        self.capacity = 0
+        self.queue_delays = {}
+
+    def _draw_loss_gap(self):
+        """Return the number of packets that pass before the next random loss."""
+        if self.loss <= 0:
+            return float('inf')
+        if self.loss >= 1:
+            return 0
+        return int(math.log(1.0 - self.rng.random()) / math.log(1.0 - self.loss))
+
+    def _opportunities_before(self, ms):
+        """Return the number of delivery opportunities in the trace before ms."""
+        periods, offset = divmod(ms, self.trace_period)
+        return periods * self.trace_total + self.cumulative_opportunities[offset]
+
+    def _schedule(self, when, event):
+        # Round up to the start of the next tick.
+        when = -(-when // self.tick) * self.tick
+        if when in self.acks:
+            self.acks[when].append(event)
+        else:
+            self.acks[when] = [event]
+
+    def _process_acks(self, now, events):
+        tp = self.tp
+        acked = 0
+        latest = None
+        for event in events:
+            delivered, lost, send_ms = event[0], event[1], event[2]
+            if send_ms < self.rto_epoch:
+                # Already marked lost by a retransmission timeout.
+                continue
+            if lost:
+                self.pending_lost.append((event[6], lost, event[7]))
+            if delivered:
+                acked += delivered
+                if event[7]:
+                    self._fill_hole(event[6], delivered)
+                if latest is None or send_ms >= latest[2]:
+                    latest = event
+        if not acked:
+            # Losses are only detected once a later packet is acknowledged.
+            return
+
+        rs = RateSample()
+        rs.prior_in_flight = tp.packets_in_flight()
+        rs.losses = self._mark_pending_lost()
+        rs.acked_sacked = acked
+        tp.delivered += acked
+        self.deliverable -= acked
+        tp.delivered_ms = now
+        if tp.app_limited and tp.delivered > tp.app_limited:
+            tp.app_limited = 0
+
+        rs.prior_delivered = latest[3]
+        rs.delivered = tp.delivered - latest[3]
+        rs.interval = now - latest[4]
+        rs.rtt = now - latest[2]
+        rs.is_app_limited = latest[5]
+        self._update_rto(rs.rtt)
+        self.last_progress = now
+
+        # Recovery ends once the cumulative ACK passes the data sent when it started.
+        if tp.ca_state != TCP_CA_OPEN and self._snd_una() >= self.high_seq:
+            tp.ca_state = TCP_CA_OPEN
+            self.cc.exit_recovery(tp)
+        if rs.losses and tp.ca_state == TCP_CA_OPEN:
+            self.high_seq = self.next_seq
+            self.cc.ssthresh(tp)
+            tp.ca_state = TCP_CA_RECOVERY
+        self.cc.on_ack(tp, rs, now)
+
+    def _snd_una(self):
+        """Return the sequence number of the first unacknowledged packet."""
+        if self.holes:
+            return min(self.holes)
+        return self.next_seq
+
+    def _mark_pending_lost(self):
+        """Mark the pending lost packets as lost and queue their retransmission."""
+        losses = 0
+        for seq, lost, retransmit in self.pending_lost:
+            losses += lost
+            if not retransmit:
+                self.holes[seq] = self.holes.get(seq, 0) + lost
+            self.retransmit_queue.append([seq, lost])
+        self.pending_lost = []
+        self.tp.lost += losses
+        return losses
+
+    def _fill_hole(self, seq, delivered):
+        remaining = self.holes.get(seq, 0) - delivered
+        if remaining > 0:
+            self.holes[seq] = remaining
+        else:
+            self.holes.pop(seq, None)
+
+    def _update_rto(self, rtt):
+        """Update srtt and the retransmission timeout as in RFC 6298."""
+        tp = self.tp
+        self.rttvar = 0.75 * self.rttvar + 0.25 * abs(tp.srtt - rtt)
+        tp.srtt = 0.875 * tp.srtt + 0.125 * rtt
+        self.rto = min(max(TCP_RTO_MIN_MS, tp.srtt + 4 * self.rttvar), TCP_RTO_MAX_MS)
+        self.rto_backoff = 1
+
+    def _check_rto(self, now):
+        tp = self.tp
+        if tp.packets_in_flight() == 0 or self.deliverable > 0:
+            return
+        if now - self.last_progress < self.rto * self.rto_backoff:
+            return
+        # Every outstanding packet was lost, so only the timer can recover.
+        debug_print_verbose("Simulated RTO at %d ms" % now)
+        for when in sorted(self.acks):
+            for event in self.acks[when]:
+                if event[1] and event[2] < now:
+                    self.pending_lost.append((event[6], event[1], event[7]))
+        self._mark_pending_lost()
+        self.rto_epoch = now
+        self.high_seq = self.next_seq
+        self.cc.ssthresh(tp)
+        tp.ca_state = TCP_CA_LOSS
+        tp.cwnd = 1
+        self.cc.set_state(tp, TCP_CA_LOSS)
+        self.rto_backoff = min(self.rto_backoff * 2, TCP_RTO_MAX_MS / self.rto)
+        self.last_progress = now
+
+    def _send(self, now):
+        tp = self.tp
+        in_flight = tp.packets_in_flight()
+        allowed = int(tp.cwnd) - in_flight
+        if tp.pacing_rate is not None:
+            # Allow at most one tick worth of packets plus two packets to burst.
+            tick_rate = tp.pacing_rate * self.tick
+            self.pacing_credit = min(self.pacing_credit + tick_rate, tick_rate + 2)
+            allowed = min(allowed, int(self.pacing_credit))
+        if allowed <= 0:
+            return
+        if tp.pacing_rate is not None:
+            self.pacing_credit -= allowed
+
+        if in_flight == 0:
+            tp.delivered_ms = now
+            self.last_progress = now
+        tp.packets_out += allowed
+
+        # Retransmit lost packets before sending new data.
+        while allowed and self.retransmit_queue:
+            hole = self.retransmit_queue[0]
+            packets = min(allowed, hole[1])
+            self._enqueue(now, packets, hole[0], True)
+            allowed -= packets
+            hole[1] -= packets
+            if not hole[1]:
+                self.retransmit_queue.popleft()
+        if allowed:
+            self._enqueue(now, allowed, self.next_seq, False)
+            self.next_seq += allowed
+
+    def _enqueue(self, now, packets, seq, retransmit):
+        """Add packets sent by the sender to the bottleneck queue."""
+        tp = self.tp
+        accepted = packets
+        if self.queue_limit is not None:
+            accepted = max(min(packets, self.queue_limit - self.queue_len), 0)
+        if accepted < packets:
+            # Tail drops are noticed once the packets behind them are acknowledged.
+            drain_ms = int(self.queue_len / self.mean_opportunities)
+            self._schedule(now + self.rtt + drain_ms + 1,
+                           (0, packets - accepted, now, tp.delivered, tp.delivered_ms, False, seq, retransmit))
+        if accepted:
+            self.queue.append([now, accepted, tp.delivered, tp.delivered_ms, tp.app_limited != 0,
+                               seq, retransmit])
+            self.queue_len += accepted
+            self.deliverable += accepted
+
+    def _serve_link(self, now):
+        opportunities = self._opportunities_before(now + self.tick) - self._opportunities_before(now)
+        self.capacity += opportunities
+        while opportunities and self.queue:
+            group = self.queue[0]
+            take = min(opportunities, group[1])
+            opportunities -= take
+
+            # Random loss on the uplink, after the bottleneck.
+            lost = 0
+            left = take
+            while self.until_loss < left:
+                left -= self.until_loss + 1
+                lost += 1
+                self.until_loss = self._draw_loss_gap()
+            self.until_loss -= left
+
+            self._schedule(now + self.rtt, (take - lost, lost, group[0], group[2], group[3], group[4],
+                                            group[5], group[6]))
+            self.deliverable -= lost
+            self.departures += take
+            delay = now - group[0]
+            self.queue_delays[delay] = self.queue_delays.get(delay, 0) + take
+
+            group[1] -= take
+            if not group[6]:
+                group[5] += take
+            self.queue_len -= take
+            if not group[1]:
+                self.queue.popleft()
+
+    def run(self, duration_ms):
+        """Run the simulation for duration_ms and return the measured results."""
+        for now in range(0, duration_ms, self.tick):
+            events = self.acks.pop(now, None)
+            if events:
+                self._process_acks(now, events)
+            self._check_rto(now)
+            self._send(now)
+            self._serve_link(now)
+
+        seconds = duration_ms / 1000.0
+        return {
+            "capacity": round(self.capacity * MTU_BYTES * 8 / seconds / 1e6, 2),
+            "goodput": round(self.departures * MTU_BYTES * 8 / seconds / 1e6, 2),
+            "queue_delay_p95": self._queue_delay_percentile(95),
+        }
+
+    def _queue_delay_percentile(self, percentile):
+        total = sum(self.queue_delays.values())
+        if not total:
+            return 0
+        threshold = total * percentile / 100.0
+        seen = 0
+        for delay in sorted(self.queue_delays):
+            seen += self.queue_delays[delay]
+            if seen >= threshold:
+                return delay
+        return max(self.queue_delays)
+
+
+def _parse_args():
+    """Parse experimental parameters from the commandline."""
+    parser = argparse.ArgumentParser(
+        description="Simulate a BBR or CUBIC flow with the bbr_experiment.py params.")
+    parser.add_argument('--time', dest=Flags.TIME, type=int,
+                        help="Enter a time in seconds to run each trace.",
+                        default=60)
+    parser.add_argument('--loss', dest=Flags.LOSS, type=float,
+                        help="Loss rate to test (%%).",
+                        default=0.1)
+    parser.add_argument('--cc', dest=Flags.CC, choices=sorted(CONGESTION_CONTROL_MODELS.keys()),
+                        help="Which congestion control algorithm to simulate.",
+                        default="cubic")
+    parser.add_argument('--output_file', dest=Flags.OUTPUT_FILE, type=str,
+                        help="If non empty, will append measurement result to this file.",
+                        default="")
+    parser.add_argument('--rtt', dest=Flags.RTT, type=int,
+                        help="Specify the RTT of the link in milliseconds.",
+                        default=100)
+    parser.add_argument('--bw', dest=Flags.BW, type=float,
+                        help="Specify the bottleneck bandwidth in Mbps.",
+                        default=100)
+    parser.add_argument('--traceup', dest=Flags.TUP, type=str,
+                        help="Specify the uplink tracefile.",
+                        default=None)
+    parser.add_argument('--tracedown', dest=Flags.TDOWN, type=str,
+                        help="Specify the downlink tracefile. ACKs are not rate limited, so this is unused.",
+                        default=None)
+    parser.add_argument('--queue', dest=Flags.QUEUE, choices=SIM_QUEUE_TYPES,
+                        help="Bottleneck queue discipline.",
+                        default="infinite")
+    parser.add_argument('--queue_size', dest=Flags.QUEUE_SIZE, type=check_queue_size,
+                        help="Bottleneck queue size as <n>[packets|bytes|bdp].",
+                        default="1bdp")
+    parser.add_argument('--seed', dest=Flags.SEED, type=int,
+                        help="Seed for the random loss process.",
+                        default=None)
+    parser.add_argument('--live_stats_file', dest=Flags.LIVE_STATS_FILE, type=str,
+                        help="If non empty, write the throughput of the simulated trial to this file.",
+                        default="")
+
+    Flags.parsed_args = vars(parser.parse_args())
+    # Preprocess the loss into a percentage
+    Flags.parsed_args[Flags.LOSS] = Flags.parsed_args[Flags.LOSS] / 100.0
+    debug_print_verbose("Parse: " + str(Flags.parsed_args))
+
+
+def main():
+    """Run a single simulated trial."""
+    _parse_args()
+
+    seconds = Flags.parsed_args[Flags.TIME]
+    loss = Flags.parsed_args[Flags.LOSS]
+    rtt = Flags.parsed_args[Flags.RTT]
+    bw = Flags.parsed_args[Flags.BW]
+    cc = Flags.parsed_args[Flags.CC]
+    queue = Flags.parsed_args[Flags.QUEUE]
+    output_file = Flags.parsed_args[Flags.OUTPUT_FILE]
+    uplink_trace = Flags.parsed_args[Flags.TUP]
+
+    if uplink_trace:
+        opportunities = load_trace(uplink_trace)
+    else:
+        opportunities = constant_rate_trace(seconds, bw)
+
+    queue_size = ''
+    queue_limit = ''
+    queue_limit_packets = None
+    if queue != 'infinite':
+        queue_size = Flags.parsed_args[Flags.QUEUE_SIZE]
+        queue_limit = resolve_queue_limit(queue_size, rtt, bw)
+        unit, amount = queue_limit.split('=')
+        queue_limit_packets = int(amount)
+        if unit == 'bytes':
+            queue_limit_packets = max(int(amount) // MTU_BYTES, 1)
+
+    debug_print("Simulating experiment [loss = " + str(loss) + ", cong_ctrl = " + str(cc) +
+                ", rtt = " + str(rtt) + ", bw = " + str(bw) + ", queue = " + str(queue) + "]")
+    start_time = time.time()
+    simulation = Simulation(cc, loss, rtt, opportunities, queue_limit_packets,
+                            Flags.parsed_args[Flags.SEED])
+    measured = simulation.run(seconds * 1000)
+    debug_print_verbose("Simulation took %.3f seconds" % (time.time() - start_time))
+    if Flags.parsed_args[Flags.LIVE_STATS_FILE]:
+        write_live_stats(Flags.parsed_args[Flags.LIVE_STATS_FILE], {
+            "received_bytes": simulation.departures * MTU_BYTES,
+            "elapsed_secs": seconds,
+            "throughput_Mbps": measured["goodput"]})
+
+    result = {
+        "congestion_control": cc,
+        "loss_rate": loss,
+        "goodput_Mbps": measured["goodput"],
+        "rtt_ms": rtt,
+        "bandwidth_Mbps": measured["capacity"],
+        "specified_bw_Mbps": bw,
+        "queue": queue,
+        "queue_size": queue_size,
+        "queue_limit": queue_limit,
+        "queue_delay_p95_ms": measured["queue_delay_p95"],
+        # The simulated flow is the default bulk transfer of the driver, over a clean and idle downlink.
+        "workload": 'bulk',
+        "downlink_loss_rate": 0.0,
+        "reverse_traffic": 'none',
+        "status": STATUS_OK,
+    }
+    stdout_print(format_result_row(result) + "\n")
+
+    if output_file:
+        debug_print_verbose("Appending Result output to: %s" % output_file)
+        append_result(output_file, result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+#!/usr/bin/python
+"""Run a sweep of bbr experiment trials over a grid of parameters.
+
+Each sweep dimension (congestion control, loss rate, RTT, bandwidth, queue,
+queue size, workload, downlink loss and reverse traffic) accepts a list of
+values, and one trial is run for every combination of them. Trials are nested
+in the order the dimensions are listed above, matching the loops of the
+original run_*.sh scripts. With --repeats=K, the whole grid is run K times
+over, so that the repeats of a configuration are spread over the sweep instead
+of running back to back. Any argument not recognized by the sweep
+runner is passed through to the driver of each trial, e.g. --headless,
+--time 30 or --traceup.
+
+When --metrics_port is set, live progress of the sweep is served in the
+Prometheus text format on http://127.0.0.1:<port>/metrics (see bbr_metrics.py).
+
+When --coordinator_port is set, trials are not run locally but handed out to
+workers on other hosts (see bbr_distributed.py).
+
+When --archive_root is set, the raw artifacts of every trial are archived in a
+new sweep-<timestamp> directory under it (see bbr_archive.py).
+
+When --warm_pool=K is set, the Mahimahi shells of the next K trials are
+spawned while the current trial runs (see bbr_warm_pool.py).
+
+Every trial runs under a watchdog (see bbr_watchdog.py) that kills it once it
+overruns its deadline. A trial that fails or is killed is retried up to
+--trial_attempts times, waiting --retry_backoff seconds before the first retry
+and twice as long before every further one. A trial that keeps failing gets a
+row with its configuration and a failed or timeout status in the output file,
+and the sweep moves on to the next trial. Once all trials ran, whether locally
+or on workers, the sweep lists the trials that failed. It still exits with a
+zero status, so that scripts running several sweeps in a row carry on to the
+next sweep and the plots, unless --strict is set.
+"""
+
+import argparse
+from bbr_experiment import parse_trial_args, trial_configuration
+from bbr_logging import debug_print, debug_print_error, debug_print_verbose
+from bbr_metrics import SweepProgress, start_metrics_server
+from bbr_results import append_result, STATUS_FAILED, STATUS_OK, STATUS_TIMEOUT
+from bbr_warm_pool import uses_link_traces, WarmShellPool
+from bbr_watchdog import driver_ports, driver_settings, run_with_deadline, TIMED_OUT, trial_timeout_secs, \
+    wait_for_port_release
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+
+EXIT_SUCCESS = 0
+
+# Sweep dimensions as (driver flag, Flags key), in the order trials are nested.
+SWEEP_DIMENSIONS = [
+    ("cc", "congestion_control"),
+    ("loss", "loss"),
+    ("rtt", "rtt"),
+    ("bw", "bottleneck_bandwidth"),
+    ("queue", "queue"),
+    ("queue_size", "queue_size"),
+    ("workload", "workload"),
+    ("downlink_loss", "downlink_loss"),
+    ("reverse_traffic", "reverse_traffic"),
+]
+
+
+class Flags(object):
+    """Dictionary object to store parsed flags."""
+
+    DRIVER = "driver"
+    OUTPUT_FILE = "output_file"
+    METRICS_PORT = "metrics_port"
+    ARCHIVE_ROOT = "archive_root"
+    COORDINATOR_PORT = "coordinator_port"
+    WORKER_TIMEOUT = "worker_timeout"
+    WARM_POOL = "warm_pool"
+    REPEATS = "repeats"
+    TRIAL_TIMEOUT = "trial_timeout"
+    TRIAL_ATTEMPTS = "trial_attempts"
+    RETRY_BACKOFF = "retry_backoff"
+    STRICT = "strict"
+    parsed_args = None
+    driver_args = None
+
+
+def _parse_args():
+    """Parse sweep parameters from the commandline."""
+    parser = argparse.ArgumentParser(
+        description="Run a sweep of bbr experiment trials. Unrecognized arguments are passed to the driver.")
+    for flag, dest in SWEEP_DIMENSIONS:
+        parser.add_argument('--' + flag, dest=dest, nargs='+', type=str,
+                            help="Values of --%s to sweep over. Uses the driver default if unset." % flag,
+                            default=None)
+    parser.add_argument('--repeats', dest=Flags.REPEATS, type=int,
+                        help="Number of trials of every configuration, interleaved over the sweep.",
+                        default=1)
+    parser.add_argument('--driver', dest=Flags.DRIVER, type=str,
+                        help="Driver script that runs a single trial.",
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "bbr_experiment.py"))
+    parser.add_argument('--output_file', dest=Flags.OUTPUT_FILE, type=str,
+                        help="File each trial appends its measurement result to.",
+                        default="")
+    parser.add_argument('--metrics_port', dest=Flags.METRICS_PORT, type=int,
+                        help="If non zero, serve live sweep metrics on this local port.",
+                        default=0)
+    parser.add_argument('--archive_root', dest=Flags.ARCHIVE_ROOT, type=str,
+                        help="If non empty, archive the raw artifacts of each trial in a new directory under it.",
+                        default="")
+    parser.add_argument('--coordinator_port', dest=Flags.COORDINATOR_PORT, type=int,
+                        help="If non zero, hand out trials to bbr_distributed.py workers connecting on this port.",
+                        default=0)
+    parser.add_argument('--worker_timeout', dest=Flags.WORKER_TIMEOUT, type=int,
+                        help="Seconds without news from a worker after which its trial is requeued.",
+                        default=60)
+    parser.add_argument('--warm_pool', dest=Flags.WARM_POOL, type=int,
+                        help="Number of upcoming trials whose Mahimahi shells are spawned while a trial runs. "
+                        "Only applies to local sweeps with generated link traces.",
+                        default=0)
+    parser.add_argument('--trial_timeout', dest=Flags.TRIAL_TIMEOUT, type=int,
+                        help="Seconds after which a trial is killed. If zero, derived from the --time of the driver.",
+                        default=0)
+    parser.add_argument('--trial_attempts', dest=Flags.TRIAL_ATTEMPTS, type=int,
+                        help="Number of times a failing trial is run before it is recorded as failed.",
+                        default=3)
+    parser.add_argument('--retry_backoff', dest=Flags.RETRY_BACKOFF, type=int,
+                        help="Seconds to wait before retrying a failed trial, doubled on every further retry.",
+                        default=30)
+    parser.add_argument('--strict', dest=Flags.STRICT, action='store_true',
+                        help="Exit with a non zero status once all trials ran if any of them failed.",
+                        default=False)
+
+    parsed_args, driver_args = parser.parse_known_args()
+    Flags.parsed_args = vars(parsed_args)
+    Flags.driver_args = driver_args
+    debug_print_verbose("Parse: " + str(Flags.parsed_args) + " Driver args: " + str(driver_args))
+
+
+def build_trials(parsed_args, repeats=1):
+    """Return the list of trials to run, each a list of (driver flag, value) pairs.
+
+    The grid of configurations is repeated, rather than each configuration,
+    so that slow drifts of the host or network do not bias any single one.
+    """
+    dimensions = []
+    for flag, dest in SWEEP_DIMENSIONS:
+        values = parsed_args.get(dest)
+        if values:
+            dimensions.append([(flag, value) for value in values])
+    grid = [list(trial) for trial in itertools.product(*dimensions)]
+    return [list(trial) for _ in range(repeats) for trial in grid]
+
+
+def trial_command(driver, trial, output_file, driver_args, live_stats_file=None, archive_dir=None):
+    """Return the command line that runs a single trial."""
+    command = [sys.executable, driver]
+    command += ["--%s=%s" % (flag, value) for flag, value in trial]
+    if output_file:
+        command.append("--output_file=" + output_file)
+    if live_stats_file:
+        command.append("--live_stats_file=" + live_stats_file)
+    if archive_dir:
+        command.append("--archive_dir=" + archive_dir)
+    return command + list(driver_args)
+
+
+def trial_args(trial, driver_args):
+    """Return the arguments of the driver of a trial, without the sweep-wide output files."""
+    return ["--%s=%s" % (flag, value) for flag, value in trial] + list(driver_args)
+
+
+def describe_trial(trial):
+    """Return a short human readable description of a trial."""
+    return ' '.join(["%s=%s" % (flag, value) for flag, value in trial])
+
+
+def trial_deadline_secs(driver_args, trial_timeout=0):
+    """Return the seconds a trial run with driver_args may take.
+
+    trial_timeout: If non zero, used instead of the deadline derived from --time.
+    """
+    trial_secs, _ = driver_settings(driver_args)
+    return trial_timeout or trial_timeout_secs(trial_secs)
+
+
+def failure_result(trial, driver_args, status):
+    """Return the result row recording a trial that kept failing.
+
+    The row holds the configuration columns the driver records for the same
+    trial, including the defaults of flags that were not given, so that failed
+    and successful trials of a configuration line up.
+    """
+    try:
+        result = trial_configuration(parse_trial_args(trial_args(trial, driver_args), ignore_unknown=True))
+    except SystemExit:
+        # The driver rejected the arguments of the trial, which is likely why it failed.
+        debug_print_error("Cannot record the configuration of trial: " + describe_trial(trial))
+        result = {}
+    result["status"] = status
+    return result
+
+
+def report_failed_trials(failed_trials, total_trials):
+    """Log the trials of a sweep that failed, given as (trial, status) pairs."""
+    debug_print_error("%d of %d trials failed:" % (len(failed_trials), total_trials))
+    for trial, status in failed_trials:
+        debug_print_error("  %s: %s" % (status, describe_trial(trial)))
+
+
+def run_trial(command, timeout_secs, poll_fn=None):
+    """Run a single trial under the watchdog and return its status, one of the STATUS_* of bbr_results.
+
+    poll_fn: Optional. Called while the trial runs, see bbr_watchdog.run_with_deadline.
+    """
+    debug_print_verbose("Running: " + ' '.join(command))
+    try:
+        returncode = run_with_deadline(command, timeout_secs, poll_fn)
+    except OSError as e:
+        debug_print_error("Could not start trial: " + str(e))
+        return STATUS_FAILED
+    if returncode is TIMED_OUT:
+        return STATUS_TIMEOUT
+    return STATUS_OK if returncode == EXIT_SUCCESS else STATUS_FAILED
+
+
+def main():
+    """Run all trials of the sweep."""
+    _parse_args()
+
+    repeats = Flags.parsed_args[Flags.REPEATS]
+    if repeats < 1:
+        debug_print_error("--repeats must be at least 1.")
+        sys.exit(-1)
+    trial_attempts = Flags.parsed_args[Flags.TRIAL_ATTEMPTS]
+    if trial_attempts < 1:
+        debug_print_error("--trial_attempts must be at least 1.")
+        sys.exit(-1)
+    if Flags.parsed_args[Flags.WARM_POOL] > 0 and uses_link_traces(Flags.driver_args):
+        debug_print_error("--warm_pool cannot be used with --traceup or --tracedown, pooled trials would "
+                          "start at an arbitrary point of the traces.")
+        sys.exit(-1)
+    trials = build_trials(Flags.parsed_args, repeats)
+    driver = Flags.parsed_args[Flags.DRIVER]
+    output_file = Flags.parsed_args[Flags.OUTPUT_FILE]
+    metrics_port = Flags.parsed_args[Flags.METRICS_PORT]
+    archive_root = Flags.parsed_args[Flags.ARCHIVE_ROOT]
+
+    archive_dir = None
+    if archive_root:
+        archive_dir = os.path.join(archive_root, time.strftime("sweep-%Y%m%d-%H%M%S"))
+        os.makedirs(archive_dir)
+        debug_print("Archiving trials in " + archive_dir)
+
+    live_stats_file = None
+    if metrics_port:
+        handle, live_stats_file = tempfile.mkstemp(prefix="bbr_live_stats_", suffix=".json")
+        os.close(handle)
+    progress = SweepProgress(len(trials), live_stats_file)
+    if metrics_port:
+        start_metrics_server(progress, metrics_port)
+
+    debug_print("Running sweep of %d trials." % len(trials))
+    coordinator_port = Flags.parsed_args[Flags.COORDINATOR_PORT]
+    if coordinator_port:
+        # Deferred import, bbr_distributed depends on this module.
+        from bbr_distributed import TrialQueue, run_coordinator
+        trial_queue = TrialQueue(trials, progress, output_file, Flags.driver_args, archive_dir,
+                                 Flags.parsed_args[Flags.TRIAL_TIMEOUT], trial_attempts,
+                                 Flags.parsed_args[Flags.RETRY_BACKOFF])
+        run_coordinator(trial_queue, coordinator_port, worker_timeout=Flags.parsed_args[Flags.WORKER_TIMEOUT])
+        failed_trials = trial_queue.failed_trials()
+    else:
+        warm_pool_size = Flags.parsed_args[Flags.WARM_POOL]
+        timeout_secs = trial_deadline_secs(Flags.driver_args, Flags.parsed_args[Flags.TRIAL_TIMEOUT])
+        debug_print_verbose("Trials are killed after %d seconds." % timeout_secs)
+        pool = WarmShellPool() if warm_pool_size > 0 else None
+        failed_trials = []
+        for index, trial in enumerate(trials):
+            debug_print("Executing trial %d/%d: %s ..." % (index + 1, len(trials), describe_trial(trial)))
+            token = progress.trial_started(dict(trial))
+            for attempt in range(1, trial_attempts + 1):
+                if live_stats_file and os.path.exists(live_stats_file):
+                    os.remove(live_stats_file)
+                command = trial_command(driver, trial, output_file, Flags.driver_args, live_stats_file, archive_dir)
+                if pool:
+                    # Spawn the shells of this trial and the next ones that are not warming up yet.
+                    for upcoming in range(index, min(index + warm_pool_size + 1, len(trials))):
+                        if upcoming not in pool:
+                            pool.spawn(upcoming, trial_command(driver, trials[upcoming], None, Flags.driver_args))
+                    command.append("--warm_shell=" + pool.directory(index))
+                status = run_trial(command, timeout_secs)
+                if status == STATUS_TIMEOUT:
+                    wait_for_port_release(driver_ports(trial_args(trial, Flags.driver_args)))
+                if pool:
+                    # The shell of a failed trial may be wedged, a retry gets a new one.
+                    if status == STATUS_OK:
+                        pool.release(index)
+                    else:
+                        pool.kill(index)
+                if status == STATUS_OK or attempt == trial_attempts:
+                    break
+                backoff_secs = Flags.parsed_args[Flags.RETRY_BACKOFF] * 2 ** (attempt - 1)
+                debug_print_error("Trial attempt %d/%d ended with status %s, retrying in %d seconds: %s" %
+                                  (attempt, trial_attempts, status, backoff_secs, describe_trial(trial)))
+                time.sleep(backoff_secs)
+            progress.trial_finished(token, status == STATUS_OK)
+            if status != STATUS_OK:
+                debug_print_error("Trial did not succeed in %d attempts, recording it as %s: %s" %
+                                  (trial_attempts, status, describe_trial(trial)))
+                failed_trials.append((trial, status))
+                if output_file:
+                    append_result(output_file, failure_result(trial, Flags.driver_args, status))
+        if pool:
+            pool.close()
+
+    if live_stats_file and os.path.exists(live_stats_file):
+        os.remove(live_stats_file)
+
+    if failed_trials:
+        report_failed_trials(failed_trials, len(trials))
+        if Flags.parsed_args[Flags.STRICT]:
+            sys.exit(-1)
+    debug_print("Sweep complete.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/python
+"""Per-interval throughput and queueing delay from Mahimahi uplink logs.
+
+mm-link writes one line per event to its uplink log:
+    <timestamp ms> # <bytes>            delivery opportunity of the link
+    <timestamp ms> + <bytes>            packet arrival at the bottleneck queue
+    <timestamp ms> - <bytes> <delay>    packet departure and its queueing delay (ms)
+    <timestamp ms> d <packets> <bytes>  packets dropped by the queue
+Header lines start with '#'. A 60 second trial at 100 Mbps produces well over a
+million lines, so series computed here are downsampled with the
+largest-triangle-three-buckets (LTTB) algorithm before plotting.
+
+Uplink logs kept in trial archives (see bbr_archive.py) can be used in place
+of log files; they are read without restoring the log.
+"""
+from bbr_archive import is_archive, TrialArchive, UPLINK_EVENT_CODES, UPLINK_LOG_TABLE
+import numpy as np
+
+
+class UplinkLog(object):
+    """Departures, delivery opportunities and drops parsed from a Mahimahi uplink log.
+
+    All series are numpy arrays. Timestamps are in ms relative to the base
+    timestamp of the log.
+    """
+
+    def __init__(self, departure_ms, departure_bytes, departure_delay_ms,
+                 opportunity_ms, opportunity_bytes, arrival_ms, arrival_bytes, drop_ms, drop_bytes):
+        """Initialize the log from its event series."""
+        self.departure_ms = departure_ms
+        self.departure_bytes = departure_bytes
+        self.departure_delay_ms = departure_delay_ms
+        self.opportunity_ms = opportunity_ms
+        self.opportunity_bytes = opportunity_bytes
+        self.arrival_ms = arrival_ms
+        self.arrival_bytes = arrival_bytes
+        self.drop_ms = drop_ms
+        self.drop_bytes = drop_bytes
+
+    def duration_ms(self):
+        """Return the time covered by the log, in ms."""
+        last = [series[-1] for series in [self.departure_ms, self.opportunity_ms, self.arrival_ms]
+                if len(series)]
+        return max(last) + 1 if last else 0
+
+
+def _base_timestamp(header_lines):
+    for line in header_lines:
+        if line.startswith('# base timestamp:'):
+            return int(line.split(':')[1])
+    return None
+
+
+def _uplink_log_from_archive(filename):
+    trial_archive = TrialArchive(filename)
+    chunks = [columns for _, columns in trial_archive.iter_chunks(UPLINK_LOG_TABLE)]
+    ms, event, num_bytes, delay_ms, packets = [
+        np.concatenate([np.asarray(columns[i], dtype=np.int64) for columns in chunks]) if chunks
+        else np.zeros(0, dtype=np.int64)
+        for i in range(len(trial_archive.column_names(UPLINK_LOG_TABLE)))]
+    base_timestamp = _base_timestamp(trial_archive.metadata.get("uplink_log_header", []))
+    if base_timestamp is None:
+        base_timestamp = ms[0] if len(ms) else 0
+    ms = ms - base_timestamp
+
+    def select(event_type, *series):
+        mask = event == UPLINK_EVENT_CODES[event_type]
+        return [values[mask] for values in series]
+
+    return UplinkLog(*(select('-', ms, num_bytes, delay_ms) + select('#', ms, num_bytes) +
+                       select('+', ms, num_bytes) + select('d', ms, num_bytes)))
+
+
+def parse_uplink_log(filename):
+    """Parse a Mahimahi uplink log file, or the uplink log of a trial archive, into an UplinkLog."""
+    if is_archive(filename):
+        return _uplink_log_from_archive(filename)
+    departure_ms, departure_bytes, departure_delay_ms = [], [], []
+    opportunity_ms, opportunity_bytes = [], []
+    arrival_ms, arrival_bytes = [], []
+    drop_ms, drop_bytes = [], []
+    base_timestamp = None
+    with open(filename, 'r') as log:
+        for line in log:
+            if line.startswith('#'):
+                if line.startswith('# base timestamp:'):
+                    base_timestamp = int(line.split(':')[1])
+                continue
+            fields = line.split()
+            if len(fields) < 3:
+                continue
+            timestamp = int(fields[0])
+            if base_timestamp is None:
+                base_timestamp = timestamp
+            timestamp -= base_timestamp
+            event = fields[1]
+            if event == '-':
+                departure_ms.append(timestamp)
+                departure_bytes.append(int(fields[2]))
+                departure_delay_ms.append(int(fields[3]))
+            elif event == '#':
+                opportunity_ms.append(timestamp)
+                opportunity_bytes.append(int(fields[2]))
+            elif event == '+':
+                arrival_ms.append(timestamp)
+                arrival_bytes.append(int(fields[2]))
+            elif event == 'd':
+                drop_ms.append(timestamp)
+                drop_bytes.append(int(fields[-1]))
+    return UplinkLog(np.array(departure_ms, dtype=np.int64), np.array(departure_bytes, dtype=np.int64),
+                     np.array(departure_delay_ms, dtype=np.int64),
+                     np.array(opportunity_ms, dtype=np.int64), np.array(opportunity_bytes, dtype=np.int64),
+                     np.array(arrival_ms, dtype=np.int64), np.array(arrival_bytes, dtype=np.int64),
+                     np.array(drop_ms, dtype=np.int64), np.array(drop_bytes, dtype=np.int64))
+
+
+def bin_uplink_log(uplink_log, bin_ms=100):
+    """Bin an uplink log into per-interval throughput, capacity and queueing delay.
+
+    Returns a dictionary of numpy arrays, one entry per bin:
+        time_secs: start of each bin in seconds.
+        throughput_Mbps: departures from the bottleneck.
+        capacity_Mbps: delivery opportunities of the link.
+        queue_delay_ms: mean queueing delay of the packets departing in the bin (NaN if none).
+    """
+    num_bins = max(int(np.ceil(uplink_log.duration_ms() / float(bin_ms))), 1)
+    departure_bins = uplink_log.departure_ms // bin_ms
+    departed = np.bincount(departure_bins, weights=uplink_log.departure_bytes, minlength=num_bins)
+    packets = np.bincount(departure_bins, minlength=num_bins)
+    delay_sum = np.bincount(departure_bins, weights=uplink_log.departure_delay_ms, minlength=num_bins)
+    capacity = np.bincount(uplink_log.opportunity_ms // bin_ms, weights=uplink_log.opportunity_bytes,
+                           minlength=num_bins)
+
+    bits_to_mbps = 8 / (bin_ms / 1000.0) / 1e6
+    with np.errstate(invalid='ignore', divide='ignore'):
+        queue_delay = np.where(packets > 0, delay_sum / np.maximum(packets, 1), np.nan)
+    return {
+        "time_secs": np.arange(num_bins) * bin_ms / 1000.0,
+        "throughput_Mbps": departed[:num_bins] * bits_to_mbps,
+        "capacity_Mbps": capacity[:num_bins] * bits_to_mbps,
+        "queue_delay_ms": queue_delay[:num_bins],
+    }
+
+
+def largest_triangle_three_buckets(x, y, threshold):
+    """Downsample the series (x, y) to at most threshold points, preserving its visual shape.
+
+    Implements the largest-triangle-three-buckets algorithm (Steinarsson, 2013):
+    the first and last points are kept, the rest is split into threshold - 2
+    buckets, and from each bucket the point forming the largest triangle with
+    the previously selected point and the average of the next bucket is kept.
+    NaN values in y are dropped first.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = ~np.isnan(y)
+    x = x[valid]
+    y = y[valid]
+    length = len(x)
+    if threshold >= length or threshold < 3:
+        return x, y
+
+    # Bucket boundaries for the points between the first and the last one.
+    edges = np.linspace(1, length - 1, threshold - 1).astype(int)
+    selected = np.zeros(threshold, dtype=int)
+    selected[-1] = length - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else length
+        next_x = x[end:next_end].mean() if next_end > end else x[-1]
+        next_y = y[end:next_end].mean() if next_end > end else y[-1]
+        # Twice the area of the triangles formed with each candidate point.
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous]) -
+                       (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return x[selected], y[selected]
@@ -0,0 +1,331 @@
+#!/usr/bin/python
+"""Warm pool of Mahimahi shells spawned ahead of the trials of a sweep.
+
+Every trial normally starts its own mm-delay, mm-loss and mm-link shells, and
+a Python interpreter for the client inside them, before any data flows, and
+tears them down once the trace ends. With bbr_sweep.py --warm_pool=K, the
+shells of the next K trials are spawned while the current trial runs, and the
+shell of a finished trial is torn down in the background.
+
+A pooled shell is spawned by the driver of its trial, bbr_experiment.py
+--spawn_shell=<dir>, so that it is configured from the same flags as the trial.
+Its link trace loops instead of running once, since the shell may wait for
+longer than the trace lasts. The generated constant rate traces look the same
+from any point, but a trial would start at an arbitrary point of traces that
+vary over time, so trials given --traceup or --tracedown cannot be pooled.
+Inside the shell, a client agent (run_agent) waits
+for the client arguments of the trial on the <dir>/go FIFO. The driver of the
+trial, bbr_experiment.py --warm_shell=<dir>, starts the server and sends them.
+The agent then runs the client for --time seconds, records when the client ran
+and exits, which shuts the shell down. The driver cuts the uplink log of the
+shell, and its downlink log, down to the time the client ran, so the idle time
+of the shell does not count towards the results of the trial.
+
+Files of a shell directory:
+    go            FIFO the agent receives the trial on, one JSON line.
+    uplink_log    Uplink log of the shell, since the shell started.
+    downlink_log  Downlink log of the shell, since the shell started.
+    shell_pid     Pid of the outermost process of the shell.
+    client_window JSON {"start_ms": ..., "end_ms": ...}, wall clock time the client ran.
+    shell_exit    Exit status of the shell, once it has exited.
+"""
+
+import argparse
+from bbr_logging import debug_print, debug_print_error, debug_print_verbose
+from bbr_watchdog import kill_process_tree
+from client import run_client
+import errno
+import json
+from multiprocessing import Process
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+GO_FIFO = "go"
+UPLINK_LOG = "uplink_log"
+DOWNLINK_LOG = "downlink_log"
+SHELL_PID = "shell_pid"
+CLIENT_WINDOW = "client_window"
+SHELL_EXIT = "shell_exit"
+
+# Seconds to wait for a pooled shell to start its agent, or for the agent to
+# report the client window beyond the length of the trial.
+SHELL_TIMEOUT_SECS = 60
+
+
+def uses_link_traces(driver_args):
+    """Return whether trials run with driver_args replay given link traces, which pooled shells cannot."""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--traceup', type=str, default=None)
+    parser.add_argument('--tracedown', type=str, default=None)
+    parsed_args, _ = parser.parse_known_args(driver_args)
+    return parsed_args.traceup is not None or parsed_args.tracedown is not None
+
+
+def _write_file(directory, name, content):
+    # Written to a temporary file first, so that readers never see a partial file.
+    path = os.path.join(directory, name)
+    with open(path + ".tmp", 'w') as output:
+        output.write(content)
+    os.rename(path + ".tmp", path)
+
+
+def _read_file(directory, name):
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as input_file:
+        return input_file.read()
+
+
+def prepare_shell_directory(directory):
+    """Create the FIFO of a shell directory, before its shell is spawned."""
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    os.mkfifo(os.path.join(directory, GO_FIFO))
+
+
+def record_shell_pid(directory, pid):
+    """Record the pid of the outermost process of the shell."""
+    _write_file(directory, SHELL_PID, str(pid))
+
+
+def wait_for_shell_pid(directory, timeout_secs):
+    """Wait for the shell of directory to be spawned and return its pid, or None on timeout."""
+    deadline = time.time() + timeout_secs
+    while time.time() < deadline:
+        content = _read_file(directory, SHELL_PID)
+        if content:
+            return int(content)
+        time.sleep(0.2)
+    return None
+
+
+def record_shell_exit(directory, returncode):
+    """Record the exit status of the shell once it has exited."""
+    _write_file(directory, SHELL_EXIT, str(returncode))
+
+
+def shell_exit_status(directory):
+    """Return the exit status of the shell of directory, or None if it is still running."""
+    content = _read_file(directory, SHELL_EXIT)
+    return int(content) if content else None
+
+
+def _send_to_agent(directory, data, timeout_secs):
+    """Write data to the FIFO of the agent. Returns False if the agent is gone or never showed up."""
+    path = os.path.join(directory, GO_FIFO)
+    deadline = time.time() + timeout_secs
+    while True:
+        try:
+            # Non blocking, so that a shell that died before starting its agent cannot hang the caller.
+            fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+            break
+        except OSError as e:
+            # No reader on the FIFO yet, or the spawning driver has not even created it.
+            if e.errno not in (errno.ENXIO, errno.ENOENT):
+                raise
+        if shell_exit_status(directory) is not None or time.time() > deadline:
+            return False
+        time.sleep(0.05)
+    try:
+        if data:
+            os.write(fd, data)
+    finally:
+        os.close(fd)
+    return True
+
+
+def start_trial(directory, cong_control, duration_secs, client_args):
+    """Hand a trial to the agent of the shell of directory.
+
+    client_args are the keyword arguments of client.run_client. Returns False
+    if the agent could not be reached.
+    """
+    message = {"cong_control": cong_control, "duration_secs": duration_secs, "client_args": client_args}
+    return _send_to_agent(directory, (json.dumps(message) + "\n").encode("utf-8"), SHELL_TIMEOUT_SECS)
+
+
+def wait_for_client_window(directory, timeout_secs):
+    """Wait for the agent to report the client window, as (start ms, end ms).
+
+    Returns None if the shell exited without reporting it, or on timeout.
+    """
+    deadline = time.time() + timeout_secs
+    while time.time() < deadline:
+        content = _read_file(directory, CLIENT_WINDOW)
+        if content:
+            window = json.loads(content)
+            return window["start_ms"], window["end_ms"]
+        if shell_exit_status(directory) is not None:
+            return None
+        time.sleep(0.2)
+    return None
+
+
+def run_agent(directory):
+    """Wait for a trial on the FIFO of directory and run its client. Runs inside a pooled shell."""
+    with open(os.path.join(directory, GO_FIFO), 'r') as go:
+        line = go.readline()
+    if not line:
+        debug_print_verbose("Pooled shell released without a trial.")
+        return
+    trial = json.loads(line)
+    client_args = dict((str(name), value) for name, value in trial["client_args"].items())
+    # The client only exits on errors, it is stopped once the trial has lasted its duration.
+    client = Process(target=run_client, args=(str(trial["cong_control"]),), kwargs=client_args)
+    start_ms = time.time() * 1000
+    client.start()
+    client.join(trial["duration_secs"])
+    if client.is_alive():
+        client.terminate()
+        client.join()
+    end_ms = time.time() * 1000
+    _write_file(directory, CLIENT_WINDOW, json.dumps({"start_ms": start_ms, "end_ms": end_ms}))
+
+
+def _event_timestamp(line):
+    # A line still being written by a running shell has no timestamp yet, it sorts after every event.
+    if not line.endswith(b'\n'):
+        return None
+    return int(line.split(b' ', 1)[0])
+
+
+def _first_event_at(log, start, end, timestamp):
+    """Return the offset of the first event of log at or after timestamp, between offsets start and end.
+
+    start is the offset of a line. Event timestamps of a log never decrease,
+    so the offset is found by bisection, without reading the events before it.
+    """
+    while start < end:
+        middle = (start + end) // 2
+        # Move to the first line starting at or after middle.
+        log.seek(middle - 1)
+        log.readline()
+        line_start = log.tell()
+        line = log.readline()
+        line_timestamp = _event_timestamp(line) if line_start < end and line else None
+        if line_timestamp is None or line_timestamp >= timestamp:
+            end = middle
+        else:
+            start = log.tell()
+    return start
+
+
+def trim_link_log(source, destination, start_ms, end_ms):
+    """Copy the events of an uplink or downlink log between two wall clock times (ms) to destination.
+
+    Event timestamps are relative to the "# init timestamp" of the log. The
+    "# base timestamp", which Mahimahi tools measure time from, is moved to
+    start_ms. The events the shell logged while it waited are skipped without
+    being parsed.
+    """
+    with open(source, 'rb') as log, open(destination, 'wb') as output:
+        header = []
+        init_timestamp = None
+        line = log.readline()
+        while line.startswith(b'#'):
+            if line.startswith(b'# init timestamp:'):
+                init_timestamp = int(line.split(b':')[1])
+            header.append(line)
+            line = log.readline()
+        if init_timestamp is None:
+            raise ValueError("%s has no init timestamp" % source)
+        first = int(start_ms) - init_timestamp
+        last = int(end_ms) - init_timestamp
+        for header_line in header:
+            if header_line.startswith(b'# base timestamp:'):
+                header_line = ("# base timestamp: %d\n" % first).encode('ascii')
+            output.write(header_line)
+
+        events_start = sum(len(header_line) for header_line in header)
+        log.seek(0, os.SEEK_END)
+        log_end = log.tell()
+        window_start = _first_event_at(log, events_start, log_end, first)
+        window_end = _first_event_at(log, window_start, log_end, last + 1)
+        log.seek(window_start)
+        remaining = window_end - window_start
+        while remaining > 0:
+            chunk = log.read(min(remaining, 1 << 20))
+            if not chunk:
+                break
+            output.write(chunk)
+            remaining -= len(chunk)
+
+
+class WarmShellPool(object):
+    """Shells spawned ahead of the trials of a sweep, by trial index."""
+
+    def __init__(self):
+        """Initialize an empty pool, with its shell directories in a new temporary directory."""
+        self.root = tempfile.mkdtemp(prefix="bbr_warm_pool_")
+        # Trial index -> (shell directory, spawning driver process).
+        self.shells = {}
+        self.teardowns = []
+
+    def __contains__(self, index):
+        return index in self.shells
+
+    def spawn(self, index, command):
+        """Spawn the shell of a trial with the driver command of the trial."""
+        directory = os.path.join(self.root, "trial-%d" % index)
+        debug_print_verbose("Spawning pooled shell for trial %d" % (index + 1))
+        spawner = subprocess.Popen(command + ["--spawn_shell=" + directory])
+        self.shells[index] = (directory, spawner)
+
+    def directory(self, index):
+        """Return the shell directory of a trial."""
+        return self.shells[index][0]
+
+    def release(self, index):
+        """Tear down the shell of a trial in the background.
+
+        The agent of a shell that never got a trial is told to exit. A shell
+        that does not exit within SHELL_TIMEOUT_SECS is killed.
+        """
+        directory, spawner = self.shells.pop(index)
+
+        def tear_down():
+            if not os.path.exists(os.path.join(directory, CLIENT_WINDOW)):
+                _send_to_agent(directory, None, SHELL_TIMEOUT_SECS)
+            deadline = time.time() + SHELL_TIMEOUT_SECS
+            while spawner.poll() is None and time.time() < deadline:
+                time.sleep(0.2)
+            if spawner.returncode is None:
+                debug_print_error("Pooled shell of trial %d did not exit, killing it." % (index + 1))
+                kill_process_tree(spawner.pid)
+                spawner.wait()
+            elif spawner.returncode != 0:
+                debug_print_error("Pooled shell of trial %d exited with status %d" % (index + 1, spawner.returncode))
+            shutil.rmtree(directory, ignore_errors=True)
+
+        self._in_background(tear_down)
+
+    def kill(self, index):
+        """Kill the shell of a trial in the background, e.g. because it may be wedged after the trial failed."""
+        directory, spawner = self.shells.pop(index)
+
+        def tear_down():
+            kill_process_tree(spawner.pid)
+            spawner.wait()
+            shutil.rmtree(directory, ignore_errors=True)
+
+        self._in_background(tear_down)
+
+    def _in_background(self, tear_down):
+        teardown = threading.Thread(target=tear_down)
+        teardown.daemon = True
+        teardown.start()
+        self.teardowns.append(teardown)
+
+    def close(self):
+        """Release all remaining shells and wait for every shell to be torn down."""
+        for index in list(self.shells):
+            self.release(index)
+        for teardown in self.teardowns:
+            teardown.join()
+        shutil.rmtree(self.root, ignore_errors=True)
+        debug_print("Warm pool closed.")
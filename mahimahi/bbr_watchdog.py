@@ -0,0 +1,169 @@
+#!/usr/bin/python
+"""Watchdog that bounds how long a single trial may run.
+
+A trial can wedge in several places: the client only stops once the --once
+shell of the emulator exits, the server waits up to 120 seconds for the client
+to connect, and a failing emulator makes the client exit from inside a child
+process. Sweep runners therefore run every trial driver in a session of its
+own, with a deadline derived from the --time of the trial. On expiry, the
+driver and all its descendants (server, client and Mahimahi shells) are sent
+SIGTERM, so that the shells remove their network configuration and the driver
+removes its traces and partial logs, and whatever is left after a grace
+period is killed. The sweep then waits for the ports of the trial to be
+released before the next trial reuses them.
+"""
+
+import argparse
+from bbr_logging import debug_print_error, debug_print_verbose, debug_print_warn
+from bbr_resources import descendant_pids
+import errno
+import os
+import signal
+import socket
+import subprocess
+import time
+
+# Defaults of the --time, --port and --reverse_traffic flags of bbr_experiment.py.
+DRIVER_DEFAULT_TIME_SECS = 60
+DRIVER_DEFAULT_PORT = 5050
+DRIVER_DEFAULT_REVERSE_TRAFFIC = 'none'
+
+# The deadline of a trial is TRIAL_TIMEOUT_FACTOR times its --time, plus
+# TRIAL_TIMEOUT_SLACK_SECS for starting the server and shells, waiting for a
+# pooled shell, parsing the uplink log and archiving the trial.
+TRIAL_TIMEOUT_FACTOR = 2
+TRIAL_TIMEOUT_SLACK_SECS = 180
+
+# Seconds processes are given to exit after SIGTERM before they are killed.
+KILL_GRACE_SECS = 10
+
+# Seconds to wait for the ports of a killed trial to be released.
+PORT_RELEASE_SECS = 30
+
+# Exit status of a trial that was killed by the watchdog.
+TIMED_OUT = None
+
+
+def driver_settings(driver_args):
+    """Return the (--time, --port) a trial driver runs with, given its arguments."""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--time', type=int, default=DRIVER_DEFAULT_TIME_SECS)
+    parser.add_argument('--port', type=int, default=DRIVER_DEFAULT_PORT)
+    parsed_args, _ = parser.parse_known_args(driver_args)
+    return parsed_args.time, parsed_args.port
+
+
+def driver_ports(driver_args):
+    """Return the ports a trial driver listens on given its arguments: --port, and --port + 1 for reverse traffic."""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--port', type=int, default=DRIVER_DEFAULT_PORT)
+    parser.add_argument('--reverse_traffic', type=str, default=DRIVER_DEFAULT_REVERSE_TRAFFIC)
+    parsed_args, _ = parser.parse_known_args(driver_args)
+    if parsed_args.reverse_traffic == DRIVER_DEFAULT_REVERSE_TRAFFIC:
+        return [parsed_args.port]
+    return [parsed_args.port, parsed_args.port + 1]
+
+
+def trial_timeout_secs(trial_secs):
+    """Return the deadline of a trial whose trace lasts trial_secs seconds."""
+    return TRIAL_TIMEOUT_FACTOR * trial_secs + TRIAL_TIMEOUT_SLACK_SECS
+
+
+def _signal_processes(pids, sig, group=None):
+    if group is not None:
+        try:
+            os.killpg(group, sig)
+        except OSError:
+            pass
+    for pid in pids:
+        try:
+            # Members of the group were signalled already, and would handle the signal twice.
+            if group is None or os.getpgid(pid) != group:
+                os.kill(pid, sig)
+        except OSError:
+            pass
+
+
+def _alive(pid):
+    # Exited children that were not reaped yet are zombies, and count as gone.
+    try:
+        with open("/proc/%d/stat" % pid, 'r') as stat_file:
+            stat = stat_file.read()
+    except (IOError, OSError):
+        return False
+    return stat[stat.rindex(')') + 2] != 'Z'
+
+
+def kill_process_tree(pid, grace_secs=KILL_GRACE_SECS, group=False):
+    """Terminate the process pid and all its descendants, killing those left after grace_secs.
+
+    group: Whether pid leads a process group, whose members are signalled too
+    even if they were orphaned by their parent.
+    """
+    pids = [pid] + descendant_pids(pid)
+    group_id = pid if group else None
+    debug_print_verbose("Terminating processes: " + ' '.join(str(p) for p in pids))
+    _signal_processes(pids, signal.SIGTERM, group_id)
+    deadline = time.time() + grace_secs
+    while time.time() < deadline and any(_alive(p) for p in pids):
+        time.sleep(0.2)
+    # Processes started during the grace period are killed too.
+    pids = [p for p in pids + descendant_pids(pid) if _alive(p)]
+    if pids:
+        debug_print_warn("Killing processes that ignored SIGTERM: " + ' '.join(str(p) for p in pids))
+        _signal_processes(pids, signal.SIGKILL, group_id)
+
+
+def _port_in_use(port):
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # Like the server, so that connections of the trial in TIME_WAIT do not count.
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        s.bind(('', port))
+        return False
+    except socket.error as e:
+        if e.errno != errno.EADDRINUSE:
+            raise
+        return True
+    finally:
+        s.close()
+
+
+def wait_for_port_release(ports, timeout_secs=PORT_RELEASE_SECS):
+    """Wait until no socket listens on any of ports anymore. Returns whether they were all released."""
+    deadline = time.time() + timeout_secs
+    while True:
+        in_use = [port for port in ports if _port_in_use(port)]
+        if not in_use:
+            return True
+        if time.time() > deadline:
+            debug_print_error("Ports %s are still in use %d seconds after the trial was killed." %
+                              (' '.join(str(port) for port in in_use), timeout_secs))
+            return False
+        time.sleep(0.5)
+
+
+def run_with_deadline(command, timeout_secs, poll_fn=None):
+    """Run a trial command in a new session, killing its process tree after timeout_secs.
+
+    poll_fn: Optional. Called about every 0.2 seconds while the trial runs, e.g. to send heartbeats.
+
+    Returns the exit status of the trial, or TIMED_OUT if it was killed.
+    """
+    proc = subprocess.Popen(command, preexec_fn=os.setsid)
+    deadline = time.time() + timeout_secs
+    try:
+        while proc.poll() is None:
+            if time.time() > deadline:
+                debug_print_error("Trial did not finish within %d seconds, killing it." % timeout_secs)
+                kill_process_tree(proc.pid, group=True)
+                proc.wait()
+                return TIMED_OUT
+            if poll_fn:
+                poll_fn()
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        # The trial is in a session of its own, so it does not get the SIGINT of the terminal.
+        kill_process_tree(proc.pid, group=True)
+        raise
+    return proc.returncode
@@ -0,0 +1,118 @@
+#!/usr/bin/python
+"""Workloads of the client and server, besides the default bulk transfer.
+
+flows: the client runs fixed-size transfers one after another, each on a new
+    connection, with sizes drawn from a distribution. The flow completion
+    time (FCT) of a transfer runs from the start of its connection to the
+    acknowledgement of its last byte by the server.
+rpc: the client sends requests over a single connection at a target rate,
+    with exponentially distributed gaps, and the server answers each with a
+    response of fixed size. The latency of a request runs from the time it was
+    scheduled to be sent to the receipt of its full response, so that requests
+    delayed by a congested connection are accounted for.
+
+Every transfer or request starts with a header giving the number of bytes the
+client sends and the number of bytes the server responds with. The client
+appends one line per completed transfer to a measurement file, which the
+driver summarizes into percentiles once the trial is over.
+"""
+import math
+import random
+import socket
+import struct
+
+WORKLOADS = ['bulk', 'flows', 'rpc']
+FLOW_SIZE_DISTRIBUTIONS = ['fixed', 'exponential', 'pareto']
+
+# Shape of the Pareto flow size distribution, heavy tailed as in data center traces.
+PARETO_SHAPE = 1.2
+
+# Header of a transfer: bytes sent by the client, bytes responded by the server.
+HEADER_FORMAT = "!II"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# Size of the buffers transfers are sent in.
+CHUNK_SIZE = 65536
+
+# Latency percentiles stored with each result.
+LATENCY_PERCENTILES = [50, 95, 99]
+
+
+def sample_flow_size(distribution, mean_size, rng=random):
+    """Draw a flow size in bytes with the given mean from the named distribution."""
+    if distribution == 'exponential':
+        size = rng.expovariate(1.0 / mean_size)
+    elif distribution == 'pareto':
+        # Scale so that the mean of the distribution is mean_size.
+        size = rng.paretovariate(PARETO_SHAPE) * mean_size * (PARETO_SHAPE - 1) / PARETO_SHAPE
+    else:
+        size = mean_size
+    return max(int(size), 1)
+
+
+def pack_header(request_bytes, response_bytes):
+    """Return the header of a transfer."""
+    return struct.pack(HEADER_FORMAT, request_bytes, response_bytes)
+
+
+def unpack_header(data):
+    """Return (request bytes, response bytes) of a transfer header."""
+    return struct.unpack(HEADER_FORMAT, data)
+
+
+def send_bytes(sock, num_bytes):
+    """Send num_bytes bytes of filler data on a socket."""
+    chunk = b'x' * min(num_bytes, CHUNK_SIZE)
+    while num_bytes > 0:
+        sock.sendall(chunk[:num_bytes])
+        num_bytes -= len(chunk)
+
+
+def recv_exact(sock, num_bytes, should_stop=None):
+    """Receive exactly num_bytes bytes from a socket.
+
+    Returns the data, or None if the connection was closed or should_stop()
+    returned true while waiting on a socket with a timeout.
+    """
+    data = []
+    remaining = num_bytes
+    while remaining > 0:
+        try:
+            chunk = sock.recv(min(remaining, CHUNK_SIZE))
+        except socket.timeout:
+            if should_stop is not None and should_stop():
+                return None
+            continue
+        if not chunk:
+            return None
+        data.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(data)
+
+
+def percentile(sorted_values, percent):
+    """Return the nearest-rank percentile of a sorted list of values."""
+    if not sorted_values:
+        return None
+    rank = int(math.ceil(percent / 100.0 * len(sorted_values)))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+def summarize_measurements(measurement_file):
+    """Summarize a measurement file written by the client into result columns.
+
+    Each line of the file is "<latency ms> <bytes>". Returns a dictionary with
+    the number of completed transfers and the latency percentiles.
+    """
+    latencies = []
+    with open(measurement_file, 'r') as measurements:
+        for line in measurements:
+            fields = line.split()
+            if len(fields) == 2:
+                latencies.append(float(fields[0]))
+    latencies.sort()
+    summary = {"completed_transfers": len(latencies)}
+    for percent in LATENCY_PERCENTILES:
+        value = percentile(latencies, percent)
+        summary["latency_p%d_ms" % percent] = '' if value is None else round(value, 3)
+    return summary
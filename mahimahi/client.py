@@ -1,27 +1,161 @@
 #!/usr/bin/python
 """Client that sends to server."""
 
+from bbr_buffers import DEFAULT_SOCKET_BUFFER_BYTES, report_granted_buffer
 from bbr_logging import debug_print, debug_print_error, debug_print_verbose
+from bbr_resources import set_cpu_affinity
+from bbr_workload import pack_header, recv_exact, sample_flow_size, send_bytes
+from collections import deque
 import os
 import random
 import socket
 import string
+import threading
 import time
 
 
-def run_client(cong_control, size=1024, address=(os.environ.get("MAHIMAHI_BASE") or "127.0.0.1"), port=5050):
-    """Run the client."""
+def _connect(cong_control, address, port, verbose=True, buffer_bytes=DEFAULT_SOCKET_BUFFER_BYTES):
+    """Return a socket connected to the server with the given congestion control, or None on failure."""
     TCP_CONGESTION = 13
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
     s.setsockopt(socket.IPPROTO_TCP, TCP_CONGESTION, cong_control)
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 6553600)
-    debug_print("Client Connecting to: " + str(address) + ":" + str(port))
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, buffer_bytes)
+    if verbose:
+        debug_print("Client Connecting to: " + str(address) + ":" + str(port))
     try:
         s.connect((address, port))
     except socket.error as msg:
         debug_print_error("Cannot Connect: " + str(msg))
+        return None
+    return s
+
+
+def _record(measurements, latency_secs, num_bytes):
+    # Flushed on every line, the client is killed when the emulated link shuts down.
+    measurements.write("%.3f %d\n" % (latency_secs * 1000, num_bytes))
+    measurements.flush()
+
+
+def run_flows(cong_control, address, port, workload_args, measurement_file, buffer_bytes=DEFAULT_SOCKET_BUFFER_BYTES,
+              sndbuf_file=None):
+    """Run fixed-size transfers one after another, recording their flow completion times."""
+    rng = random.Random(workload_args.get("seed"))
+    distribution = workload_args["flow_size_dist"]
+    mean_size = workload_args["flow_size"]
+    debug_print("Client Starting %s Flows of %d bytes on average..." % (distribution, mean_size))
+    with open(measurement_file, 'a') as measurements:
+        while True:
+            size = sample_flow_size(distribution, mean_size, rng)
+            start_time = time.time()
+            s = _connect(cong_control, address, port, verbose=False, buffer_bytes=buffer_bytes)
+            if s is None:
+                return
+            # All flows ask for the same send buffer, the one of the first is reported.
+            report_granted_buffer(sndbuf_file, s, socket.SO_SNDBUF)
+            sndbuf_file = None
+            try:
+                s.sendall(pack_header(size, 1))
+                send_bytes(s, size)
+                if recv_exact(s, 1) is None:
+                    debug_print_error("Server closed the connection.")
+                    return
+            except socket.error as e:
+                debug_print_error("Socket Send Exception: " + str(e))
+                return
+            finally:
+                s.close()
+            _record(measurements, time.time() - start_time, size)
+
+
+def run_requests(cong_control, address, port, workload_args, measurement_file,
+                 buffer_bytes=DEFAULT_SOCKET_BUFFER_BYTES, sndbuf_file=None):
+    """Send requests at a target rate over one connection, recording their latencies."""
+    rng = random.Random(workload_args.get("seed"))
+    rate = workload_args["request_rate"]
+    request_size = workload_args["request_size"]
+    response_size = workload_args["response_size"]
+    s = _connect(cong_control, address, port, buffer_bytes=buffer_bytes)
+    if s is None:
+        return
+    report_granted_buffer(sndbuf_file, s, socket.SO_SNDBUF)
+    # Send requests right away instead of waiting for the acknowledgement of the previous one.
+    s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    request = pack_header(request_size, response_size) + b'x' * request_size
+    debug_print("Client Starting Requests at %g per second..." % rate)
+
+    # Scheduled send times of the requests awaiting their response, in order.
+    scheduled_times = deque()
+    measurements = open(measurement_file, 'a')
+
+    def receive_responses():
+        while recv_exact(s, response_size) is not None:
+            _record(measurements, time.time() - scheduled_times.popleft(), response_size)
+
+    receiver = threading.Thread(target=receive_responses)
+    receiver.daemon = True
+    receiver.start()
+
+    next_time = time.time()
+    while True:
+        delay = next_time - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        scheduled_times.append(next_time)
+        try:
+            s.sendall(request)
+        except socket.error as e:
+            debug_print_error("Socket Send Exception: " + str(e))
+            return
+        next_time += rng.expovariate(rate)
+
+
+def receive_reverse_traffic(address, port, size=1024, buffer_bytes=DEFAULT_SOCKET_BUFFER_BYTES):
+    """Receive and discard the reverse bulk traffic of server.ReverseSender until it closes the connection."""
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer_bytes)
+    try:
+        s.connect((address, port))
+    except socket.error as msg:
+        debug_print_error("Cannot Connect for reverse traffic: " + str(msg))
+        return
+    debug_print("Client Receiving Reverse Traffic...")
+    try:
+        while s.recv(size):
+            pass
+    except socket.error as e:
+        debug_print_verbose("Reverse connection closed: " + str(e))
+    s.close()
+
+
+def run_client(cong_control, size=1024, address=(os.environ.get("MAHIMAHI_BASE") or "127.0.0.1"), port=5050,
+               cpus=None, workload='bulk', workload_args=None, measurement_file=None,
+               buffer_bytes=DEFAULT_SOCKET_BUFFER_BYTES, reverse_port=None, sndbuf_file=None):
+    """Run the client, pinned to the given list of CPUs if any, with a send buffer of buffer_bytes.
+
+    workload: 'bulk' sends messages of size bytes forever. 'flows' and 'rpc'
+    run the workloads of bbr_workload.py with the given workload_args and
+    append their measurements to measurement_file.
+    reverse_port: Optional. Port of a server.ReverseSender to receive reverse
+    traffic from while the workload runs.
+    sndbuf_file: Optional. File the send buffer size granted to the connected
+    socket is written to.
+    """
+    set_cpu_affinity(0, cpus)
+    if reverse_port:
+        receiver = threading.Thread(target=receive_reverse_traffic, args=(address, reverse_port, size, buffer_bytes))
+        receiver.daemon = True
+        receiver.start()
+    if workload == 'flows':
+        return run_flows(cong_control, address, port, workload_args, measurement_file, buffer_bytes, sndbuf_file)
+    if workload == 'rpc':
+        return run_requests(cong_control, address, port, workload_args, measurement_file, buffer_bytes,
+                            sndbuf_file)
+
+    s = _connect(cong_control, address, port, buffer_bytes=buffer_bytes)
+    if s is None:
         return
+    report_granted_buffer(sndbuf_file, s, socket.SO_SNDBUF)
 
     debug_print("Connection Established.")
     # Generate a random message of SIZE a single time. Send this over and over.
@@ -0,0 +1,10 @@
+"""
+Fixtures shared by the tests of the experiment scripts
+"""
+import pytest
+
+
+@pytest.fixture
+def work_dir(tmp_path):
+    """Return the path of an empty directory for the files of a test, as a string."""
+    return str(tmp_path)
@@ -18,11 +18,4 @@ rm -f $LOG_FILE
 # Run experiment.
 echo "Running  experiment 1: effect of bandwidth"
 
-for cc in $CONGESTION_CONTROL; do
-  for loss_rate in $LOSS_RATES; do
-    for bw in $BW_MBPS; do
-      echo "Executing trial with cc=$cc Loss rate: $loss_rate Bandwidth: $bw ..."
-      ./bbr_experiment.py --cc=$cc --loss=$loss_rate --bw=$bw --time 30 --output_file=$LOG_FILE $@
-    done
-  done
-done
+./bbr_sweep.py --cc $CONGESTION_CONTROL --loss $LOSS_RATES --bw $BW_MBPS --time=30 --output_file=$LOG_FILE $@
@@ -19,11 +19,4 @@ rm -f $LOG_FILE
 # Run experiment.
 echo "Running experiment 3: effect of RTT"
 
-for cc in $CONGESTION_CONTROL; do
-  for loss_rate in $LOSS_RATES; do
-    for rtt in $RTTS_MS; do
-      echo "Executing trial with cc=$cc Loss rate: $loss_rate RTT (ms): $rtt ..."
-      ./bbr_experiment.py --cc=$cc --loss=$loss_rate --time 120 --rtt=$rtt --output_file=$LOG_FILE $@
-    done
-  done
-done
+./bbr_sweep.py --cc $CONGESTION_CONTROL --loss $LOSS_RATES --rtt $RTTS_MS --time=120 --output_file=$LOG_FILE $@
@@ -0,0 +1,24 @@
+#!/bin/bash
+
+# This script simple runs an experiment for looking at the effect of the
+# bottleneck queue discipline and size on CUBIC and BBR. Queue sizes are
+# multiples of the bandwidth delay product so that we cover both the shallow
+# and deep buffers found in real routers.
+
+set -x # Enable logging of executed commands.
+set -e # Stop if any error occurs.
+mkdir -p data
+
+LOSS_RATES="0.001 0.01 0.1 1 2 5 10 20"
+QUEUES="droptail codel pie"
+QUEUE_SIZES="0.1bdp 1bdp 10bdp"
+CONGESTION_CONTROL="cubic bbr"
+LOG_FILE=data/experiment5.csv
+
+# Clear any existing data.
+rm -f $LOG_FILE
+
+# Run experiment.
+echo "Running experiment 5: effect of bottleneck queue"
+
+./bbr_sweep.py --cc $CONGESTION_CONTROL --loss $LOSS_RATES --queue $QUEUES --queue_size $QUEUE_SIZES --time=30 --output_file=$LOG_FILE $@
@@ -0,0 +1,22 @@
+#!/bin/bash
+
+# This script simple runs an experiment for looking at latency sensitive
+# workloads: short flows, where slow start and loss recovery dominate the flow
+# completion time, and requests sent at a fixed rate.
+
+set -x # Enable logging of executed commands.
+set -e # Stop if any error occurs.
+mkdir -p data
+
+LOSS_RATES="0.001 0.01 0.1 1 2 5 10 20"
+CONGESTION_CONTROL="cubic bbr"
+WORKLOADS="flows rpc"
+LOG_FILE=data/experiment6.csv
+
+# Clear any existing data.
+rm -f $LOG_FILE
+
+# Run experiment.
+echo "Running experiment 6: flow completion time and request latency"
+
+./bbr_sweep.py --cc $CONGESTION_CONTROL --loss $LOSS_RATES --workload $WORKLOADS --flow_size_dist=pareto --time=30 --output_file=$LOG_FILE $@
@@ -12,6 +12,8 @@ set -e # Stop if any error occurs.
 ./run_experiment2.sh $@
 ./run_experiment3.sh $@
 ./run_experiment4.sh $@
+./run_experiment5.sh $@
+./run_experiment6.sh $@
 
 # Plot the results.
 ./bbr_plot.py
@@ -0,0 +1,19 @@
+#!/bin/bash
+
+# This script simple runs the figure 8 experiment in the bbr_sim.py simulator
+# instead of Mahimahi, so its results can be compared with the emulated runs.
+
+set -x # Enable logging of executed commands.
+set -e # Stop if any error occurs.
+mkdir -p data
+
+LOSS_RATES="0.001 0.01 0.1 1 2 5 10 15 20 25 30 40 50"
+CONGESTION_CONTROL="cubic bbr"
+LOG_FILE=data/figure8_sim.csv
+
+# Clear any existing data.
+rm -f $LOG_FILE
+
+# Run experiment.
+echo "Running Figure 8 simulation."
+./bbr_sweep.py --driver=bbr_sim.py --cc $CONGESTION_CONTROL --loss $LOSS_RATES --output_file=$LOG_FILE $@
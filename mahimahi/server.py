@@ -1,43 +1,83 @@
 #!/usr/bin/python
 """Simple Python Server."""
+from bbr_buffers import DEFAULT_SOCKET_BUFFER_BYTES, granted_buffer_bytes
 from bbr_logging import debug_print, debug_print_error, debug_print_verbose
+from bbr_metrics import write_live_stats
+from bbr_workload import recv_exact, send_bytes, HEADER_SIZE, unpack_header
 from multiprocessing import Process
 import os
 import select
 import socket
 import sys
+import threading
 import time
 
 
 class Server(Process):
     """Server class that simply receives data."""
 
-    def __init__(self, outputQueue, event, cc, port=5050, size=1024):
-        """Initialize server with input and output Queues."""
+    def __init__(self, outputQueue, event, cc, port=5050, size=1024, live_stats_file=None, workload='bulk',
+                 buffer_bytes=DEFAULT_SOCKET_BUFFER_BYTES):
+        """Initialize server with input and output Queues.
+
+        live_stats_file: Optional. When set, the server periodically writes its
+        live receive throughput to this file (see bbr_metrics.py).
+        workload: 'bulk' receives a single connection. 'flows' and 'rpc' serve
+        the transfers of bbr_workload.py on any number of connections.
+        buffer_bytes: SO_RCVBUF of the server socket, inherited by its connections.
+
+        When the connection closes, the server sends its goodput estimate and
+        then a dictionary of its receive time series, a list of (elapsed ms,
+        received bytes) samples, and the SO_RCVBUF size granted to its
+        connection (None if no connection was accepted), on outputQueue.
+        """
         super(Server, self).__init__()
         self.outQ = outputQueue
         self.e = event
         self.cc = cc
         self.port = port
         self.size = size
+        self.live_stats_file = live_stats_file
+        self.workload = workload
+        self.buffer_bytes = buffer_bytes
 
     def _handle_connection(self, conn):
+        rcvbuf_bytes = granted_buffer_bytes(conn, socket.SO_RCVBUF)
         num_msg = 0
         start_time = time.time()
         conn.setblocking(0)  # set to non-blocking
         timeout_in_seconds = 1.0
         last_log_time_secs = time.time()
         log_interval_secs = 5
+        received_bytes = 0
+        last_stats_time_secs = start_time
+        last_stats_bytes = 0
+        stats_interval_secs = 1
+        timeseries = [(0, 0)]
+        last_sample_time_secs = start_time
+        sample_interval_secs = 0.1
         while not self.e.is_set():
             time_now_secs = time.time()
             delta_secs = time_now_secs - last_log_time_secs
             if (delta_secs > log_interval_secs):
                 debug_print_verbose("Server Heartbeat. e.is_set()? %s" % self.e.is_set())
                 last_log_time_secs = time_now_secs
+            stats_delta_secs = time_now_secs - last_stats_time_secs
+            if self.live_stats_file and stats_delta_secs >= stats_interval_secs:
+                throughput = (received_bytes - last_stats_bytes) * 8 / stats_delta_secs / 1e6
+                write_live_stats(self.live_stats_file, {
+                    "received_bytes": received_bytes,
+                    "elapsed_secs": time_now_secs - start_time,
+                    "throughput_Mbps": throughput})
+                last_stats_time_secs = time_now_secs
+                last_stats_bytes = received_bytes
+            if time_now_secs - last_sample_time_secs >= sample_interval_secs:
+                timeseries.append((int((time_now_secs - start_time) * 1000), received_bytes))
+                last_sample_time_secs = time_now_secs
             ready = select.select([conn], [], [], timeout_in_seconds)
             if ready[0]:
                 # Only read the data if there is data to receive.
-                conn.recv(self.size)
+                received_bytes += len(conn.recv(self.size))
             num_msg += 1
 
         # Once the event is set, break out
@@ -49,12 +89,68 @@ class Server(Process):
 
         # Send the Goodput back to the master
         self.outQ.put(("Estimated goodput: " + str(goodput), None))
+        self.outQ.put(({"timeseries": timeseries, "rcvbuf_bytes": rcvbuf_bytes}, None))
+
+    def _serve_transfer_connection(self, conn, counter):
+        # Answer every transfer of the connection until it is closed.
+        conn.settimeout(1.0)
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while not self.e.is_set():
+                header = recv_exact(conn, HEADER_SIZE, self.e.is_set)
+                if header is None:
+                    break
+                request_bytes, response_bytes = unpack_header(header)
+                if recv_exact(conn, request_bytes, self.e.is_set) is None:
+                    break
+                with counter["lock"]:
+                    counter["received_bytes"] += HEADER_SIZE + request_bytes
+                send_bytes(conn, response_bytes)
+        except socket.error as e:
+            debug_print_verbose("Transfer connection closed: " + str(e))
+        conn.close()
+
+    def _serve_transfers(self, s):
+        """Serve flows or requests on all connections until the event is set."""
+        s.settimeout(0.1)
+        start_time = time.time()
+        counter = {"lock": threading.Lock(), "received_bytes": 0}
+        timeseries = [(0, 0)]
+        last_stats_time_secs = start_time
+        last_stats_bytes = 0
+        rcvbuf_bytes = None
+        while not self.e.is_set():
+            try:
+                conn, _ = s.accept()
+                if rcvbuf_bytes is None:
+                    rcvbuf_bytes = granted_buffer_bytes(conn, socket.SO_RCVBUF)
+                handler = threading.Thread(target=self._serve_transfer_connection, args=(conn, counter))
+                handler.daemon = True
+                handler.start()
+            except socket.timeout:
+                pass
+            time_now_secs = time.time()
+            received_bytes = counter["received_bytes"]
+            if (time_now_secs - start_time) * 1000 - timeseries[-1][0] >= 100:
+                timeseries.append((int((time_now_secs - start_time) * 1000), received_bytes))
+            stats_delta_secs = time_now_secs - last_stats_time_secs
+            if self.live_stats_file and stats_delta_secs >= 1:
+                write_live_stats(self.live_stats_file, {
+                    "received_bytes": received_bytes,
+                    "elapsed_secs": time_now_secs - start_time,
+                    "throughput_Mbps": (received_bytes - last_stats_bytes) * 8 / stats_delta_secs / 1e6})
+                last_stats_time_secs = time_now_secs
+                last_stats_bytes = received_bytes
+
+        goodput = counter["received_bytes"] * 8 / (time.time() - start_time) / 1e6
+        self.outQ.put(("Estimated goodput: " + str(goodput), None))
+        self.outQ.put(({"timeseries": timeseries, "rcvbuf_bytes": rcvbuf_bytes}, None))
 
     def run(self):
         """Run the server continuously."""
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 6553600)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.buffer_bytes)
         s.settimeout(120)
         try:
             s.bind(('', self.port))
@@ -63,6 +159,14 @@ class Server(Process):
             self.outQ.put((None, e))
             sys.exit(-1)
 
+        if self.workload != 'bulk':
+            s.listen(16)
+            debug_print("Server serving %s on port %d" % (self.workload, self.port))
+            self._serve_transfers(s)
+            s.close()
+            debug_print("Shutdown server")
+            return
+
         s.listen(1)  # only have 1 connection
         debug_print("Server awaiting connection on port %d" % self.port)
 
@@ -72,3 +176,55 @@ class Server(Process):
         s.shutdown(socket.SHUT_RDWR)
         s.close()
         debug_print("Shutdown server")
+
+
+class ReverseSender(Process):
+    """Sender of the reverse bulk traffic of a trial, from outside the emulated link to the client."""
+
+    def __init__(self, event, cc, port, size=1024, buffer_bytes=DEFAULT_SOCKET_BUFFER_BYTES):
+        """Initialize a sender of size byte messages with the given congestion control on port.
+
+        It sends to the first connection it accepts until event is set.
+        """
+        super(ReverseSender, self).__init__()
+        self.e = event
+        self.cc = cc
+        self.port = port
+        self.size = size
+        self.buffer_bytes = buffer_bytes
+
+    def run(self):
+        """Send to the client until the event is set."""
+        TCP_CONGESTION = 13
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Accepted connections inherit the congestion control and send buffer.
+        s.setsockopt(socket.IPPROTO_TCP, TCP_CONGESTION, self.cc)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.buffer_bytes)
+        s.settimeout(120)
+        try:
+            s.bind(('', self.port))
+        except Exception as e:
+            debug_print_error("Binding Error: " + str(e))
+            sys.exit(-1)
+        s.listen(1)
+        debug_print("Reverse sender awaiting connection on port %d" % self.port)
+        try:
+            conn, _ = s.accept()
+        except socket.timeout:
+            debug_print_error("The client never connected for the reverse traffic.")
+            sys.exit(-1)
+        debug_print("Reverse sender accepted connection")
+        conn.settimeout(1.0)
+        msg = b'x' * self.size
+        while not self.e.is_set():
+            try:
+                conn.send(msg)
+            except socket.timeout:
+                continue
+            except socket.error as e:
+                debug_print_verbose("Reverse connection closed: " + str(e))
+                break
+        conn.close()
+        s.close()
+        debug_print("Shutdown reverse sender")
@@ -0,0 +1,101 @@
+#!/usr/bin/python
+
+"""
+Test code for archiving the raw artifacts of trials
+"""
+import bbr_archive
+from bbr_logging import debug_print
+import os
+import pytest
+
+UPLINK_LOG = """# mahimahi mm-link [up] 12 12
+# init timestamp: 1500000000000
+# base timestamp: 1500000000000
+0 # 1500
+0 + 1500
+3 - 1500 3
+5 d 2 3000
+4294967296 + 1500
+4294967300 - 1500 4
+"""
+
+
+DOWNLINK_LOG = """# mahimahi mm-link [down] 12 12
+# init timestamp: 1500000000000
+# base timestamp: 1500000000000
+0 # 1500
+1 + 52
+1 - 52 0
+2 d 1 52
+"""
+
+
+def _write_log(test_dir, name, contents):
+    if contents is None:
+        return None
+    log_file = os.path.join(test_dir, name)
+    with open(log_file, "w") as log:
+        log.write(contents)
+    return log_file
+
+
+def _round_trip(test_dir, server_timeseries, uplink_log=None, downlink_log=None):
+    filename = os.path.join(test_dir, "trial" + bbr_archive.archive_suffix())
+    bbr_archive.archive_trial(filename, {"config": {"rtt": 10}}, _write_log(test_dir, "uplink_log", uplink_log),
+                              server_timeseries, _write_log(test_dir, "downlink_log", downlink_log))
+    return bbr_archive.TrialArchive(filename)
+
+
+def _restore(test_dir, trial_archive, table):
+    restored_log = os.path.join(test_dir, "restored_" + table)
+    bbr_archive.write_link_log(trial_archive, restored_log, table)
+    with open(restored_log, "r") as log:
+        return log.read()
+
+
+def test_server_timeseries_above_2_31(work_dir):
+    samples = [(0, 0), (100, 1500000000), (200, 3000000000), (2 ** 33, 2 ** 40)]
+    trial_archive = _round_trip(work_dir, samples)
+    assert trial_archive.metadata == {"config": {"rtt": 10}}
+    assert list(trial_archive.iter_rows(bbr_archive.SERVER_TABLE)) == samples
+
+
+def test_uplink_log_round_trip(work_dir):
+    trial_archive = _round_trip(work_dir, [], UPLINK_LOG)
+    assert _restore(work_dir, trial_archive, bbr_archive.UPLINK_LOG_TABLE) == UPLINK_LOG
+    assert _restore(work_dir, trial_archive, bbr_archive.DOWNLINK_LOG_TABLE) == ""
+
+
+def test_downlink_log_round_trip(work_dir):
+    trial_archive = _round_trip(work_dir, [(0, 0)], UPLINK_LOG, DOWNLINK_LOG)
+    assert _restore(work_dir, trial_archive, bbr_archive.UPLINK_LOG_TABLE) == UPLINK_LOG
+    assert _restore(work_dir, trial_archive, bbr_archive.DOWNLINK_LOG_TABLE) == DOWNLINK_LOG
+    assert list(trial_archive.iter_rows(bbr_archive.SERVER_TABLE)) == [(0, 0)]
+
+
+def test_archive_without_downlink_log(work_dir):
+    # Archives written before downlink logs were archived.
+    filename = os.path.join(work_dir, "trial" + bbr_archive.archive_suffix())
+    writer = bbr_archive.ArchiveWriter(filename, {}, {bbr_archive.SERVER_TABLE: bbr_archive.SERVER_COLUMNS})
+    writer.close()
+    trial_archive = bbr_archive.TrialArchive(filename)
+    with pytest.raises(ValueError):
+        bbr_archive.write_link_log(trial_archive, os.path.join(work_dir, "restored"),
+                                   bbr_archive.DOWNLINK_LOG_TABLE)
+
+
+def test_chunked_round_trip(work_dir, monkeypatch):
+    monkeypatch.setattr(bbr_archive, "CHUNK_ROWS", 4)
+    samples = [(i * 10, 2 ** 31 + i * 1500) for i in range(10)]
+    trial_archive = _round_trip(work_dir, samples)
+    chunks = list(trial_archive.iter_chunks(bbr_archive.SERVER_TABLE))
+    assert [len(columns[0]) for _, columns in chunks] == [4, 4, 2]
+    assert list(trial_archive.iter_rows(bbr_archive.SERVER_TABLE)) == samples
+
+
+def main():
+    if pytest.main([__file__]) == 0:
+        debug_print("Archive tests passed")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/python
+
+"""
+Test code for sizing socket buffers from the bandwidth delay product
+"""
+import bbr_buffers
+from bbr_experiment import bdp_bytes
+from bbr_logging import debug_print
+import os
+import pytest
+import socket
+
+
+def test_socket_buffer_bytes():
+    # 100 Mbps and 100 ms, the setting of figure 8.
+    assert bdp_bytes(100, 100) == 1250000
+    assert bbr_buffers.socket_buffer_bytes(bdp_bytes(100, 100), 5) == 6250000
+    assert bbr_buffers.socket_buffer_bytes(bdp_bytes(100, 100), 0.5) == 625000
+    # Low BDP trials still get a few packets worth of buffer.
+    assert bbr_buffers.socket_buffer_bytes(bdp_bytes(1, 1), 5) == bbr_buffers.MIN_SOCKET_BUFFER_BYTES
+
+
+def test_check_buffer_limits():
+    limits = {"wmem_max": 212992, "rmem_max": 8388608, "tcp_wmem": 4194304}
+    warnings = bbr_buffers.check_buffer_limits(6250000, limits)
+    assert len(warnings) == 2
+    assert "net.core.wmem_max" in warnings[0]
+    assert "net.ipv4.tcp_wmem" in warnings[1]
+    assert bbr_buffers.check_buffer_limits(100000, limits) == []
+    assert bbr_buffers.check_buffer_limits(6250000, {}) == []
+
+
+def test_report_granted_buffer(work_dir):
+    report_file = os.path.join(work_dir, "sndbuf")
+    open(report_file, 'w').close()
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        assert bbr_buffers.read_granted_buffer(report_file) is None
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, bbr_buffers.MIN_SOCKET_BUFFER_BYTES)
+        bbr_buffers.report_granted_buffer(report_file, s, socket.SO_SNDBUF)
+        granted = bbr_buffers.read_granted_buffer(report_file)
+        assert granted == s.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+        assert granted >= bbr_buffers.MIN_SOCKET_BUFFER_BYTES
+        bbr_buffers.report_granted_buffer(None, s, socket.SO_SNDBUF)
+    finally:
+        s.close()
+    os.remove(report_file)
+    assert bbr_buffers.read_granted_buffer(report_file) is None
+
+
+def main():
+    if pytest.main([__file__]) == 0:
+        debug_print("Buffer tests passed")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/python
+
+"""
+Test code for comparing result sets against a baseline
+"""
+import bbr_compare
+from bbr_logging import debug_print
+from bbr_results import STATUS_FAILED
+
+
+def _row(cc, loss_rate, goodput, status=''):
+    row = dict((column, '') for column in bbr_compare.CONFIG_COLUMNS)
+    row.update({"congestion_control": cc, "rtt_ms": 100.0, "specified_bw_Mbps": 100.0,
+                "loss_rate": loss_rate, "goodput_Mbps": goodput, "status": status})
+    return row
+
+
+def _curve(cc, goodputs):
+    return [_row(cc, loss_rate, goodput) for loss_rate, goodput in zip([0.001, 0.01, 0.1], goodputs)]
+
+
+def _compare(baseline_rows, candidate_rows, threshold=10.0, min_delta=0.5, sigmas=3.0):
+    points, unmatched = bbr_compare.compare_metric(baseline_rows, candidate_rows, "goodput_Mbps",
+                                                   threshold, min_delta, sigmas)
+    return points, bbr_compare.compare_curves(points, "goodput_Mbps"), unmatched
+
+
+def test_point_tolerances():
+    baseline = _curve("cubic", [90.0, 50.0, 2.0])
+    points, _, unmatched = _compare(baseline, _curve("cubic", [70.0, 49.8, 1.0]))
+    assert unmatched == []
+    assert [point["key"][-1] for point in points] == [0.001, 0.01, 0.1]
+    # -20 Mbps is beyond 10% of 90, -0.2 Mbps is within --min_delta.
+    assert [point["regressed"] for point in points] == [True, False, True]
+    assert abs(points[0]["relative_delta"] + 20.0 / 90) < 1e-9
+    assert points[0]["tolerance"] == 9.0
+    assert points[2]["tolerance"] == 0.5
+
+
+def test_point_variance_tolerance():
+    baseline = [_row("cubic", 0.01, goodput) for goodput in [40.0, 50.0, 60.0]]
+    candidate = [_row("cubic", 0.01, goodput) for goodput in [30.0, 40.0, 50.0]]
+    points, _, _ = _compare(baseline, candidate)
+    # Standard error of the difference is sqrt(100 / 3 + 100 / 3).
+    assert abs(points[0]["tolerance"] - 3 * (200.0 / 3) ** 0.5) < 1e-9
+    assert not points[0]["regressed"]
+
+
+def test_failed_trials_and_unmatched_points():
+    baseline = _curve("cubic", [90.0, 50.0, 2.0])
+    candidate = _curve("cubic", [90.0, 50.0, 2.0])[:2] + [_row("cubic", 0.1, 0.0, STATUS_FAILED)]
+    points, _, unmatched = _compare(baseline, candidate)
+    assert len(points) == 2
+    assert [key[-1] for key in unmatched] == [0.1]
+
+
+def test_curve_sums_changes():
+    baseline = _curve("cubic", [10.0, 5.0, 1.0])
+    points, curves, _ = _compare(baseline, _curve("cubic", [9.6, 4.6, 0.6]))
+    # Every point lost 0.4 Mbps, within its tolerance of 1.0, 0.5 and 0.5.
+    assert not any(point["regressed"] for point in points)
+    assert abs(curves[0]["delta"] + 1.2) < 1e-9
+    assert abs(curves[0]["tolerance"] - 2.0) < 1e-9
+    assert not curves[0]["regressed"]
+
+    # A regressed point is offset by improvements elsewhere on the curve.
+    points, curves, _ = _compare(baseline, _curve("cubic", [8.0, 5.5, 1.5]))
+    assert curves[0]["regressed_points"] == 1
+    assert not curves[0]["regressed"]
+
+    points, curves, _ = _compare(baseline, _curve("cubic", [7.5, 5.0, 1.0]))
+    assert curves[0]["regressed"]
+
+
+def test_curve_weighted_by_baseline():
+    # Halving a point with almost no goodput must not regress the whole curve.
+    baseline = _curve("cubic", [90.0, 50.0, 0.2])
+    points, curves, _ = _compare(baseline, _curve("cubic", [90.0, 50.0, 0.1]))
+    assert abs(points[2]["relative_delta"] + 0.5) < 1e-9
+    assert abs(curves[0]["relative_delta"] + 0.1 / 140.2) < 1e-9
+    assert not curves[0]["regressed"]
+
+
+def test_curve_lower_is_better():
+    baseline = [dict(_row("bbr", 0.01, ''), queue_delay_p95_ms=10.0)]
+    candidate = [dict(_row("bbr", 0.01, ''), queue_delay_p95_ms=30.0)]
+    points, _ = bbr_compare.compare_metric(baseline, candidate, "queue_delay_p95_ms", 10.0, 0.5, 3.0)
+    curves = bbr_compare.compare_curves(points, "queue_delay_p95_ms")
+    assert points[0]["regressed"] and curves[0]["regressed"]
+    points, _ = bbr_compare.compare_metric(candidate, baseline, "queue_delay_p95_ms", 10.0, 0.5, 3.0)
+    curves = bbr_compare.compare_curves(points, "queue_delay_p95_ms")
+    assert not points[0]["regressed"] and not curves[0]["regressed"]
+
+
+def test_workloads_are_not_averaged():
+    rows = [dict(_row("bbr", 0.01, 90.0), workload="bulk", latency_p99_ms=''),
+            dict(_row("bbr", 0.01, 20.0), workload="flows", latency_p99_ms=300.0),
+            dict(_row("bbr", 0.01, 5.0), workload="rpc", latency_p99_ms=80.0)]
+    candidate = [dict(row) for row in rows]
+    candidate[2]["latency_p99_ms"] = 120.0
+    points, unmatched = bbr_compare.compare_metric(rows, candidate, "goodput_Mbps", 10.0, 0.5, 3.0)
+    assert unmatched == []
+    assert [(point["key"][-2], point["baseline"]) for point in points] == [("bulk", 90.0), ("flows", 20.0),
+                                                                           ("rpc", 5.0)]
+    # Only the latency sensitive workloads record latencies, and higher ones are worse.
+    points, _ = bbr_compare.compare_metric(rows, candidate, "latency_p99_ms", 10.0, 0.5, 3.0)
+    assert [(point["key"][-2], point["regressed"]) for point in points] == [("flows", False), ("rpc", True)]
+    assert bbr_compare.describe_key(points[1]["key"]) == "bbr rtt_ms=100 specified_bw_Mbps=100 workload=rpc loss=1%"
+
+
+def main():
+    test_point_tolerances()
+    test_point_variance_tolerance()
+    test_failed_trials_and_unmatched_points()
+    test_curve_sums_changes()
+    test_curve_weighted_by_baseline()
+    test_curve_lower_is_better()
+    test_workloads_are_not_averaged()
+    debug_print("Comparison tests passed")
+
+if __name__ == '__main__':
+    main()
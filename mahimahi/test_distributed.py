@@ -0,0 +1,148 @@
+#!/usr/bin/python
+
+"""
+Test code for the trial queue of distributed sweeps
+"""
+import bbr_distributed
+from bbr_logging import debug_print
+from bbr_metrics import SweepProgress
+from bbr_results import format_header_row, format_result_row, read_results, STATUS_FAILED, STATUS_OK, \
+    STATUS_TIMEOUT
+import os
+import pytest
+import socket
+import threading
+import time
+
+TRIALS = [[("cc", "cubic")], [("cc", "bbr")]]
+
+
+def _trial_queue(work_dir, **kwargs):
+    progress = SweepProgress(len(TRIALS))
+    output_file = os.path.join(work_dir, "results.csv")
+    return bbr_distributed.TrialQueue(TRIALS, progress, output_file, ["--headless"], **kwargs), output_file
+
+
+def _result(cc):
+    return format_header_row(), [format_result_row({"congestion_control": cc, "status": STATUS_OK})]
+
+
+def test_trials_are_written_in_order(work_dir):
+    trial_queue, output_file = _trial_queue(work_dir)
+    message, first = trial_queue.take("worker1")
+    assert message["trial"] == TRIALS[0] and message["driver_args"] == ["--headless"]
+    _, second = trial_queue.take("worker2")
+    assert trial_queue.take("worker3")[0] == {"type": "wait", "secs": bbr_distributed.WAIT_SECS}
+    trial_queue.finish(second, True, *_result("bbr"), worker="worker2")
+    assert not os.path.exists(output_file)
+    trial_queue.finish(first, True, *_result("cubic"), worker="worker1")
+    assert [row["congestion_control"] for row in read_results(output_file)] == ["cubic", "bbr"]
+    assert trial_queue.take("worker1")[0] == {"type": "done"}
+    assert trial_queue.failed_trials() == []
+
+
+def test_failed_trials_are_retried_after_backoff(work_dir, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(bbr_distributed.time, "time", lambda: now[0])
+    trial_queue, output_file = _trial_queue(work_dir, trial_attempts=3, retry_backoff=10)
+    _, index = trial_queue.take("worker1")
+    trial_queue.finish(index, False, None, [], "worker1", STATUS_TIMEOUT)
+    # The failed trial waits out its backoff while the other one runs.
+    assert trial_queue.take("worker1")[1] == 1
+    assert trial_queue.take("worker2")[0]["type"] == "wait"
+    now[0] += 10
+    assert trial_queue.take("worker2")[1] == 0
+    trial_queue.finish(0, False, None, [], "worker2", STATUS_FAILED)
+    # The backoff doubles on every further retry.
+    now[0] += 10
+    assert trial_queue.take("worker2")[0]["type"] == "wait"
+    now[0] += 10
+    assert trial_queue.take("worker2")[1] == 0
+    assert trial_queue.attempts == [3, 1]
+    trial_queue.finish(0, False, None, [], "worker2", STATUS_FAILED)
+    trial_queue.finish(1, True, *_result("bbr"), worker="worker1")
+    assert trial_queue.take("worker1")[0] == {"type": "done"}
+    assert trial_queue.failed_trials() == [(TRIALS[0], STATUS_FAILED)]
+    rows = read_results(output_file)
+    assert [(row["congestion_control"], row["status"]) for row in rows] == [("cubic", STATUS_FAILED),
+                                                                            ("bbr", STATUS_OK)]
+    assert trial_queue.progress.failed_trials == 1
+
+
+def test_requeued_trials_keep_their_attempts(work_dir):
+    trial_queue, _ = _trial_queue(work_dir, trial_attempts=1)
+    _, index = trial_queue.take("worker1")
+    trial_queue.requeue(index, "worker1")
+    assert trial_queue.progress.running_trials == {}
+    # The lost trial goes first, and still has its only attempt.
+    message, index = trial_queue.take("worker2")
+    assert (index, message["trial"]) == (0, TRIALS[0])
+    assert trial_queue.attempts == [1, 0]
+    trial_queue.finish(index, True, *_result("cubic"), worker="worker2")
+    # Late results of the lost worker and requeues of finished trials are ignored.
+    trial_queue.requeue(index, "worker1")
+    trial_queue.finish(index, False, None, [], "worker1")
+    assert trial_queue.outcomes[0][0] and trial_queue.pending == bbr_distributed.deque([1])
+
+
+def _start_coordinator(trial_queue, worker_timeout):
+    server = bbr_distributed._CoordinatorServer(('127.0.0.1', 0),
+                                                bbr_distributed._make_handler(trial_queue, worker_timeout))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def _request_trial(server):
+    sock = socket.create_connection(server.server_address)
+    bbr_distributed.send_message(sock, {"type": "request"})
+    return sock, bbr_distributed.receive_message(sock.makefile('rb'))
+
+
+def _wait_for_pending(trial_queue, count):
+    deadline = time.time() + 10
+    while len(trial_queue.pending) != count and time.time() < deadline:
+        time.sleep(0.05)
+    return len(trial_queue.pending) == count
+
+
+def test_trials_of_lost_workers_are_requeued(work_dir):
+    trial_queue, output_file = _trial_queue(work_dir)
+    server = _start_coordinator(trial_queue, worker_timeout=0.5)
+    try:
+        silent, message = _request_trial(server)
+        assert message["id"] == 0
+        # A worker that stops sending heartbeats times out.
+        assert _wait_for_pending(trial_queue, 2)
+        silent.close()
+
+        disconnected, message = _request_trial(server)
+        assert message["id"] == 0
+        disconnected.close()
+        assert _wait_for_pending(trial_queue, 2)
+
+        worker, message = _request_trial(server)
+        rfile = worker.makefile('rb')
+        bbr_distributed.send_message(worker, {"type": "heartbeat"})
+        header, rows = _result("cubic")
+        bbr_distributed.send_message(worker, {"type": "result", "id": message["id"], "succeeded": True,
+                                              "status": STATUS_OK, "header": header, "rows": rows})
+        bbr_distributed.send_message(worker, {"type": "request"})
+        assert bbr_distributed.receive_message(rfile)["id"] == 1
+        worker.close()
+        assert _wait_for_pending(trial_queue, 1)
+        # The trials of lost workers do not use up their attempts.
+        assert trial_queue.attempts == [1, 0]
+        assert [row["congestion_control"] for row in read_results(output_file)] == ["cubic"]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main():
+    if pytest.main([__file__]) == 0:
+        debug_print("Distributed sweep tests passed")
+
+if __name__ == '__main__':
+    main()
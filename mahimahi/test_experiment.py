@@ -0,0 +1,127 @@
+#!/usr/bin/python
+
+"""
+Test code for the return path options of the driver and its reverse traffic
+"""
+import bbr_experiment
+from bbr_logging import debug_print
+from bbr_watchdog import _port_in_use
+import client
+import os
+from multiprocessing import Event
+import pytest
+from server import ReverseSender
+import socket
+import threading
+import time
+
+# Summary mm-throughput-graph prints for the downlink log of a trial with reverse traffic.
+DOWNLINK_SUMMARY = b"""Average capacity: 100.00 Mbits/s
+Average throughput: 93.20 Mbits/s (93.2% utilization)
+95th percentile per-packet queueing delay: 41 ms
+95th percentile signal delay: 187 ms
+"""
+
+
+def _use_flags(monkeypatch, args):
+    monkeypatch.setattr(bbr_experiment.Flags, "parsed_args", bbr_experiment.parse_trial_args(args))
+
+
+def _free_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(('', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def _start_reverse_sender(event):
+    port = _free_port()
+    # Reno is available to unprivileged users on every kernel.
+    sender = ReverseSender(event, b'reno', port, size=1000)
+    sender.start()
+    deadline = time.time() + 10
+    while not _port_in_use(port) and time.time() < deadline:
+        time.sleep(0.05)
+    return sender, port
+
+
+def test_parse_throughput_graph_summary():
+    assert bbr_experiment.parse_throughput_graph_summary(DOWNLINK_SUMMARY) == (100.0, 93.2, 41.0, 187.0)
+    assert bbr_experiment.parse_throughput_graph_summary(DOWNLINK_SUMMARY.decode('utf-8')) == \
+        (100.0, 93.2, 41.0, 187.0)
+
+
+def test_generate_trace_in_directory(work_dir):
+    bbr_experiment._generate_trace(0.1, 12, work_dir)
+    up, down = bbr_experiment._trace_files(12, work_dir)
+    assert sorted(os.listdir(work_dir)) == ["12Mbps.down", "12Mbps.up"]
+    with open(up, 'r') as trace:
+        # One 1500 byte packet per millisecond.
+        assert trace.read() == "".join("%d\n" % ms for ms in range(1, 101))
+    with open(down, 'r') as trace:
+        assert len(trace.readlines()) == 100
+    assert not os.path.exists(bbr_experiment._trace_files(12)[0])
+
+
+def test_emulator_command_impairs_downlink(monkeypatch):
+    _use_flags(monkeypatch, ["--headless"])
+    command = bbr_experiment._emulator_command(0.01, 100, 10, ["10Mbps.up", "10Mbps.down"], "up.log", "down.log")
+    assert "downlink" not in command
+    assert "--downlink-log=down.log" in command and "--uplink-log=up.log" in command
+
+    _use_flags(monkeypatch, ["--headless", "--downlink_loss=2"])
+    command = bbr_experiment._emulator_command(0.01, 100, 10, ["10Mbps.up", "10Mbps.down"], "up.log", "down.log")
+    index = command.index("mm-loss")
+    assert command[index:index + 6] == ["mm-loss", "uplink", "0.01", "mm-loss", "downlink", "0.02"]
+    assert float(command[command.index("mm-delay") + 1]) == 50
+
+
+def test_client_args_reverse_port(monkeypatch):
+    _use_flags(monkeypatch, [])
+    assert bbr_experiment._client_args(6000, 1000)["reverse_port"] is None
+    _use_flags(monkeypatch, ["--reverse_traffic=bulk"])
+    assert bbr_experiment._client_args(6000, 1000)["reverse_port"] == 6001
+
+
+def test_reverse_sender_sends_until_stopped():
+    event = Event()
+    sender, port = _start_reverse_sender(event)
+    receiver = socket.create_connection(('127.0.0.1', port))
+    try:
+        received = b''
+        while len(received) < 10000:
+            received += receiver.recv(10000)
+        assert received == b'x' * len(received)
+        event.set()
+        sender.join(10)
+        assert sender.exitcode == 0
+    finally:
+        event.set()
+        receiver.close()
+
+
+def test_client_receives_reverse_traffic():
+    event = Event()
+    sender, port = _start_reverse_sender(event)
+    receiver = threading.Thread(target=client.receive_reverse_traffic, args=('127.0.0.1', port, 1000))
+    receiver.daemon = True
+    receiver.start()
+    try:
+        time.sleep(0.5)
+        assert receiver.is_alive()
+    finally:
+        event.set()
+    # The client returns once the sender closes the connection.
+    receiver.join(10)
+    sender.join(10)
+    assert not receiver.is_alive()
+    assert sender.exitcode == 0
+
+
+def main():
+    if pytest.main([__file__]) == 0:
+        debug_print("Driver tests passed")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/python
+
+"""
+Test code for the live progress metrics of a sweep
+"""
+import bbr_metrics
+from bbr_logging import debug_print
+import os
+import pytest
+
+try:
+    from urllib2 import urlopen, HTTPError
+except ImportError:
+    from urllib.request import urlopen
+    from urllib.error import HTTPError
+
+
+class FakeClock(object):
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _parse_metrics(text):
+    """Return the samples of a Prometheus exposition as name{labels} -> value, and the types of the metrics."""
+    samples = {}
+    types = {}
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, metric_type = line.split(" ")
+            types[name] = metric_type
+        elif line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples, types
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = FakeClock(1000.0)
+    monkeypatch.setattr(bbr_metrics.time, "time", fake_clock)
+    return fake_clock
+
+
+def test_metrics_of_new_sweep(clock):
+    progress = bbr_metrics.SweepProgress(10)
+    clock.now += 5
+    text = progress.format_metrics()
+    assert text.endswith("\n")
+    samples, types = _parse_metrics(text)
+    assert samples == {"bbr_sweep_trials_total": 10, "bbr_sweep_trials_completed_total": 0,
+                       "bbr_sweep_trials_failed_total": 0, "bbr_sweep_trials_remaining": 10,
+                       "bbr_sweep_trials_running": 0, "bbr_sweep_trial_duration_seconds_avg": 0,
+                       "bbr_sweep_eta_seconds": 0, "bbr_sweep_elapsed_seconds": 5}
+    # Counters, and only counters, are named *_total, except for the fixed number of trials.
+    for name, metric_type in types.items():
+        assert (metric_type == "counter") == (name.endswith("_total") and name != "bbr_sweep_trials_total")
+    assert "# HELP bbr_sweep_eta_seconds Estimated time until the sweep finishes." in text.splitlines()
+
+
+def test_eta(clock):
+    progress = bbr_metrics.SweepProgress(5)
+    for succeeded, secs in [(True, 10), (False, 30)]:
+        token = progress.trial_started([("cc", "bbr")])
+        clock.now += secs
+        progress.trial_finished(token, succeeded)
+    samples, _ = _parse_metrics(progress.format_metrics())
+    assert samples["bbr_sweep_trials_completed_total"] == 2
+    assert samples["bbr_sweep_trials_failed_total"] == 1
+    assert samples["bbr_sweep_trial_duration_seconds_avg"] == 20
+    # Three trials of 20 seconds on average remain.
+    assert samples["bbr_sweep_eta_seconds"] == 60
+
+    # Two trials running on distributed workers, for 5 and 15 seconds.
+    first = progress.trial_started([("cc", "cubic"), ("loss", "1")])
+    clock.now += 10
+    progress.trial_started([("cc", "bbr"), ("loss", "1")])
+    clock.now += 5
+    samples, _ = _parse_metrics(progress.format_metrics())
+    assert samples["bbr_sweep_trials_running"] == 2
+    assert samples['bbr_sweep_current_trial_elapsed_seconds{cc="cubic",loss="1"}'] == 15
+    assert samples['bbr_sweep_current_trial_elapsed_seconds{cc="bbr",loss="1"}'] == 5
+    assert samples["bbr_sweep_eta_seconds"] == (3 * 20 - 15 - 5) / 2.0
+
+    # A trial running for longer than the average does not make the ETA negative.
+    progress.trial_abandoned(first)
+    clock.now += 100
+    samples, _ = _parse_metrics(progress.format_metrics())
+    assert samples["bbr_sweep_trials_running"] == 1
+    assert samples["bbr_sweep_eta_seconds"] == 0
+
+
+def test_live_stats(work_dir, clock):
+    live_stats_file = os.path.join(work_dir, "live_stats.json")
+    progress = bbr_metrics.SweepProgress(2, live_stats_file)
+    progress.trial_started([("cc", 'b"b\\r')])
+    assert "current_trial_throughput" not in progress.format_metrics()
+    bbr_metrics.write_live_stats(live_stats_file, {"throughput_Mbps": 9.5, "received_bytes": 123456})
+    assert bbr_metrics.read_live_stats(live_stats_file) == {"throughput_Mbps": 9.5, "received_bytes": 123456}
+    samples, types = _parse_metrics(progress.format_metrics())
+    assert samples['bbr_sweep_current_trial_throughput_mbps{cc="b\\"b\\\\r"}'] == 9.5
+    assert samples['bbr_sweep_current_trial_received_bytes{cc="b\\"b\\\\r"}'] == 123456
+    assert types["bbr_sweep_current_trial_received_bytes"] == "gauge"
+    with open(live_stats_file, 'w') as stats:
+        stats.write('{"throughput_Mbps": ')
+    assert bbr_metrics.read_live_stats(live_stats_file) is None
+    assert bbr_metrics.read_live_stats(None) is None
+
+
+def test_metrics_server():
+    progress = bbr_metrics.SweepProgress(3)
+    httpd = bbr_metrics.start_metrics_server(progress, 0)
+    try:
+        url = "http://127.0.0.1:%d" % httpd.server_port
+        response = urlopen(url + "/metrics")
+        assert response.headers["Content-Type"] == "text/plain; version=0.0.4"
+        samples, _ = _parse_metrics(response.read().decode("utf-8"))
+        assert samples["bbr_sweep_trials_total"] == 3
+        with pytest.raises(HTTPError):
+            urlopen(url + "/other")
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def main():
+    if pytest.main([__file__]) == 0:
+        debug_print("Metrics tests passed")
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,70 @@ Test code for making the figure plots
 """
 import bbr_plot
 from bbr_logging import debug_print, debug_print_verbose, debug_print_error
+import numpy as np
+
+
+class RecordingAxes(object):
+    """Axes that record what is plotted on them instead of drawing it."""
+
+    def __init__(self):
+        self.plotted = []
+        self.filled = []
+
+    def plot(self, x, y, **kwargs):
+        self.plotted.append((list(x), list(y)))
+        return []
+
+    def fill_between(self, x, low, high, **kwargs):
+        self.filled.append((list(x), list(low), list(high)))
+
+
+def test_bootstrap_single_and_empty_groups():
+    means, lows, highs = bbr_plot.bootstrap_confidence_intervals([[], [3.0], [2.0, 2.0, 2.0], []])
+    assert np.isnan(means[0]) and np.isnan(lows[0]) and np.isnan(highs[0])
+    assert np.isnan(means[3]) and np.isnan(lows[3]) and np.isnan(highs[3])
+    # A single value is its own interval, and so are identical values.
+    assert (means[1], lows[1], highs[1]) == (3.0, 3.0, 3.0)
+    assert (means[2], lows[2], highs[2]) == (2.0, 2.0, 2.0)
+    means, lows, highs = bbr_plot.bootstrap_confidence_intervals([])
+    assert len(means) == len(lows) == len(highs) == 0
+
+
+def test_bootstrap_intervals():
+    groups = [[1.0, 2.0, 3.0, 4.0], [10.0, 30.0], [5.0], [0.0, 10.0, 20.0, 30.0]]
+    means, lows, highs = bbr_plot.bootstrap_confidence_intervals(groups)
+    assert list(means) == [2.5, 20.0, 5.0, 15.0]
+    assert all(lows <= means) and all(means <= highs)
+    assert lows[0] >= 1.0 and highs[0] <= 4.0
+    assert lows[1] >= 10.0 and highs[1] <= 30.0
+    # Intervals scale with the spread of the values.
+    assert highs[3] - lows[3] > highs[0] - lows[0]
+
+
+def test_bootstrap_chunks():
+    rng = np.random.RandomState(1)
+    groups = [list(rng.uniform(0, 100, size)) for size in [3, 5, 3, 3, 5, 1, 3]]
+    means, lows, highs = bbr_plot.bootstrap_confidence_intervals(groups)
+    chunk_values = bbr_plot.BOOTSTRAP_CHUNK_VALUES
+    # Resample one group at a time.
+    bbr_plot.BOOTSTRAP_CHUNK_VALUES = 1
+    try:
+        chunked_means, chunked_lows, chunked_highs = bbr_plot.bootstrap_confidence_intervals(groups)
+    finally:
+        bbr_plot.BOOTSTRAP_CHUNK_VALUES = chunk_values
+    assert np.allclose(means, chunked_means)
+    assert np.allclose(lows, chunked_lows)
+    assert np.allclose(highs, chunked_highs)
+
+
+def test_error_band_sorted_by_loss():
+    # Points in the order of their first trial, e.g. of a sweep over loss rates within workloads.
+    value = {"loss": [1.0, 0.1, 10.0], "goodput": [50.0, 90.0, 5.0],
+             "goodput_low": [45.0, 85.0, 4.0], "goodput_high": [55.0, 95.0, 6.0]}
+    axes = RecordingAxes()
+    bbr_plot.plot_with_error_band(axes, value, 'goodput', color='b')
+    assert axes.plotted == [([0.1, 1.0, 10.0], [90.0, 50.0, 5.0])]
+    assert axes.filled == [([0.1, 1.0, 10.0], [85.0, 45.0, 4.0], [95.0, 55.0, 6.0])]
 
 
 def run_test_plot():
@@ -14,6 +78,10 @@ def run_test_plot():
 
 
 def main():
+    test_bootstrap_single_and_empty_groups()
+    test_bootstrap_intervals()
+    test_bootstrap_chunks()
+    test_error_band_sorted_by_loss()
     run_test_plot()
 
 if __name__ == '__main__':
@@ -0,0 +1,138 @@
+#!/usr/bin/python
+
+"""
+Test code for the resource accounting of the processes of a trial
+"""
+import bbr_experiment
+import bbr_resources
+from bbr_logging import debug_print
+import os
+import pytest
+import subprocess
+import sys
+
+# Burns CPU for a while, then waits to be killed.
+BUSY_PROCESS = """
+import sys
+import time
+start_time = time.time()
+while time.time() - start_time < 0.5:
+    pass
+sys.stdout.write('idle\\n')
+sys.stdout.flush()
+time.sleep(60)
+"""
+
+
+# A process named like a Mahimahi shell, with a Python child, as the client of the trial.
+SHELL_TREE = """
+import subprocess
+import sys
+with open('/proc/self/comm', 'w') as comm:
+    comm.write('mm-link (up)')
+child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+sys.stdout.write('%d\\n' % child.pid)
+sys.stdout.flush()
+child.wait()
+"""
+
+
+def _usage(cpu_secs, ctxt_switches, peak_rss_kb):
+    return {"comm": "test", "ppid": 1, "cpu_secs": cpu_secs, "ctxt_switches": ctxt_switches,
+            "nonvol_ctxt_switches": 1, "peak_rss_kb": peak_rss_kb}
+
+
+def test_parse_cpu_list():
+    assert bbr_resources.parse_cpu_list("0") == [0]
+    assert bbr_resources.parse_cpu_list("0-2,4") == [0, 1, 2, 4]
+    assert bbr_resources.parse_cpu_list(" 4, 1-2 ,2,") == [1, 2, 4]
+    assert bbr_resources.parse_cpu_list("") == []
+    with pytest.raises(ValueError):
+        bbr_resources.parse_cpu_list("0-a")
+
+
+def test_read_process_usage():
+    usage = bbr_resources.read_process_usage(os.getpid())
+    assert usage["ppid"] == os.getppid()
+    assert usage["cpu_secs"] > 0
+    assert usage["ctxt_switches"] >= usage["nonvol_ctxt_switches"] >= 0
+    assert usage["peak_rss_kb"] > 0
+    proc = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    try:
+        assert bbr_resources.read_process_usage(proc.pid)["ppid"] == os.getpid()
+    finally:
+        proc.kill()
+        proc.wait()
+    # Reaped processes are gone from /proc.
+    assert bbr_resources.read_process_usage(proc.pid) is None
+
+
+def test_process_roles():
+    assert bbr_experiment._emulator_process_role("python", True) is None
+    assert bbr_experiment._emulator_process_role("python3", False) == "client"
+    assert bbr_experiment._emulator_process_role("mm-link", False) == "emulator"
+    # The outermost process of a pooled shell is Mahimahi itself, not the driver.
+    assert bbr_experiment._pooled_shell_process_role("mm-delay", True) == "emulator"
+    assert bbr_experiment._pooled_shell_process_role("python", False) == "client"
+
+
+def test_monitor_accounts_process_tree():
+    proc = subprocess.Popen([sys.executable, "-c", SHELL_TREE], stdout=subprocess.PIPE)
+    child = int(proc.stdout.readline())
+    try:
+        # Process names are read from /proc/<pid>/stat, where they are parenthesized themselves.
+        assert bbr_resources.read_process_usage(proc.pid)["comm"] == "mm-link (up)"
+        assert bbr_resources.descendant_pids(proc.pid) == [child]
+        monitor = bbr_resources.ProcessTreeMonitor()
+        monitor.watch(proc.pid, bbr_experiment._pooled_shell_process_role)
+        monitor.sample()
+        assert dict((pid, role) for pid, (role, _) in monitor.samples.items()) == {proc.pid: "emulator",
+                                                                                   child: "client"}
+    finally:
+        proc.kill()
+        proc.wait()
+        proc.stdout.close()
+        os.kill(child, 9)
+
+
+def test_usage_by_role():
+    monitor = bbr_resources.ProcessTreeMonitor()
+    monitor.samples = {1: ("server", _usage(1.5, 10, 100)), 2: ("server", _usage(0.25, 5, 300)),
+                       3: ("reverse_sender", _usage(2.0, 7, 50))}
+    usage = monitor.usage_by_role()
+    assert len(usage) == len(bbr_resources.PROCESS_ROLES) * len(bbr_resources.USAGE_COUNTERS)
+    assert (usage["server_cpu_secs"], usage["server_ctxt_switches"], usage["server_nonvol_ctxt_switches"],
+            usage["server_peak_rss_kb"]) == (1.75, 15, 2, 300)
+    assert (usage["reverse_sender_cpu_secs"], usage["client_cpu_secs"]) == (2.0, 0)
+    monitor.baselines = {1: _usage(1.0, 4, 1000)}
+    usage = monitor.usage_by_role()
+    assert (usage["server_cpu_secs"], usage["server_ctxt_switches"], usage["server_peak_rss_kb"]) == (0.75, 11, 300)
+
+
+def test_monitor_baseline():
+    proc = subprocess.Popen([sys.executable, "-c", BUSY_PROCESS], stdout=subprocess.PIPE)
+    try:
+        proc.stdout.readline()
+        monitor = bbr_resources.ProcessTreeMonitor()
+        monitor.watch(proc.pid, lambda comm, is_root: 'emulator')
+        monitor.sample()
+        assert monitor.usage_by_role()["emulator_cpu_secs"] >= 0.3
+        # As a pooled shell, which idled before the trial.
+        monitor = bbr_resources.ProcessTreeMonitor()
+        monitor.watch(proc.pid, lambda comm, is_root: 'emulator', baseline=True)
+        monitor.sample()
+        usage = monitor.usage_by_role()
+        assert usage["emulator_cpu_secs"] < 0.1
+        assert usage["emulator_peak_rss_kb"] > 0
+    finally:
+        proc.kill()
+        proc.wait()
+        proc.stdout.close()
+
+
+def main():
+    if pytest.main([__file__]) == 0:
+        debug_print("Resource accounting tests passed")
+
+if __name__ == '__main__':
+    main()
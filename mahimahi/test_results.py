@@ -0,0 +1,101 @@
+#!/usr/bin/python
+
+"""
+Test code for reading and writing result rows
+"""
+import bbr_results
+from bbr_compare import compare_metric
+from bbr_experiment import parse_trial_args, trial_configuration
+from bbr_logging import debug_print
+import os
+import pytest
+
+FIGURE8_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "figure8.csv")
+
+# Columns of the result files written before the header row was extended.
+ORIGINAL_COLUMNS = ["congestion_control", "loss_rate", "goodput_Mbps", "rtt_ms", "bandwidth_Mbps",
+                    "specified_bw_Mbps"]
+
+
+def test_schema():
+    columns = bbr_results.RESULT_COLUMNS
+    assert len(set(columns)) == len(columns)
+    assert columns[:len(ORIGINAL_COLUMNS)] == ORIGINAL_COLUMNS
+    assert set(bbr_results.NUMERIC_COLUMNS) <= set(columns)
+    assert set(bbr_results.MISSING_COLUMN_DEFAULTS) <= set(columns)
+    assert "congestion_control" not in bbr_results.NUMERIC_COLUMNS
+    assert "status" not in bbr_results.NUMERIC_COLUMNS
+    assert bbr_results.format_header_row().split(', ') == columns
+
+
+def test_read_original_results():
+    # The committed results only have the original columns.
+    rows = bbr_results.read_results(FIGURE8_CSV)
+    assert rows
+    assert rows[0]["congestion_control"] == "cubic"
+    assert rows[0]["loss_rate"] == 1e-05
+    assert rows[0]["goodput_Mbps"] == 98.81
+    for column, default in bbr_results.MISSING_COLUMN_DEFAULTS.items():
+        assert rows[0][column] == default
+    assert rows[0]["queue"] == "infinite"
+    assert rows[0]["workload"] == "bulk"
+    assert rows[0]["status"] == ''
+    assert all(bbr_results.trial_succeeded(row) for row in rows)
+
+
+def test_original_results_match_new_rows(work_dir):
+    # A rerun of figure 8 with the driver defaults, written in the current format.
+    original_rows = bbr_results.read_results(FIGURE8_CSV)
+    output_file = os.path.join(work_dir, "figure8.csv")
+    for row in original_rows:
+        result = trial_configuration(parse_trial_args(["--cc=" + row["congestion_control"],
+                                                       "--loss=%r" % (row["loss_rate"] * 100)]))
+        result.update({"goodput_Mbps": row["goodput_Mbps"], "status": bbr_results.STATUS_OK})
+        bbr_results.append_result(output_file, result)
+    new_rows = bbr_results.read_results(output_file)
+    assert new_rows[0]["queue"] == "infinite" and new_rows[0]["workload"] == "bulk"
+    points, unmatched = compare_metric(original_rows, new_rows, "goodput_Mbps", 10.0, 0.5, 3.0)
+    assert unmatched == []
+    assert len(points) == len(original_rows)
+    assert not any(point["regressed"] for point in points)
+
+
+def test_empty_configuration_columns_read_as_defaults(work_dir):
+    # Rows of older simulator runs and failed trials left these columns empty.
+    output_file = os.path.join(work_dir, "results.csv")
+    bbr_results.append_result(output_file, {"congestion_control": "bbr", "loss_rate": 0.01, "queue": '',
+                                            "workload": '', "downlink_loss_rate": '', "reverse_traffic": ''})
+    row, = bbr_results.read_results(output_file)
+    for column, default in bbr_results.MISSING_COLUMN_DEFAULTS.items():
+        assert row[column] == default
+    assert row["queue_size"] == ''
+
+
+def test_append_and_read_results(work_dir):
+    output_file = os.path.join(work_dir, "results.csv")
+    bbr_results.append_result(output_file, {"congestion_control": "bbr", "loss_rate": 0.01,
+                                            "goodput_Mbps": 85.5, "queue": "droptail",
+                                            "status": bbr_results.STATUS_OK, "unknown_column": 1})
+    bbr_results.append_result(output_file, {"congestion_control": "cubic", "loss_rate": 0.01,
+                                            "status": bbr_results.STATUS_TIMEOUT})
+    with open(output_file, 'r') as results:
+        lines = results.read().splitlines()
+    assert len(lines) == 3
+    assert lines[0] == bbr_results.format_header_row()
+    rows = bbr_results.read_results(output_file)
+    assert rows[0]["congestion_control"] == "bbr"
+    assert rows[0]["goodput_Mbps"] == 85.5
+    assert rows[0]["queue"] == "droptail"
+    assert rows[0]["rtt_ms"] == ''
+    assert "unknown_column" not in rows[0]
+    assert bbr_results.trial_succeeded(rows[0])
+    assert rows[1]["goodput_Mbps"] == ''
+    assert not bbr_results.trial_succeeded(rows[1])
+
+
+def main():
+    if pytest.main([__file__]) == 0:
+        debug_print("Result tests passed")
+
+if __name__ == '__main__':
+    main()
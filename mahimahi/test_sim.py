@@ -0,0 +1,81 @@
+#!/usr/bin/python
+
+"""
+Test code for the discrete-event simulator of BBR and CUBIC flows
+"""
+import bbr_sim
+from bbr_compare import config_key
+from bbr_experiment import MTU_BYTES, parse_trial_args, trial_configuration
+from bbr_logging import debug_print
+from bbr_results import read_results, trial_succeeded
+import os
+import pytest
+import sys
+
+
+def _simulate(cc, loss, queue_limit_packets=None, seconds=10, seed=1):
+    opportunities = bbr_sim.constant_rate_trace(seconds, 10)
+    return bbr_sim.Simulation(cc, loss, 100, opportunities, queue_limit_packets, seed).run(seconds * 1000)
+
+
+def test_constant_rate_trace():
+    opportunities = bbr_sim.constant_rate_trace(2, 12)
+    assert len(opportunities) == 2000
+    assert sum(opportunities) == 2 * 12 * 1000 * 1000 // 8 // MTU_BYTES
+    assert max(opportunities) - min(opportunities) <= 1
+
+
+def test_load_trace(work_dir):
+    trace_file = os.path.join(work_dir, "trace")
+    with open(trace_file, 'w') as trace:
+        trace.write("1\n1\n3\n4\n")
+    assert bbr_sim.load_trace(trace_file) == [2, 0, 1, 1]
+
+
+def test_lossless_link_is_saturated():
+    for cc in ['bbr', 'cubic']:
+        measured = _simulate(cc, 0)
+        assert measured["capacity"] == 10.0
+        assert 9.5 <= measured["goodput"] <= measured["capacity"]
+
+
+def test_bbr_tolerates_loss():
+    # The point of figure 8: BBR keeps the link busy at loss rates where CUBIC collapses.
+    bbr = _simulate('bbr', 0.05)
+    cubic = _simulate('cubic', 0.05)
+    assert bbr["goodput"] > 9.0
+    assert cubic["goodput"] < 2.0
+
+
+def test_droptail_queue_bounds_delay():
+    # 50 packets drain in 60 ms at 10 Mbps, plus a tick of the simulation.
+    for cc in ['bbr', 'cubic']:
+        assert _simulate(cc, 0)["queue_delay_p95"] > 100
+        assert _simulate(cc, 0, queue_limit_packets=50)["queue_delay_p95"] <= 65
+
+
+def test_seeded_runs_repeat():
+    assert _simulate('bbr', 0.01, seed=7) == _simulate('bbr', 0.01, seed=7)
+    assert _simulate('cubic', 0.01, seed=7) == _simulate('cubic', 0.01, seed=7)
+
+
+def test_rows_line_up_with_the_driver(work_dir, monkeypatch):
+    output_file = os.path.join(work_dir, "results.csv")
+    args = ["--cc=bbr", "--loss=1", "--time=2", "--queue=droptail"]
+    monkeypatch.setattr(sys, "argv", ["bbr_sim.py", "--output_file=" + output_file, "--seed=1"] + args)
+    bbr_sim.main()
+    row, = read_results(output_file)
+    assert trial_succeeded(row)
+    configuration = trial_configuration(parse_trial_args(args))
+    # Written to the CSV file and read back, as the driver rows are.
+    driver_row = dict((column, float(value) if isinstance(value, (int, float)) else value)
+                      for column, value in configuration.items())
+    assert config_key(row) == config_key(driver_row)
+
+
+def main():
+    if pytest.main([__file__]) == 0:
+        debug_print("Simulator tests passed")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/python
+
+"""
+Test code for the time series of uplink logs
+"""
+import bbr_timeseries
+from bbr_logging import debug_print
+import numpy as np
+import os
+import pytest
+
+UPLINK_LOG = """# mahimahi mm-link [up] 12 12
+# base timestamp: 1000
+1000 # 1500
+1000 + 1500
+1010 - 1500 10
+1150 # 1500
+1150 + 1500
+1160 d 1 1500
+1199 # 1500
+1199 - 1500 49
+"""
+
+
+def test_lttb_keeps_short_series():
+    x, y = bbr_timeseries.largest_triangle_three_buckets([0, 1, 2, 3], [1.0, np.nan, 3.0, 4.0], 10)
+    assert list(x) == [0, 2, 3]
+    assert list(y) == [1.0, 3.0, 4.0]
+    x, y = bbr_timeseries.largest_triangle_three_buckets(range(100), range(100), 2)
+    assert len(x) == 100
+
+
+def test_lttb_downsamples():
+    rng = np.random.RandomState(0)
+    x = np.arange(1000)
+    y = rng.uniform(0, 1, 1000)
+    sampled_x, sampled_y = bbr_timeseries.largest_triangle_three_buckets(x, y, 50)
+    assert len(sampled_x) == len(sampled_y) == 50
+    assert sampled_x[0] == 0 and sampled_x[-1] == 999
+    assert all(np.diff(sampled_x) > 0)
+    assert all(y[sampled_x.astype(int)] == sampled_y)
+    # One point of each bucket between the first and the last point.
+    edges = np.linspace(1, 999, 49).astype(int)
+    for bucket, point in enumerate(sampled_x[1:-1]):
+        assert edges[bucket] <= point < edges[bucket + 1]
+
+
+def test_lttb_keeps_spikes():
+    y = np.zeros(1000)
+    y[437] = 100.0
+    y[812] = -50.0
+    sampled_x, sampled_y = bbr_timeseries.largest_triangle_three_buckets(np.arange(1000), y, 20)
+    assert 437 in sampled_x and 812 in sampled_x
+    assert max(sampled_y) == 100.0 and min(sampled_y) == -50.0
+
+
+def test_parse_and_bin_uplink_log(work_dir):
+    log_file = os.path.join(work_dir, "uplink_log")
+    with open(log_file, 'w') as log:
+        log.write(UPLINK_LOG)
+    uplink_log = bbr_timeseries.parse_uplink_log(log_file)
+    assert list(uplink_log.departure_ms) == [10, 199]
+    assert list(uplink_log.drop_bytes) == [1500]
+    assert uplink_log.duration_ms() == 200
+    series = bbr_timeseries.bin_uplink_log(uplink_log, bin_ms=100)
+    assert list(series["time_secs"]) == [0.0, 0.1]
+    assert np.allclose(series["throughput_Mbps"], [0.12, 0.12])
+    assert np.allclose(series["capacity_Mbps"], [0.12, 0.24])
+    assert list(series["queue_delay_ms"]) == [10.0, 49.0]
+
+
+def main():
+    if pytest.main([__file__]) == 0:
+        debug_print("Time series tests passed")
+
+if __name__ == '__main__':
+    main()
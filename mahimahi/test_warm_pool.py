@@ -0,0 +1,124 @@
+#!/usr/bin/python
+
+"""
+Test code for the warm pool of Mahimahi shells
+"""
+import bbr_warm_pool
+from bbr_logging import debug_print
+import os
+import pytest
+import sys
+import time
+
+LINK_LOG_HEADER = """# mahimahi mm-link [uplink] --once 12Mbps.up
+# init timestamp: 1000
+# base timestamp: 1000
+"""
+
+# Stands in for bbr_experiment.py --spawn_shell, with an agent that never starts a client.
+FAKE_SPAWNER = """
+import os
+import sys
+import time
+sys.path.insert(0, %r)
+from bbr_warm_pool import prepare_shell_directory, record_shell_exit, record_shell_pid, run_agent
+directory = sys.argv[-1].split('=', 1)[1]
+prepare_shell_directory(directory)
+record_shell_pid(directory, os.getpid())
+if '--hang' in sys.argv:
+    time.sleep(60)
+run_agent(directory)
+record_shell_exit(directory, 0)
+"""
+
+
+def _write_link_log(log_file, timestamps):
+    with open(log_file, 'w') as log:
+        log.write(LINK_LOG_HEADER)
+        for timestamp in timestamps:
+            log.write("%d # 1500\n" % timestamp)
+
+
+def _read_lines(log_file):
+    with open(log_file, 'r') as log:
+        return log.read().splitlines()
+
+
+def test_trim_link_log(work_dir):
+    log_file = os.path.join(work_dir, "uplink_log")
+    trimmed_file = os.path.join(work_dir, "trimmed")
+    _write_link_log(log_file, range(0, 100, 10))
+    bbr_warm_pool.trim_link_log(log_file, trimmed_file, 1020, 1050)
+    assert _read_lines(trimmed_file) == ["# mahimahi mm-link [uplink] --once 12Mbps.up", "# init timestamp: 1000",
+                                         "# base timestamp: 20", "20 # 1500", "30 # 1500", "40 # 1500", "50 # 1500"]
+
+    with open(log_file, 'w') as log:
+        log.write("# base timestamp: 1000\n10 # 1500\n")
+    with pytest.raises(ValueError):
+        bbr_warm_pool.trim_link_log(log_file, trimmed_file, 1000, 1010)
+
+
+def test_trim_link_log_bisects_events(work_dir):
+    log_file = os.path.join(work_dir, "uplink_log")
+    trimmed_file = os.path.join(work_dir, "trimmed")
+    # Several events per millisecond, as at high rates.
+    timestamps = [ms for ms in range(0, 500) for _ in range(3)]
+    _write_link_log(log_file, timestamps)
+    for start_ms, end_ms in [(1000, 1499), (1123, 1124), (1499, 2000), (900, 1000), (1600, 1700), (1200, 1100)]:
+        bbr_warm_pool.trim_link_log(log_file, trimmed_file, start_ms, end_ms)
+        expected = ["%d # 1500" % ms for ms in timestamps if start_ms - 1000 <= ms <= end_ms - 1000]
+        assert _read_lines(trimmed_file)[3:] == expected
+    # The partial last line of a shell still logging.
+    with open(log_file, 'a') as log:
+        log.write("50")
+    bbr_warm_pool.trim_link_log(log_file, trimmed_file, 1498, 2000)
+    assert _read_lines(trimmed_file)[3:] == ["498 # 1500"] * 3 + ["499 # 1500"] * 3
+
+
+def _spawner(work_dir):
+    spawner = os.path.join(work_dir, "spawner.py")
+    with open(spawner, 'w') as spawner_file:
+        spawner_file.write(FAKE_SPAWNER % os.path.dirname(os.path.abspath(__file__)))
+    return [sys.executable, spawner]
+
+
+def test_pool_releases_and_kills_shells(work_dir):
+    command = _spawner(work_dir)
+    pool = bbr_warm_pool.WarmShellPool()
+    try:
+        pool.spawn(0, command)
+        pool.spawn(1, command + ["--hang"])
+        assert 0 in pool and 1 in pool and 2 not in pool
+        released, killed = pool.directory(0), pool.directory(1)
+        assert os.path.dirname(released) == pool.root
+        assert bbr_warm_pool.wait_for_shell_pid(released, 10) is not None
+        assert bbr_warm_pool.wait_for_shell_pid(killed, 10) is not None
+        # The agent of a shell that never got a trial is told to exit.
+        pool.release(0)
+        pool.kill(1)
+        assert 0 not in pool and 1 not in pool
+        for teardown in pool.teardowns:
+            teardown.join(10)
+        assert not os.path.exists(released) and not os.path.exists(killed)
+    finally:
+        pool.close()
+    assert not os.path.exists(pool.root)
+
+
+def test_start_trial_on_exited_shell(work_dir):
+    directory = os.path.join(work_dir, "shell")
+    bbr_warm_pool.prepare_shell_directory(directory)
+    bbr_warm_pool.record_shell_exit(directory, 1)
+    start_time = time.time()
+    assert not bbr_warm_pool.start_trial(directory, "cubic", 1, {})
+    assert time.time() - start_time < 5
+    assert bbr_warm_pool.shell_exit_status(directory) == 1
+    assert bbr_warm_pool.wait_for_client_window(directory, 5) is None
+
+
+def main():
+    if pytest.main([__file__]) == 0:
+        debug_print("Warm pool tests passed")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/python
+
+"""
+Test code for the watchdog that kills and retries stuck trials
+"""
+import bbr_sweep
+import bbr_watchdog
+from bbr_experiment import parse_trial_args, trial_configuration
+from bbr_logging import debug_print
+from bbr_results import read_results, STATUS_FAILED, STATUS_OK, STATUS_TIMEOUT
+import os
+import pytest
+import socket
+import subprocess
+import sys
+import time
+
+# Driver that fails the first attempt of every trial, and hangs in the trials given --hang=1.
+FLAKY_DRIVER = """
+import os
+import sys
+import time
+sys.path.insert(0, %r)
+from bbr_results import append_result
+args = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if '=' in arg)
+attempts_file = os.path.join(%r, args['cc'])
+with open(attempts_file, 'a') as attempts:
+    attempts.write('attempt\\n')
+if args.get('hang') == '1':
+    time.sleep(60)
+with open(attempts_file, 'r') as attempts:
+    if len(attempts.readlines()) < 2:
+        sys.exit(1)
+append_result(args['output_file'], {'congestion_control': args['cc'], 'goodput_Mbps': 1.0, 'status': 'ok'})
+"""
+
+
+def test_driver_settings():
+    assert bbr_watchdog.driver_settings([]) == (60, 5050)
+    assert bbr_watchdog.driver_settings(["--headless", "--time", "30", "--port=6000", "--loss=1"]) == (30, 6000)
+    assert bbr_watchdog.driver_ports([]) == [5050]
+    assert bbr_watchdog.driver_ports(["--port=6000", "--reverse_traffic=bulk", "--headless"]) == [6000, 6001]
+    assert bbr_watchdog.trial_timeout_secs(30) == 30 * bbr_watchdog.TRIAL_TIMEOUT_FACTOR + \
+        bbr_watchdog.TRIAL_TIMEOUT_SLACK_SECS
+
+
+def test_run_with_deadline_exit_status():
+    polls = []
+    assert bbr_watchdog.run_with_deadline([sys.executable, "-c", "import sys; sys.exit(3)"], 30) == 3
+    assert bbr_watchdog.run_with_deadline([sys.executable, "-c", "import time; time.sleep(0.5)"], 30,
+                                          lambda: polls.append(1)) == 0
+    assert polls
+
+
+def test_run_with_deadline_kills_process_tree(work_dir):
+    pid_file = os.path.join(work_dir, "pid")
+    # The shell leaves a grandchild behind, as the driver does with its server and Mahimahi shells.
+    command = ["sh", "-c", "sleep 60 & echo $! > %s; wait" % pid_file]
+    start_time = time.time()
+    assert bbr_watchdog.run_with_deadline(command, 1) is bbr_watchdog.TIMED_OUT
+    assert time.time() - start_time < bbr_watchdog.KILL_GRACE_SECS
+    with open(pid_file, 'r') as pid:
+        grandchild = int(pid.read())
+    deadline = time.time() + 5
+    while bbr_watchdog._alive(grandchild) and time.time() < deadline:
+        time.sleep(0.1)
+    assert not bbr_watchdog._alive(grandchild)
+
+
+def test_kill_process_tree_ignoring_sigterm():
+    proc = subprocess.Popen([sys.executable, "-c", "import signal, sys, time\n"
+                             "signal.signal(signal.SIGTERM, signal.SIG_IGN)\n"
+                             "sys.stdout.write('ready\\n'); sys.stdout.flush()\n"
+                             "time.sleep(60)"], stdout=subprocess.PIPE)
+    proc.stdout.readline()
+    start_time = time.time()
+    bbr_watchdog.kill_process_tree(proc.pid, grace_secs=0.5)
+    proc.wait()
+    proc.stdout.close()
+    assert proc.returncode == -9
+    assert time.time() - start_time < 5
+
+
+def test_wait_for_port_release():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('', 0))
+    listener.listen(1)
+    port = listener.getsockname()[1]
+    try:
+        assert not bbr_watchdog.wait_for_port_release([port], timeout_secs=0.5)
+        # As the reverse sender of a trial listening on --port + 1.
+        assert not bbr_watchdog.wait_for_port_release([port - 1, port], timeout_secs=0.5)
+    finally:
+        listener.close()
+    assert bbr_watchdog.wait_for_port_release([port - 1, port], timeout_secs=0.5)
+
+
+def test_failure_result_records_driver_configuration():
+    row = bbr_sweep.failure_result([("cc", "bbr"), ("loss", "1")], ["--headless", "--queue=droptail", "--hang=1"],
+                                   STATUS_FAILED)
+    # The configuration columns of a successful run of the same trial, defaults included.
+    configuration = trial_configuration(parse_trial_args(["--cc=bbr", "--loss=1", "--queue=droptail"]))
+    assert row == dict(configuration, status=STATUS_FAILED)
+    assert (row["loss_rate"], row["rtt_ms"], row["queue_size"], row["workload"]) == (0.01, 100, "1bdp", "bulk")
+    assert bbr_sweep.failure_result([("cc", "unknown")], [], STATUS_FAILED) == {"status": STATUS_FAILED}
+
+
+def _run_sweep(test_dir, args):
+    driver = os.path.join(test_dir, "driver.py")
+    with open(driver, 'w') as driver_file:
+        driver_file.write(FLAKY_DRIVER % (os.path.dirname(os.path.abspath(__file__)), test_dir))
+    output_file = os.path.join(test_dir, "results.csv")
+    sweep = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bbr_sweep.py")
+    returncode = subprocess.call([sys.executable, sweep, "--driver", driver, "--output_file", output_file,
+                                  "--retry_backoff", "0"] + args)
+    return returncode, read_results(output_file)
+
+
+def test_sweep_retries_failed_trials(work_dir):
+    returncode, rows = _run_sweep(work_dir, ["--cc", "cubic", "bbr", "--trial_attempts", "2"])
+    assert returncode == 0
+    assert [(row["congestion_control"], row["status"]) for row in rows] == [("cubic", STATUS_OK),
+                                                                            ("bbr", STATUS_OK)]
+
+
+def test_sweep_records_failed_trials(work_dir):
+    returncode, rows = _run_sweep(work_dir, ["--cc", "cubic", "bbr", "--trial_attempts", "1",
+                                             "--trial_timeout", "1", "--hang=1"])
+    # Failed trials do not stop the scripts running several sweeps in a row.
+    assert returncode == 0
+    assert [(row["congestion_control"], row["status"]) for row in rows] == [("cubic", STATUS_TIMEOUT),
+                                                                            ("bbr", STATUS_TIMEOUT)]
+
+
+def test_strict_sweep_exit_status(work_dir):
+    returncode, rows = _run_sweep(work_dir, ["--cc", "cubic", "--trial_attempts", "1", "--strict"])
+    assert returncode != 0
+    assert [row["status"] for row in rows] == [STATUS_FAILED]
+    returncode, rows = _run_sweep(work_dir, ["--cc", "cubic", "--trial_attempts", "1", "--strict"])
+    assert returncode == 0
+    assert [row["status"] for row in rows] == [STATUS_FAILED, STATUS_OK]
+
+
+def main():
+    if pytest.main([__file__]) == 0:
+        debug_print("Watchdog tests passed")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+
+"""
+Test code for the flows and rpc workloads
+"""
+import bbr_workload
+from bbr_logging import debug_print
+import os
+import pytest
+import random
+import socket
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert bbr_workload.percentile(values, 50) == 50
+    assert bbr_workload.percentile(values, 99) == 99
+    assert bbr_workload.percentile(values, 100) == 100
+    assert bbr_workload.percentile(values, 0) == 1
+    assert bbr_workload.percentile([7.5], 99) == 7.5
+    assert bbr_workload.percentile([1, 2, 3], 50) == 2
+    assert bbr_workload.percentile([1, 2, 3, 4], 50) == 2
+    assert bbr_workload.percentile([], 50) is None
+
+
+def test_summarize_measurements(work_dir):
+    measurement_file = os.path.join(work_dir, "measurements")
+    with open(measurement_file, 'w') as measurements:
+        # Written in completion order, with a partial last line from a killed client.
+        for latency in [30.0, 10.0, 20.0, 40.0, 1000.0]:
+            measurements.write("%.3f 1500\n" % latency)
+        measurements.write("12.5")
+    summary = bbr_workload.summarize_measurements(measurement_file)
+    assert summary == {"completed_transfers": 5, "latency_p50_ms": 30.0,
+                       "latency_p95_ms": 1000.0, "latency_p99_ms": 1000.0}
+    open(measurement_file, 'w').close()
+    summary = bbr_workload.summarize_measurements(measurement_file)
+    assert summary == {"completed_transfers": 0, "latency_p50_ms": '',
+                       "latency_p95_ms": '', "latency_p99_ms": ''}
+
+
+def test_sample_flow_size():
+    rng = random.Random(0)
+    assert bbr_workload.sample_flow_size('fixed', 10000, rng) == 10000
+    for distribution in ['exponential', 'pareto']:
+        sizes = [bbr_workload.sample_flow_size(distribution, 10000, rng) for _ in range(20000)]
+        assert min(sizes) >= 1
+        # The heavy tailed Pareto mean converges slowly.
+        assert 7000 < sum(sizes) / float(len(sizes)) < 13000
+
+
+def test_header_and_transfer():
+    assert bbr_workload.unpack_header(bbr_workload.pack_header(100, 2 ** 20)) == (100, 2 ** 20)
+    sender, receiver = socket.socketpair()
+    try:
+        sender.sendall(bbr_workload.pack_header(3, 1))
+        bbr_workload.send_bytes(sender, 3)
+        header = bbr_workload.recv_exact(receiver, bbr_workload.HEADER_SIZE)
+        assert bbr_workload.unpack_header(header) == (3, 1)
+        assert bbr_workload.recv_exact(receiver, 3) == b'xxx'
+        sender.close()
+        assert bbr_workload.recv_exact(receiver, 1) is None
+    finally:
+        receiver.close()
+
+
+def main():
+    if pytest.main([__file__]) == 0:
+        debug_print("Workload tests passed")
+
+if __name__ == '__main__':
+    main()